@@ -0,0 +1,17 @@
+"""Offline benchmarks for crash-etl.py (see run_benchmark.py)."""
+import os, sys, importlib.util
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_crash_etl():
+    """Import crash-etl.py (whose name isn't a valid module name) as the
+    module crash_etl."""
+    if 'crash_etl' in sys.modules:
+        return sys.modules['crash_etl']
+    if REPO_DIRECTORY not in sys.path:
+        sys.path.insert(0, REPO_DIRECTORY)
+    spec = importlib.util.spec_from_file_location('crash_etl', os.path.join(REPO_DIRECTORY, 'crash-etl.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['crash_etl'] = module # So that worker processes can find its functions.
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,61 @@
+"""Compare the ways of encoding datastore_upsert payloads: the way they were
+encoded before util.payloads (json.dumps of a list of record dicts) and
+build_upsert_payload with each encoder, with and without gzip.
+
+    python -m benchmarks.payload_benchmark --rows 2000 --repeat 5
+
+The records are a transformed chunk of a synthetic yearly file, so they have
+the same fields (and roughly the same values) as real crash data.
+"""
+import argparse, json, os, time, tempfile, shutil
+
+from benchmarks import load_crash_etl
+from benchmarks.synthetic_data import write_synthetic_crash_file
+from util.payloads import build_upsert_payload, orjson
+
+def transformed_chunk(crash_etl, row_count, data_format):
+    work_dir = tempfile.mkdtemp(prefix='crash-payload-benchmark-')
+    try:
+        target = write_synthetic_crash_file(crash_etl, os.path.join(work_dir, '{}-synthetic-crashes.csv'.format(data_format)), row_count, data_format)
+        with crash_etl.CrashFile(target) as crash_file:
+            rows = next(crash_etl.chunks_of(crash_file.rows(), row_count))
+            schema_instance = crash_file.schema(context={'types_fixed': True})
+            return crash_etl.transform_chunk(rows, schema_instance, 'compiled')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def time_it(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare datastore_upsert payload encoders.")
+    parser.add_argument('--rows', type=int, default=2000, help="number of records in the payload")
+    parser.add_argument('--format', default='2018', help="'2016' or '2018' (see benchmarks.synthetic_data)")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    crash_etl = load_crash_etl()
+    block = transformed_chunk(crash_etl, args.rows, args.format)
+    entries = [(block.keys, values) for values in block.values]
+
+    cases = [('json.dumps of record dicts (before)', lambda: json.dumps({'resource_id': 'benchmark', 'method': 'upsert', 'force': True, 'records': block.records()}).encode('utf-8'))]
+    encoders = ['json'] + (['orjson'] if orjson is not None else [])
+    for encoder in encoders:
+        for compress in [False, True]:
+            cases.append(('build_upsert_payload, {}{}'.format(encoder, ', gzipped' if compress else ''),
+                lambda encoder=encoder, compress=compress: build_upsert_payload('benchmark', 'upsert', entries, encoder=encoder, compress=compress)))
+    if orjson is None:
+        print("(orjson isn't installed, so it's left out.)")
+
+    baseline = None
+    for name, function in cases:
+        seconds, payload = time_it(function, args.repeat)
+        size = len(payload)
+        baseline = baseline or seconds
+        print("{:45} {:8.1f} ms ({:5.2f}x) {:10d} bytes".format(name, seconds*1000, baseline/seconds, size))
+
+if __name__ == '__main__':
+    main()
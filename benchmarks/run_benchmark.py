@@ -0,0 +1,166 @@
+"""Benchmark the whole main() flow of crash-etl.py offline, using synthetic
+yearly files and a local stand-in for CKAN (so nothing touches the network).
+
+    python -m benchmarks.run_benchmark --rows 20000 --output results.json
+    python -m benchmarks.run_benchmark --rows 20000 --compare results.json
+
+Each case (a data format and a set of main() options) runs in its own
+process, so that its peak RSS can be measured. For every case this reports
+rows per second, peak RSS and how the time was split between extracting,
+transforming and loading. (When main() goes through pl.Pipeline, extraction
+and transformation can't be told apart, so that time shows up as
+unattributed.) The results are saved as JSON, along with the commit they
+were measured at, and --compare prints the change in throughput relative
+to an earlier results file. Like crash-etl.py, the cases don't keep a
+local mirror of the cumulative resource unless --mirror is given (in which
+case each case gets a fresh one in its own working directory, so that no
+case sees the rows that an earlier one mirrored).
+"""
+import argparse, json, os, time, tempfile, shutil, resource, subprocess, platform, multiprocessing
+
+from benchmarks import load_crash_etl, REPO_DIRECTORY
+from benchmarks.synthetic_data import write_synthetic_crash_file
+from benchmarks.standin_ckan import StandInCKAN
+
+def instrument(crash_etl, stage_seconds):
+    """Wrap the stages of the chunked pipeline to add up the time spent in each."""
+    original_chunks_of = crash_etl.chunks_of
+    def timed_chunks_of(rows, chunk_size):
+        chunks = original_chunks_of(rows, chunk_size)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                stage_seconds['extract'] += time.perf_counter() - start
+            yield chunk
+    crash_etl.chunks_of = timed_chunks_of
+
+    original_transform_chunk = crash_etl.transform_chunk
+    def timed_transform_chunk(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_transform_chunk(*args, **kwargs)
+        finally:
+            stage_seconds['transform'] += time.perf_counter() - start
+    crash_etl.transform_chunk = timed_transform_chunk
+
+    # Only count the time that the pipeline spends waiting on the loader.
+    for method_name in ['load', 'flush']:
+        original_method = getattr(crash_etl.FanOutLoader, method_name)
+        def timed_method(self, *args, _original_method=original_method, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original_method(self, *args, **kwargs)
+            finally:
+                stage_seconds['load'] += time.perf_counter() - start
+        setattr(crash_etl.FanOutLoader, method_name, timed_method)
+
+def run_case(case, target, row_count, work_dir, results):
+    """Run main() for one case (in a child process) and put the measurements in the results queue."""
+    try:
+        crash_etl = load_crash_etl()
+        os.chdir(work_dir) # main() writes uploaded.log to the current directory.
+        stage_seconds = {'extract': 0.0, 'transform': 0.0, 'load': 0.0}
+        instrument(crash_etl, stage_seconds)
+        with StandInCKAN(latency=case.get('latency', 0.0)) as ckan:
+            settings_file = os.path.join(work_dir, 'settings.json')
+            with open(settings_file, 'w') as f:
+                json.dump({'loader': {'benchmark': {'ckan_root_url': ckan.url,
+                    'package_id': ckan.package_id, 'ckan_api_key': 'benchmark-key'}}}, f)
+            crash_etl.SETTINGS_FILE = settings_file
+            options = dict(case['options'])
+            if case.get('mirror', False):
+                options['mirror'] = os.path.join(work_dir, 'cumulative-crash-mirror.sqlite')
+            start = time.perf_counter()
+            crash_etl.main(filename=target, server='benchmark', checkpoint_dir=os.path.join(work_dir, 'checkpoints'),
+                    metrics_log=os.path.join(work_dir, 'metrics.jsonl'), **options)
+            wall_seconds = time.perf_counter() - start
+            standin_stats = dict(ckan.stats)
+        results.put({'name': case['name'],
+            'rows': row_count,
+            'wall_seconds': wall_seconds,
+            'rows_per_second': row_count / wall_seconds,
+            'stage_seconds': stage_seconds,
+            'unattributed_seconds': wall_seconds - sum(stage_seconds.values()),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            'standin_ckan': standin_stats})
+    except Exception as e:
+        results.put({'name': case['name'], 'error': repr(e)})
+
+def benchmark_cases(engines, data_formats, parallel_upserts, latency, mirror=False):
+    cases = []
+    for data_format in data_formats:
+        for engine in engines:
+            options = {'engine': engine}
+            if parallel_upserts:
+                options['parallel_upserts'] = parallel_upserts
+            name = '{}-format/{}{}{}'.format(data_format, engine, '/parallel-{}'.format(parallel_upserts) if parallel_upserts else '', '/mirror' if mirror else '')
+            cases.append({'name': name, 'data_format': data_format, 'options': options, 'latency': latency, 'mirror': mirror})
+    return cases
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIRECTORY, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = {case['name']: case for case in json.load(f)['cases']}
+    for case in results['cases']:
+        before = previous.get(case['name'], {})
+        if 'rows_per_second' in case and 'rows_per_second' in before:
+            change = case['rows_per_second'] / before['rows_per_second'] - 1
+            print("{:40} {:10.0f} rows/s ({:+.1%} vs. {:.0f} rows/s)".format(case['name'], case['rows_per_second'], change, before['rows_per_second']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crash-etl.py against synthetic data and a stand-in CKAN.")
+    parser.add_argument('--rows', type=int, default=20000, help="number of rows in each synthetic yearly file")
+    parser.add_argument('--engines', nargs='+', default=['marshmallow', 'compiled'])
+    parser.add_argument('--formats', nargs='+', default=['2016', '2018'], help="'2016' (0/1 booleans) and/or '2018' (Yes/No booleans)")
+    parser.add_argument('--parallel-upserts', type=int, default=0, help="number of upsert batches to keep in flight (0 for serial upserts)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds that the stand-in CKAN takes to answer each datastore_upsert")
+    parser.add_argument('--mirror', action='store_true', help="keep a local mirror of the cumulative resource (as crash-etl.py --mirror does)")
+    parser.add_argument('--output', default=None, help="where to save the results as JSON")
+    parser.add_argument('--compare', default=None, help="an earlier results file to compare throughput to")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='crash-benchmark-')
+    try:
+        crash_etl = load_crash_etl()
+        targets = {}
+        for data_format in args.formats:
+            targets[data_format] = write_synthetic_crash_file(crash_etl,
+                    os.path.join(work_dir, '{}-synthetic-crashes.csv'.format(data_format)), args.rows, data_format)
+
+        results = {'commit': current_commit(), 'python': platform.python_version(),
+            'rows': args.rows, 'latency': args.latency, 'cases': []}
+        context = multiprocessing.get_context('fork')
+        for case in benchmark_cases(args.engines, args.formats, args.parallel_upserts, args.latency, args.mirror):
+            case_dir = tempfile.mkdtemp(dir=work_dir)
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(case, targets[case['data_format']], args.rows, case_dir, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            results['cases'].append(result)
+            if 'error' in result:
+                print("{:40} failed: {}".format(case['name'], result['error']))
+            else:
+                print("{:40} {:10.0f} rows/s, peak RSS {:7.1f} MB, extract {:.2f} s, transform {:.2f} s, load {:.2f} s, unattributed {:.2f} s".format(
+                    case['name'], result['rows_per_second'], result['peak_rss_mb'], result['stage_seconds']['extract'],
+                    result['stage_seconds']['transform'], result['stage_seconds']['load'], result['unattributed_seconds']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
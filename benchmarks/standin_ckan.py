@@ -0,0 +1,189 @@
+"""A local stand-in for the parts of the CKAN action API that crash-etl.py uses."""
+import json, gzip, threading, time, uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+class StandInCKAN(object):
+    """An HTTP server (on localhost) that answers CKAN action API calls well
+    enough for a load to run against it: it keeps track of the resources in
+    one package, accepts datastore calls (counting the upserted records and
+    bytes) and answers anything else with an empty success.
+
+    latency (in seconds) is added to every datastore_upsert, to mimic the
+    round-trip to a real server. Gzipped request bodies are accepted unless
+    accept_gzip is False (in which case they get a gzip_rejection_status
+    response, as they would from a CKAN that isn't set up to decompress
+    them). fail_next() makes the next few calls of an action fail (with a
+    409 or 5xx response, say), to test retries. With
+    keep_records=True, the datastore's fields and records are kept too
+    (in the records attribute, by resource ID), so that datastore_search
+    and datastore_delete work on them. Use it as a context manager:
+
+        with StandInCKAN(package_id) as ckan:
+            ... load to ckan.url ...
+            print(ckan.stats)"""
+    def __init__(self, package_id='benchmark-package', latency=0.0, accept_gzip=True, keep_records=False, gzip_rejection_status=400):
+        self.package_id = package_id
+        self.latency = latency
+        self.accept_gzip = accept_gzip
+        self.gzip_rejection_status = gzip_rejection_status
+        self.failures = {} # Action -> status codes to answer its next calls with
+        self.keep_records = keep_records
+        self.records = {} # Resource ID -> list of records (with keep_records=True)
+        self.fields = {} # Resource ID -> list of fields (with keep_records=True)
+        self.primary_keys = {}
+        self.lock = threading.Lock()
+        self.resources = []
+        self.stats = {'requests': {}, 'records_upserted': 0, 'bytes_received': 0, 'failures': 0, 'gzip_rejections': 0}
+        self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        standin = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with standin.lock:
+                    standin.stats['bytes_received'] += len(body)
+                if self.headers.get('Content-Encoding', None) == 'gzip':
+                    if not standin.accept_gzip:
+                        with standin.lock:
+                            standin.stats['gzip_rejections'] += 1
+                        self.send_error(standin.gzip_rejection_status)
+                        return
+                    body = gzip.decompress(body)
+                try:
+                    data = json.loads(body.decode('utf-8')) if body else {}
+                except ValueError:
+                    data = {}
+                self.respond(data)
+
+            def respond(self, data):
+                action = urlparse(self.path).path.rstrip('/').split('/')[-1]
+                status, result = standin.handle(action, data)
+                encoded = json.dumps({'success': status == 200, 'result': result}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, *args):
+                pass # Keep the benchmark output clean.
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def fail_next(self, action, status_code, count=1):
+        """Answer the next count calls of the action with the given status code."""
+        with self.lock:
+            self.failures.setdefault(action, []).extend([status_code]*count)
+
+    def handle(self, action, data):
+        with self.lock:
+            self.stats['requests'][action] = self.stats['requests'].get(action, 0) + 1
+            failures = self.failures.get(action, [])
+            status_code = failures.pop(0) if len(failures) > 0 else None
+            if status_code is not None:
+                self.stats['failures'] += 1
+        if status_code is not None:
+            return status_code, {'message': 'Failure requested by fail_next()'}
+        if action == 'package_show':
+            return 200, {'id': self.package_id, 'name': self.package_id, 'resources': list(self.resources)}
+        if action == 'resource_create':
+            resource = {'id': str(uuid.uuid4()), 'name': data.get('name', ''), 'package_id': self.package_id}
+            with self.lock:
+                self.resources.append(resource)
+            return 200, resource
+        if action == 'resource_show':
+            matches = [r for r in self.resources if r['id'] == data.get('id')]
+            return (200, matches[0]) if matches else (404, {'message': 'Not found'})
+        if action == 'resource_patch':
+            with self.lock:
+                for resource in self.resources:
+                    if resource['id'] == data.get('id'):
+                        resource.update(data)
+                        return 200, resource
+            return 404, {'message': 'Not found'}
+        if action == 'resource_delete':
+            with self.lock:
+                self.resources = [r for r in self.resources if r['id'] != data.get('id')]
+                self.records.pop(data.get('id'), None) # (Along with its datastore table)
+                self.fields.pop(data.get('id'), None)
+            return 200, None
+        if action == 'package_resource_reorder':
+            with self.lock:
+                by_id = {r['id']: r for r in self.resources}
+                self.resources = [by_id[i] for i in data.get('order', []) if i in by_id] + [r for r in self.resources if r['id'] not in data.get('order', [])]
+            return 200, {'id': self.package_id, 'order': data.get('order', [])}
+        if action == 'datastore_create':
+            resource_id = data.get('resource_id', None)
+            if resource_id is None: # CKAN creates the resource in this case.
+                resource_id = self.handle('resource_create', data.get('resource', {}))[1]['id']
+            if self.keep_records:
+                with self.lock:
+                    fields = self.fields.setdefault(resource_id, [])
+                    fields += [f for f in data.get('fields', []) if f['id'] not in [g['id'] for g in fields]]
+                    if 'primary_key' in data:
+                        self.primary_keys[resource_id] = data['primary_key']
+                    self.records.setdefault(resource_id, [])
+                self.store(resource_id, 'insert', data.get('records', []))
+            return 200, {'resource_id': resource_id, 'fields': data.get('fields', [])}
+        if action == 'datastore_upsert':
+            if self.latency > 0:
+                time.sleep(self.latency)
+            with self.lock:
+                self.stats['records_upserted'] += len(data.get('records', []))
+            if self.keep_records:
+                self.store(data.get('resource_id', None), data.get('method', 'upsert'), data.get('records', []))
+            return 200, {'resource_id': data.get('resource_id', None), 'method': data.get('method', 'upsert')}
+        if action == 'datastore_search':
+            with self.lock:
+                records = self.records.get(data.get('resource_id', None), [])
+                offset, limit = int(data.get('offset', 0)), int(data.get('limit', 100))
+                page = [dict(record, _id=k + 1) for k, record in enumerate(records[offset:offset + limit], offset)]
+                fields = [{'id': '_id', 'type': 'int'}] + self.fields.get(data.get('resource_id', None), [])
+            return 200, {'records': page, 'total': len(records), 'fields': fields}
+        if action == 'datastore_delete':
+            with self.lock:
+                if 'filters' in data and data['filters'] == {}: # This empties the table.
+                    self.records[data.get('resource_id', None)] = []
+                elif 'filters' not in data: # This drops the table.
+                    self.records.pop(data.get('resource_id', None), None)
+                    self.fields.pop(data.get('resource_id', None), None)
+            return 200, {'resource_id': data.get('resource_id', None)}
+        return 200, {}
+
+    def store(self, resource_id, method, records):
+        """Keep the upserted (or inserted) records, replacing any with the
+        same primary key (for upserts)."""
+        with self.lock:
+            stored = self.records.setdefault(resource_id, [])
+            key_fields = self.primary_keys.get(resource_id, [])
+            if method == 'insert' or len(key_fields) == 0:
+                stored += records
+                return
+            position_by_key = {tuple(r.get(k) for k in key_fields): i for i, r in enumerate(stored)}
+            for record in records:
+                key = tuple(record.get(k) for k in key_fields)
+                if key in position_by_key:
+                    stored[position_by_key[key]] = record
+                else:
+                    position_by_key[key] = len(stored)
+                    stored.append(record)
@@ -0,0 +1,47 @@
+"""Measure how long crash-etl.py takes to start up and finish trivial
+invocations (asking for help, argument errors and --dry-run header checks),
+compared to the bare interpreter and to importing the libraries that every
+invocation used to import before looking at its arguments.
+
+    python -m benchmarks.startup_benchmark --repeat 10
+
+Each invocation runs in a fresh process (with this process's environment,
+so pipeline has to be importable the same way it is for real runs), and
+the median wall time is reported.
+"""
+import argparse, os, sys, time, statistics, subprocess, tempfile, shutil
+
+from benchmarks import load_crash_etl, REPO_DIRECTORY
+from benchmarks.synthetic_data import write_synthetic_crash_file
+
+def median_milliseconds(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=REPO_DIRECTORY)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, completed.returncode
+
+def main():
+    parser = argparse.ArgumentParser(description="Time trivial invocations of crash-etl.py.")
+    parser.add_argument('--repeat', type=int, default=10, help="number of runs of each invocation")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='crash-startup-benchmark-')
+    try:
+        target = write_synthetic_crash_file(load_crash_etl(), os.path.join(work_dir, '2018-synthetic-crashes.csv'), 100, '2018')
+        script = [sys.executable, os.path.join(REPO_DIRECTORY, 'crash-etl.py')]
+        cases = [('python -c pass (the interpreter alone)', [sys.executable, '-c', 'pass']),
+            ('importing pipeline, marshmallow, ckanapi and requests', [sys.executable, '-c', 'import pipeline, marshmallow, ckanapi, requests']),
+            ('crash-etl.py --help', script + ['--help']),
+            ('crash-etl.py (no arguments)', script),
+            ('crash-etl.py --engine=unknown <file>', script + ['--engine=unknown', target]),
+            ('crash-etl.py <file> --dry-run', script + [target, '--dry-run'])]
+        for name, command in cases:
+            milliseconds, returncode = median_milliseconds(command, args.repeat)
+            print("{:55} {:8.1f} ms (exit status {})".format(name, milliseconds, returncode))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
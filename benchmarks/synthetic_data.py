@@ -0,0 +1,62 @@
+"""Generate synthetic yearly crash-data files that look like the ones PennDOT sends."""
+import csv, random
+
+from marshmallow import fields
+
+# Fields that the 2018 data dropped (and that only the older files have)
+FIELDS_DROPPED_IN_2018 = ['access_ctrl', 'adj_rdwy_seq', 'local_road']
+# Fields that showed up in the 2017 data
+EXTENDED_FIELDS = ['tot_inj_count', 'school_bus_unit']
+
+def column_names(crash_etl, data_format):
+    """Return the (lowercase) column names of a file in the given format:
+    '2016' (the old format with 0/1 booleans) or '2018' (with Yes/No
+    booleans, zero-padded codes and the extended fields)."""
+    if data_format == '2016':
+        return [name for name in crash_etl.CrashSchema().fields.keys()]
+    elif data_format == '2018':
+        return [name for name in crash_etl.ExtendedCrashSchema().fields.keys() if name not in FIELDS_DROPPED_IN_2018]
+    raise ValueError("Unknown data format '{}' (use '2016' or '2018').".format(data_format))
+
+def synthetic_value(crash_etl, name, field, data_format, row_number, year, r):
+    yes_no = (data_format == '2018')
+    if name == 'crash_crn':
+        return str(year*1000000 + row_number)
+    if name == 'crash_year':
+        return str(year)
+    if name in crash_etl.UNCONVERTED_BOOLEAN_FIELDS:
+        value = r.random() < 0.1
+        return ('Yes' if value else 'No') if yes_no else ('1' if value else '0')
+    if name in crash_etl.EXTENDED_UNCONVERTED_BOOLEAN_FIELDS:
+        return 'No' if yes_no else '0'
+    if name in ['est_hrs_closed', 'cons_zone_spd_lim']:
+        return '' if r.random() < 0.9 else '{}.0'.format(r.randint(1, 65))
+    if name in crash_etl.LENGTH_BY_FIELD:
+        value = str(r.randint(1, 10**crash_etl.LENGTH_BY_FIELD[name] - 1))
+        return value.zfill(crash_etl.LENGTH_BY_FIELD[name]) if yes_no else value
+    if name in ['dec_lat', 'dec_long']:
+        return '' if r.random() < 0.05 else '{:.4f}'.format(40.44 + r.uniform(-0.3, 0.3) if name == 'dec_lat' else -79.99 + r.uniform(-0.3, 0.3))
+    if name in ['latitude', 'longitude']:
+        return '{} {}:{}.{}'.format(r.randint(40, 80), r.randint(0, 59), r.randint(0, 59), r.randint(0, 9999))
+    if name == 'street_name':
+        return r.choice(['FORBES AVE', 'FIFTH AVE', 'BAUM BLVD', 'I 376', 'LIBERTY AVE', 'MCKNIGHT RD', ''])
+    if isinstance(field, fields.Integer):
+        return '' if r.random() < 0.2 else str(r.randint(0, 9))
+    if isinstance(field, fields.Float):
+        return '' if r.random() < 0.2 else '{:.1f}'.format(r.uniform(0, 100))
+    return '' if r.random() < 0.2 else str(r.randint(1, 99))
+
+def write_synthetic_crash_file(crash_etl, path, row_count, data_format='2018', year=None, seed=0):
+    """Write a CSV file of row_count synthetic crash records in the given
+    format (see column_names) to path."""
+    r = random.Random(seed)
+    if year is None:
+        year = int(data_format)
+    names = column_names(crash_etl, data_format)
+    schema_fields = crash_etl.ExtendedCrashSchema().fields
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([name.upper() for name in names])
+        for row_number in range(row_count):
+            writer.writerow([synthetic_value(crash_etl, name, schema_fields[name], data_format, row_number, year, r) for name in names])
+    return path
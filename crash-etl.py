@@ -16,310 +16,187 @@ and even
 > python crash-etl.py 2010-a-few-more-crashes.csv production # [ ] This is inconsistent with how clear_first is defined in the script.
 
 allowing the cumulative resource to be built up from these incremental additions.
-"""
-import os, sys, json, re, datetime
-from marshmallow import fields, pre_load, post_load
+(wprdc-etl's pipeline package has to be importable, either by installing it or by
+adding its directory to PYTHONPATH.) python crash-etl.py --help lists the options.
 
-sys.path.insert(0, '/Users/drw/WPRDC/etl-dev/wprdc-etl') # A path that we need to import code from
-import pipeline as pl
-from subprocess import call
-import time
+The pipeline libraries and the schemas are only imported once the arguments have
+been checked, so argument errors, --help and
+
+> python crash-etl.py 2019-crashes.csv production --dry-run
+
+(which checks the file's name and header and says which schema would be used and
+where the rows would go, without contacting CKAN) finish almost as soon as Python
+starts. To measure that, run
+
+> python -m benchmarks.startup_benchmark
+
+Files can also be gzipped (2018-crashes.csv.gz), bzip2ed (.bz2) or zipped; a zip
+archive with more than one CSV file in it needs --member=<name of the CSV file>.
+The year is taken from the name of the CSV file itself.
+
+To do all of that in one go (transforming the files in parallel), run
+
+> python crash-etl.py --backfill <directory of yearly files, or a quoted glob> production
+
+(adding --workers=N to limit the number of worker processes). As with single
+files, --engine=compiled makes the transforms much faster.
+
+Progress is checkpointed chunk by chunk (in the checkpoints directory, or the
+one given by --checkpoint-dir=<path>), so if a load gets interrupted, running
+the same command again with --resume picks up after the last chunk that made
+it to every resource (without clearing the yearly resource again).
+
+Package metadata (used to look up resource IDs) is cached for five minutes;
+--metadata-cache=<path> saves that cache to a file so that consecutive runs
+can share it.
+
+Adding --engine=compiled replaces marshmallow's per-row loading and dumping
+(and the type fixes) with a converter generated from the schema's field
+declarations, which transforms a file more than 20 times as fast (so that
+loads and backfills are no longer bound by per-row CPU time). To check that
+the compiled engine still matches marshmallow's output for a file (without
+uploading anything), run
+
+> python crash-etl.py 2018-crashes.csv --check-parity
+
+Similarly, to check a new file before publishing it, run
+
+> python crash-etl.py 2019-crashes.csv --validate [--report=<path for a JSON copy>]
+
+which streams the file through the schema (with no CKAN writes) and reports
+null and repeated CRASH_CRN values, unexpected values in the Yes/No fields
+(which would otherwise stop the load with a KeyError), how many values get
+zero-padded, columns missing relative to the schema and rows that fail to
+convert.
+
+--parse-workers (or --parse-workers=<number of processes>) splits a large
+(uncompressed) file into byte ranges that start at record boundaries (quoted
+fields with newlines in them are fine) and has worker processes parse and
+transform the ranges in parallel. The rows still get loaded in the original
+order, in the same chunks.
+
+--max-chunks-in-memory=<N> caps the number of 2000-row chunks that can be
+between extraction and CKAN at once (extraction waits whenever the uploads fall
+behind), and --max-memory-mb=<M> sets a memory ceiling, above which only one
+chunk at a time is let through. Either one also works with --backfill.
+
+With --delta, rows are only upserted to the cumulative resource if they are new
+or differ from what this script last published there (according to a local
+SQLite index of row hashes, which --delta-index=<path> can relocate, or, with
+--mirror, according to the mirror's hashes).
 
-import ckanapi
+With --mirror, everything published to the cumulative resource is also kept in
+a local SQLite mirror (cumulative-crash-mirror-<server>.sqlite, or the file
+given by --mirror=<path>), with a column for each field, indexed by CRASH_YEAR
+and keyed by CRASH_CRN. (This is off by default, since writing every row to it
+takes several times as long as transforming the rows with the compiled
+engine.) To see what changed (e.g., in 2016) or to rebuild the cumulative
+resource from it, run
+
+> python crash-etl.py --mirror-changes production --year=2016 --since=2019-01-31
+> python crash-etl.py --republish-from-mirror production [--year=2016]
+
+When the yearly resource already exists, --replace loads the file into a fresh
+"<resource name> (staging)" resource with plain inserts (no clearing, and no
+key lookups) and then swaps that in for the yearly resource, so the public data
+is never half-loaded (and a bad file never touches it). The swapped-in resource
+takes the yearly resource's name, description and position in the package, but
+NOT its resource ID: the new ID gets printed, and anything that refers to the
+yearly resource by ID (links, other scripts, or the resource ID argument of a
+later run) has to be updated. Runs that name no resource ID find the yearly
+resource by name, so they're unaffected. (Since inserting the same CRASH_CRN
+twice would fail, --replace also collapses repeated CRNs, as below.)
+
+--collapse-duplicates first reads through the file's CRASH_CRN column to find
+the CRNs that show up more than once and then only loads the last version of
+each of them (the version that would have ended up in CKAN anyway), reporting
+how many rows were dropped. This works with --backfill too, where a CRN that a
+later file for the same year (like 2010-a-few-more-crashes.csv) repeats is
+only loaded from that later file.
+
+--parallel-upserts (or --parallel-upserts=<number of batches in flight>) sends
+upserts without waiting for each previous one to finish, adjusting the batch
+size to how quickly CKAN responds and retrying (with back-off) on 409 and 5xx
+responses. Since batches in flight at the same time can finish in any order,
+more than one batch in flight also collapses repeated CRNs (as above), so that
+the last version of each row is still the one that ends up in CKAN.
+
+Upserts sent that way are encoded by util.payloads (with orjson, if it's
+installed, or else with the keys of each batch encoded just once; pick one with
+--json-encoder=orjson or --json-encoder=json) and streamed to CKAN a few hundred
+records at a time. --fast-json does the same for upserts sent one at a time,
+and --gzip-upserts also gzips the requests (falling back to uncompressed ones if
+the server turns them down). To compare the encoders, run
+
+> python -m benchmarks.payload_benchmark
+
+Every run appends per-chunk timings (extract, transform and time spent waiting
+on the loads) and per-upsert measurements (rows, payload bytes, latency and
+retries) for crash_data_pipeline and cumulative_crash_data_pipeline to
+crash-etl-metrics.jsonl (or the file given by --metrics-log=<path>), ending
+with a run summary, which is also printed. --prometheus-file=<path> writes the
+run's totals as a Prometheus textfile, and --notify-summary posts the summary
+to Slack. --notify-progress posts the progress of a load (and any error that
+stops it) to Slack from a background thread, combined into digests sent at most
+once every 60 seconds (or every --notify-interval=<seconds>), so a slow or
+failing Slack never holds up (or breaks) the load.
+
+Each file is read and transformed only once; every chunk of transformed rows is
+upserted to both the yearly resource and the cumulative resource. (Calling
+main(..., fan_out=False) restores the old behavior of running a separate
+pipeline for each resource.)
+"""
+import os, json, datetime, csv, functools, glob, tempfile, shutil, collections, itertools, argparse
+import io, gzip, bz2, zipfile
+import time
 
 from parameters.local_parameters import SETTINGS_FILE, DATA_PATH
-from util.notify import send_to_slack
-
-from pprint import pprint
-from icecream import ic
-
-class CrashSchema(pl.BaseSchema): # This schema supports raw lien records
-    # (rather than synthesized liens).
-    crash_crn = fields.String(dump_to="CRASH_CRN", allow_none=False)
-    district = fields.String(dump_to="DISTRICT", allow_none=True)
-    crash_county = fields.String(dump_to="CRASH_COUNTY", allow_none=True)
-    municipality = fields.String(dump_to="MUNICIPALITY", allow_none=True)
-    police_agcy = fields.String(dump_to="POLICE_AGCY", allow_none=True)
-    crash_year = fields.Integer(dump_to="CRASH_YEAR", allow_none=True)
-    crash_month = fields.String(dump_to="CRASH_MONTH", allow_none=True)
-    day_of_week = fields.Integer(dump_to="DAY_OF_WEEK", allow_none=True)
-    time_of_day = fields.String(dump_to="TIME_OF_DAY", allow_none=True)
-    hour_of_day = fields.String(dump_to="HOUR_OF_DAY", allow_none=True)
-    illumination = fields.String(dump_to="ILLUMINATION", allow_none=True)
-    weather = fields.String(dump_to="WEATHER", allow_none=True)
-    road_condition = fields.String(dump_to="ROAD_CONDITION", allow_none=True)
-    collision_type = fields.String(dump_to="COLLISION_TYPE", allow_none=True)
-    relation_to_road = fields.String(dump_to="RELATION_TO_ROAD", allow_none=True)
-    intersect_type = fields.String(dump_to="INTERSECT_TYPE", allow_none=True)
-    tcd_type = fields.String(dump_to="TCD_TYPE", allow_none=True)
-    urban_rural = fields.String(dump_to="URBAN_RURAL", allow_none=True)
-    location_type = fields.String(dump_to="LOCATION_TYPE", allow_none=True)
-    sch_bus_ind = fields.String(dump_to="SCH_BUS_IND", allow_none=True)
-    sch_zone_ind = fields.String(dump_to="SCH_ZONE_IND", allow_none=True)
-    total_units = fields.Integer(dump_to="TOTAL_UNITS", allow_none=True)
-    person_count = fields.Integer(dump_to="PERSON_COUNT", allow_none=True)
-    vehicle_count = fields.Integer(dump_to="VEHICLE_COUNT", allow_none=True)
-    automobile_count = fields.Integer(dump_to="AUTOMOBILE_COUNT", allow_none=True)
-    motorcycle_count = fields.Integer(dump_to="MOTORCYCLE_COUNT", allow_none=True)
-    bus_count = fields.Integer(dump_to="BUS_COUNT", allow_none=True)
-    small_truck_count = fields.Integer(dump_to="SMALL_TRUCK_COUNT", allow_none=True)
-    heavy_truck_count = fields.Integer(dump_to="HEAVY_TRUCK_COUNT", allow_none=True)
-    suv_count = fields.Integer(dump_to="SUV_COUNT", allow_none=True)
-    van_count = fields.Integer(dump_to="VAN_COUNT", allow_none=True)
-    bicycle_count = fields.Integer(dump_to="BICYCLE_COUNT", allow_none=True)
-    fatal_count = fields.Integer(dump_to="FATAL_COUNT", allow_none=True)
-    injury_count = fields.Integer(dump_to="INJURY_COUNT", allow_none=True)
-    maj_inj_count = fields.Integer(dump_to="MAJ_INJ_COUNT", allow_none=True)
-    mod_inj_count = fields.Integer(dump_to="MOD_INJ_COUNT", allow_none=True)
-    min_inj_count = fields.Integer(dump_to="MIN_INJ_COUNT", allow_none=True)
-    unk_inj_deg_count = fields.Integer(dump_to="UNK_INJ_DEG_COUNT", allow_none=True)
-    unk_inj_per_count = fields.Integer(dump_to="UNK_INJ_PER_COUNT", allow_none=True)
-    unbelted_occ_count = fields.Integer(dump_to="UNBELTED_OCC_COUNT", allow_none=True)
-    unb_death_count = fields.Integer(dump_to="UNB_DEATH_COUNT", allow_none=True)
-    unb_maj_inj_count = fields.Integer(dump_to="UNB_MAJ_INJ_COUNT", allow_none=True)
-    belted_death_count = fields.Integer(dump_to="BELTED_DEATH_COUNT", allow_none=True)
-    belted_maj_inj_count = fields.Integer(dump_to="BELTED_MAJ_INJ_COUNT", allow_none=True)
-    mcycle_death_count = fields.Integer(dump_to="MCYCLE_DEATH_COUNT", allow_none=True)
-    mcycle_maj_inj_count = fields.Integer(dump_to="MCYCLE_MAJ_INJ_COUNT", allow_none=True)
-    bicycle_death_count = fields.Integer(dump_to="BICYCLE_DEATH_COUNT", allow_none=True)
-    bicycle_maj_inj_count = fields.Integer(dump_to="BICYCLE_MAJ_INJ_COUNT", allow_none=True)
-    ped_count = fields.Integer(dump_to="PED_COUNT", allow_none=True)
-    ped_death_count = fields.Integer(dump_to="PED_DEATH_COUNT", allow_none=True)
-    ped_maj_inj_count = fields.Integer(dump_to="PED_MAJ_INJ_COUNT", allow_none=True)
-    comm_veh_count = fields.Integer(dump_to="COMM_VEH_COUNT", allow_none=True)
-    max_severity_level = fields.Integer(dump_to="MAX_SEVERITY_LEVEL", allow_none=True)
-    driver_count_16yr = fields.Integer(dump_to="DRIVER_COUNT_16YR", allow_none=True)
-    driver_count_17yr = fields.Integer(dump_to="DRIVER_COUNT_17YR", allow_none=True)
-    driver_count_18yr = fields.Integer(dump_to="DRIVER_COUNT_18YR", allow_none=True)
-    driver_count_19yr = fields.Integer(dump_to="DRIVER_COUNT_19YR", allow_none=True)
-    driver_count_20yr = fields.Integer(dump_to="DRIVER_COUNT_20YR", allow_none=True)
-    driver_count_50_64yr = fields.Integer(dump_to="DRIVER_COUNT_50_64YR", allow_none=True)
-    driver_count_65_74yr = fields.Integer(dump_to="DRIVER_COUNT_65_74YR", allow_none=True)
-    driver_count_75plus = fields.Integer(dump_to="DRIVER_COUNT_75PLUS", allow_none=True)
-    latitude = fields.String(dump_to="LATITUDE", allow_none=True)
-    longitude = fields.String(dump_to="LONGITUDE", allow_none=True)
-    dec_lat = fields.Float(dump_to="DEC_LAT", allow_none=True)
-    dec_long = fields.Float(dump_to="DEC_LONG", allow_none=True)
-    est_hrs_closed = fields.Integer(dump_to="EST_HRS_CLOSED", allow_none=True)
-    lane_closed = fields.Integer(dump_to="LANE_CLOSED", allow_none=True)
-    ln_close_dir = fields.String(dump_to="LN_CLOSE_DIR", allow_none=True)
-    ntfy_hiwy_maint = fields.String(dump_to="NTFY_HIWY_MAINT", allow_none=True)
-    rdwy_surf_type_cd = fields.String(dump_to="RDWY_SURF_TYPE_CD", allow_none=True)
-    spec_juris_cd = fields.String(dump_to="SPEC_JURIS_CD", allow_none=True)
-    tcd_func_cd = fields.String(dump_to="TCD_FUNC_CD", allow_none=True)
-    tfc_detour_ind = fields.String(dump_to="TFC_DETOUR_IND", allow_none=True)
-    work_zone_ind = fields.String(dump_to="WORK_ZONE_IND", allow_none=True)
-    work_zone_type = fields.String(dump_to="WORK_ZONE_TYPE", allow_none=True)
-    work_zone_loc = fields.String(dump_to="WORK_ZONE_LOC", allow_none=True)
-    cons_zone_spd_lim = fields.Integer(dump_to="CONS_ZONE_SPD_LIM", allow_none=True)
-    workers_pres = fields.String(dump_to="WORKERS_PRES", allow_none=True)
-    wz_close_detour = fields.String(dump_to="WZ_CLOSE_DETOUR", allow_none=True)
-    wz_flagger = fields.String(dump_to="WZ_FLAGGER", allow_none=True)
-    wz_law_offcr_ind = fields.String(dump_to="WZ_LAW_OFFCR_IND", allow_none=True)
-    wz_ln_closure = fields.String(dump_to="WZ_LN_CLOSURE", allow_none=True)
-    wz_moving = fields.String(dump_to="WZ_MOVING", allow_none=True)
-    wz_other = fields.String(dump_to="WZ_OTHER", allow_none=True)
-    wz_shlder_mdn = fields.String(dump_to="WZ_SHLDER_MDN", allow_none=True)
-    flag_crn = fields.String(dump_to="FLAG_CRN", allow_none=True)
-    interstate = fields.Integer(dump_to="INTERSTATE", allow_none=True)
-    state_road = fields.Integer(dump_to="STATE_ROAD", allow_none=True)
-    local_road = fields.Integer(dump_to="LOCAL_ROAD", allow_none=True)
-    local_road_only = fields.Integer(dump_to="LOCAL_ROAD_ONLY", allow_none=True)
-    turnpike = fields.Integer(dump_to="TURNPIKE", allow_none=True)
-    wet_road = fields.Integer(dump_to="WET_ROAD", allow_none=True)
-    snow_slush_road = fields.Integer(dump_to="SNOW_SLUSH_ROAD", allow_none=True)
-    icy_road = fields.Integer(dump_to="ICY_ROAD", allow_none=True)
-    sudden_deer = fields.Integer(dump_to="SUDDEN_DEER", allow_none=True)
-    shldr_related = fields.Integer(dump_to="SHLDR_RELATED", allow_none=True)
-    rear_end = fields.Integer(dump_to="REAR_END", allow_none=True)
-    ho_oppdir_sdswp = fields.Integer(dump_to="HO_OPPDIR_SDSWP", allow_none=True)
-    hit_fixed_object = fields.Integer(dump_to="HIT_FIXED_OBJECT", allow_none=True)
-    sv_run_off_rd = fields.Integer(dump_to="SV_RUN_OFF_RD", allow_none=True)
-    work_zone = fields.Integer(dump_to="WORK_ZONE", allow_none=True)
-    property_damage_only = fields.Integer(dump_to="PROPERTY_DAMAGE_ONLY", allow_none=True)
-    fatal_or_maj_inj = fields.Integer(dump_to="FATAL_OR_MAJ_INJ", allow_none=True)
-    injury = fields.Integer(dump_to="INJURY", allow_none=True)
-    fatal = fields.Integer(dump_to="FATAL", allow_none=True)
-    non_intersection = fields.Integer(dump_to="NON_INTERSECTION", allow_none=True)
-    intersection = fields.Integer(dump_to="INTERSECTION", allow_none=True)
-    signalized_int = fields.Integer(dump_to="SIGNALIZED_INT", allow_none=True)
-    stop_controlled_int = fields.Integer(dump_to="STOP_CONTROLLED_INT", allow_none=True)
-    unsignalized_int = fields.Integer(dump_to="UNSIGNALIZED_INT", allow_none=True)
-    school_bus = fields.Integer(dump_to="SCHOOL_BUS", allow_none=True)
-    school_zone = fields.Integer(dump_to="SCHOOL_ZONE", allow_none=True)
-    hit_deer = fields.Integer(dump_to="HIT_DEER", allow_none=True)
-    hit_tree_shrub = fields.Integer(dump_to="HIT_TREE_SHRUB", allow_none=True)
-    hit_embankment = fields.Integer(dump_to="HIT_EMBANKMENT", allow_none=True)
-    hit_pole = fields.Integer(dump_to="HIT_POLE", allow_none=True)
-    hit_gdrail = fields.Integer(dump_to="HIT_GDRAIL", allow_none=True)
-    hit_gdrail_end = fields.Integer(dump_to="HIT_GDRAIL_END", allow_none=True)
-    hit_barrier = fields.Integer(dump_to="HIT_BARRIER", allow_none=True)
-    hit_bridge = fields.Integer(dump_to="HIT_BRIDGE", allow_none=True)
-    overturned = fields.Integer(dump_to="OVERTURNED", allow_none=True)
-    motorcycle = fields.Integer(dump_to="MOTORCYCLE", allow_none=True)
-    bicycle = fields.Integer(dump_to="BICYCLE", allow_none=True)
-    hvy_truck_related = fields.Integer(dump_to="HVY_TRUCK_RELATED", allow_none=True)
-    vehicle_failure = fields.Integer(dump_to="VEHICLE_FAILURE", allow_none=True)
-    train_trolley = fields.Integer(dump_to="TRAIN_TROLLEY", allow_none=True)
-    phantom_vehicle = fields.Integer(dump_to="PHANTOM_VEHICLE", allow_none=True)
-    alcohol_related = fields.Integer(dump_to="ALCOHOL_RELATED", allow_none=True)
-    drinking_driver = fields.Integer(dump_to="DRINKING_DRIVER", allow_none=True)
-    underage_drnk_drv = fields.Integer(dump_to="UNDERAGE_DRNK_DRV", allow_none=True)
-    unlicensed = fields.Integer(dump_to="UNLICENSED", allow_none=True)
-    cell_phone = fields.Integer(dump_to="CELL_PHONE", allow_none=True)
-    no_clearance = fields.Integer(dump_to="NO_CLEARANCE", allow_none=True)
-    running_red_lt = fields.Integer(dump_to="RUNNING_RED_LT", allow_none=True)
-    tailgating = fields.Integer(dump_to="TAILGATING", allow_none=True)
-    cross_median = fields.Integer(dump_to="CROSS_MEDIAN", allow_none=True)
-    curve_dvr_error = fields.Integer(dump_to="CURVE_DVR_ERROR", allow_none=True)
-    limit_65mph = fields.Integer(dump_to="LIMIT_65MPH", allow_none=True)
-    speeding = fields.Integer(dump_to="SPEEDING", allow_none=True)
-    speeding_related = fields.Integer(dump_to="SPEEDING_RELATED", allow_none=True)
-    aggressive_driving = fields.Integer(dump_to="AGGRESSIVE_DRIVING", allow_none=True)
-    fatigue_asleep = fields.Integer(dump_to="FATIGUE_ASLEEP", allow_none=True)
-    driver_16yr = fields.Integer(dump_to="DRIVER_16YR", allow_none=True)
-    driver_17yr = fields.Integer(dump_to="DRIVER_17YR", allow_none=True)
-    driver_65_74yr = fields.Integer(dump_to="DRIVER_65_74YR", allow_none=True)
-    driver_75plus = fields.Integer(dump_to="DRIVER_75PLUS", allow_none=True)
-    unbelted = fields.Integer(dump_to="UNBELTED", allow_none=True)
-    pedestrian = fields.Integer(dump_to="PEDESTRIAN", allow_none=True)
-    distracted = fields.Integer(dump_to="DISTRACTED", allow_none=True)
-    curved_road = fields.Integer(dump_to="CURVED_ROAD", allow_none=True)
-    driver_18yr = fields.Integer(dump_to="DRIVER_18YR", allow_none=True)
-    driver_19yr = fields.Integer(dump_to="DRIVER_19YR", allow_none=True)
-    driver_20yr = fields.Integer(dump_to="DRIVER_20YR", allow_none=True)
-    driver_50_64yr = fields.Integer(dump_to="DRIVER_50_64YR", allow_none=True)
-    vehicle_towed = fields.Integer(dump_to="VEHICLE_TOWED", allow_none=True)
-    fire_in_vehicle = fields.Integer(dump_to="FIRE_IN_VEHICLE", allow_none=True)
-    hit_parked_vehicle = fields.Integer(dump_to="HIT_PARKED_VEHICLE", allow_none=True)
-    mc_drinking_driver = fields.Integer(dump_to="MC_DRINKING_DRIVER", allow_none=True)
-    drugged_driver = fields.Integer(dump_to="DRUGGED_DRIVER", allow_none=True)
-    injury_or_fatal = fields.Integer(dump_to="INJURY_OR_FATAL", allow_none=True)
-    comm_vehicle = fields.Integer(dump_to="COMM_VEHICLE", allow_none=True)
-    impaired_driver = fields.Integer(dump_to="IMPAIRED_DRIVER", allow_none=True)
-    deer_related = fields.Integer(dump_to="DEER_RELATED", allow_none=True)
-    drug_related = fields.Integer(dump_to="DRUG_RELATED", allow_none=True)
-    hazardous_truck = fields.Integer(dump_to="HAZARDOUS_TRUCK", allow_none=True)
-    illegal_drug_related = fields.Integer(dump_to="ILLEGAL_DRUG_RELATED", allow_none=True)
-    illumination_dark = fields.Integer(dump_to="ILLUMINATION_DARK", allow_none=True)
-    minor_injury = fields.Integer(dump_to="MINOR_INJURY", allow_none=True)
-    moderate_injury = fields.Integer(dump_to="MODERATE_INJURY", allow_none=True)
-    major_injury = fields.Integer(dump_to="MAJOR_INJURY", allow_none=True)
-    nhtsa_agg_driving = fields.Integer(dump_to="NHTSA_AGG_DRIVING", allow_none=True)
-    psp_reported = fields.Integer(dump_to="PSP_REPORTED", allow_none=True)
-    running_stop_sign = fields.Integer(dump_to="RUNNING_STOP_SIGN", allow_none=True)
-    train = fields.Integer(dump_to="TRAIN", allow_none=True)
-    trolley = fields.Integer(dump_to="TROLLEY", allow_none=True)
-    roadway_crn = fields.String(dump_to="ROADWAY_CRN", allow_none=True)
-    rdwy_seq_num = fields.Integer(dump_to="RDWY_SEQ_NUM", allow_none=True)
-    adj_rdwy_seq = fields.Integer(dump_to="ADJ_RDWY_SEQ", allow_none=True)
-    access_ctrl = fields.String(dump_to="ACCESS_CTRL", allow_none=True)
-    roadway_county = fields.String(dump_to="ROADWAY_COUNTY", allow_none=True)
-    lane_count = fields.Integer(dump_to="LANE_COUNT", allow_none=True)
-    rdwy_orient = fields.String(dump_to="RDWY_ORIENT", allow_none=True)
-    road_owner = fields.String(dump_to="ROAD_OWNER", allow_none=True)
-    route = fields.String(dump_to="ROUTE", allow_none=True)
-    speed_limit = fields.Integer(dump_to="SPEED_LIMIT", allow_none=True)
-    segment = fields.String(dump_to="SEGMENT", allow_none=True)
-    offset= fields.Integer(dump_to="OFFSET", allow_none=True)
-    street_name = fields.String(dump_to="STREET_NAME", allow_none=True)
-
-    # Never let any of the key fields have None values. It's just asking for
-    # multiplicity problems on upsert.
-
-    # [Note that since this script is taking data from CSV files, there should be no
-    # columns with None values. It should all be instances like [value], [value],, [value],...
-    # where the missing value starts as a zero-length string, which this script
-    # is then responsible for converting into something more appropriate.
-
-    # Ah, but now (2019) there can be None values since 3 columns are no longer
-    # being supported from this schema. Since these values were never None in
-    # the 2016 data (and presumably other sets), it seems OK to allow these
-    # values to be None (rather than shrinking the schema for every year that
-    # the State DOT stops publishing certain columns, it will only expand
-    # and certain values may just not be defined for certain years, as this
-    # will make analyzing the data easier for the user).
-
-    class Meta:
-        ordered = True
-
-    # From the Marshmallow documentation:
-    #   Warning: The invocation order of decorated methods of the same
-    #   type is not guaranteed. If you need to guarantee order of different
-    #   processing steps, you should put them in the same processing method.
-    @pre_load
-    def fix_types(self, data):
-        # Fixing of types is necessary since the 2016 data got typed
-        # differently.
-        if data['est_hrs_closed'] is not None:
-            data['est_hrs_closed'] = int(float(data['est_hrs_closed']))
-        if data['cons_zone_spd_lim'] is not None:
-            data['cons_zone_spd_lim'] = int(float(data['cons_zone_spd_lim']))
-
-        #    data['party_type'] = '' # If you make these values
-        #    # None instead of empty strings, CKAN somehow
-        #    # interprets each None as a different key value,
-        #    # so multiple rows will be inserted under the same
-        #    # DTD/tax year/lien description even though the
-        #    # property owner has been redacted.
-        #    data['party_name'] = ''
-        #    #data['party_first'] = '' # These need to be referred
-        #    # to by their schema names, not the name that they
-        #    # are ultimately dumped to.
-        #    #data['party_middle'] = ''
-        #    data['plaintiff'] = '' # A key field can not have value
-        #    # None or upserts will work as blind inserts.
-        #else:
-        #    data['plaintiff'] = str(data['party_name'])
-        #del data['party_type']
-        #del data['party_name']
-    # The stuff below was originally written as a separate function
-    # called avoid_null_keys, but based on the above warning, it seems
-    # better to merge it with omit_owners.
-        unconverted_boolean_fields = ['interstate', 'state_road', 'local_road_only',
-                'turnpike', 'wet_road', 'snow_slush_road', 'icy_road', 'sudden_deer',
-                'shldr_related', 'rear_end', 'ho_oppdir_sdswp', 'hit_fixed_object',
-                'sv_run_off_rd', 'work_zone', 'property_damage_only', 'fatal_or_maj_inj',
-                'injury', 'fatal', 'non_intersection', 'intersection', 'signalized_int',
-                'stop_controlled_int', 'unsignalized_int', 'school_bus', 'school_zone',
-                'hit_deer', 'hit_tree_shrub', 'hit_embankment', 'hit_pole', 'hit_gdrail',
-                'hit_gdrail_end', 'hit_barrier', 'hit_bridge', 'overturned', 'motorcycle',
-                'bicycle', 'hvy_truck_related', 'vehicle_failure', 'train_trolley',
-                'phantom_vehicle', 'alcohol_related', 'drinking_driver', 'underage_drnk_drv',
-                'unlicensed', 'cell_phone', 'no_clearance', 'running_red_lt', 'tailgating',
-                'cross_median', 'curve_dvr_error', 'limit_65mph', 'speeding',
-                'speeding_related', 'aggressive_driving', 'fatigue_asleep', 'driver_17yr',
-                'driver_65_74yr', 'driver_75plus', 'unbelted', 'pedestrian', 'distracted',
-                'curved_road', 'driver_18yr', 'driver_19yr', 'driver_20yr', 'driver_50_64yr',
-                'vehicle_towed', 'fire_in_vehicle', 'hit_parked_vehicle', 'mc_drinking_driver',
-                'drugged_driver', 'injury_or_fatal', 'comm_vehicle', 'impaired_driver',
-                'drug_related', 'hazardous_truck', 'illegal_drug_related',
-                'illumination_dark', 'minor_injury', 'moderate_injury', 'major_injury',
-                'nhtsa_agg_driving', 'psp_reported', 'running_stop_sign', 'train',
-                'trolley', 'deer_related'] # This new format first appeared in the 2018 data.
-        yes_no_to_0_1 = {'Yes': 1, 'No': 0}
-        for field in unconverted_boolean_fields:
-            if data[field] not in ['0', '1', '', None]:
-                data[field] = yes_no_to_0_1[data[field]]
-
-        # 2018 data includes leading zeros in times (e.g., 013000 for
-        # 1:30am) and other fields. In the cumulative resource, all of the
-        # previous data had these leading zeros except for 2016+2017 data;
-        # however, data for the individual years does not have these
-        # in cases like the 2015 data (and possibly all previous years).
-
-        # The processing below is a solution to standardize these records
-        # despite having lost some of the raw data (probably eaten by
-        # the old CKAN).
-        length_by_field = {'crash_county': 2, 'police_agcy': 5,
-                'crash_month': 2, 'time_of_day': 4,
-                'hour_of_day': 2, 'municipality': 5,
-                'intersect_type': 2, 'location_type': 2,
-                'route': 4, 'segment': 4}
-        for field in length_by_field.keys():
-            if data[field] is not None:
-                if len(data[field]) != length_by_field[field] and len(data[field]) != 0:
-                    data[field] = data[field].zfill(length_by_field[field])
+from util.notify import send_to_slack, BatchedNotifier
+from util.published_index import PublishedRowIndex
+from util.checkpoints import LoadCheckpoint
+from util.ckan_metadata import PackageMetadataCache
+from util.metrics import PipelineMetrics
+from util.local_mirror import PublishedDataMirror, MirrorDeltaIndex
+from util.memory_budget import ChunkBudget
+from util.row_block import RowBlock
+from util.data_quality import DataQualityReport
+from util.repeated_keys import RepeatedKeyCollapser
+
+# pipeline, marshmallow, ckanapi and requests (and the schemas and loaders,
+# which are built on them) take most of a second to import, so they only get
+# imported (by import_pipeline_modules) once a run gets past its argument
+# checks, rather than every time the script starts.
+LAZILY_IMPORTED_NAMES = ['pl', 'fields', 'ckanapi', 'requests', 'DatastoreUpserter',
+        'CrashSchema', 'ExtendedCrashSchema', 'UNCONVERTED_BOOLEAN_FIELDS',
+        'EXTENDED_UNCONVERTED_BOOLEAN_FIELDS', 'LENGTH_BY_FIELD', 'fix_types_columnar',
+        'OpenFileConnector', 'CrashDatastoreLoader', 'FanOutLoader', 'DeltaLoader']
+
+def import_pipeline_modules():
+    """Import the schemas, the loaders and the libraries they need, as
+    globals of this module (just as if they had been imported at the top)."""
+    global pl, fields, ckanapi, requests, DatastoreUpserter
+    global CrashSchema, ExtendedCrashSchema, UNCONVERTED_BOOLEAN_FIELDS, EXTENDED_UNCONVERTED_BOOLEAN_FIELDS, LENGTH_BY_FIELD, fix_types_columnar
+    global OpenFileConnector, CrashDatastoreLoader, FanOutLoader, DeltaLoader
+    import pipeline as pl
+    from marshmallow import fields
+    import ckanapi
+    import requests
+    from util.datastore import DatastoreUpserter
+    from crash_schemas import CrashSchema, ExtendedCrashSchema, UNCONVERTED_BOOLEAN_FIELDS, EXTENDED_UNCONVERTED_BOOLEAN_FIELDS, LENGTH_BY_FIELD, fix_types_columnar
+    from crash_loaders import OpenFileConnector, CrashDatastoreLoader, FanOutLoader, DeltaLoader
+
+def __getattr__(name):
+    # Code that loads this file as a module (like the benchmarks) gets the
+    # lazily imported names the first time it asks for one of them.
+    if name in LAZILY_IMPORTED_NAMES:
+        import_pipeline_modules()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+CUMULATIVE_RESOURCE_ID = "2c13021f-74a9-4289-a1e5-fe0472c89881" # The production cumulative Crash Data resource
+DEFAULT_ENGINE = 'marshmallow' # The transform engine for loads and backfills that don't pick one
+
+package_metadata = PackageMetadataCache(ttl=300) # Shared by every package_show lookup in this process
 
 # Resource Metadata
 #package_id = '626e59d2-3c0e-4575-a702-46a71e8b0f25'     # Production
@@ -330,20 +207,464 @@ class CrashSchema(pl.BaseSchema): # This schema supports raw lien records
 #the referenced settings.json file when the corresponding
 #flag below is True.
 
-class ExtendedCrashSchema(CrashSchema):
-    tot_inj_count = fields.Integer(dump_to="TOT_INJ_COUNT", allow_none=True)
-    school_bus_unit = fields.String(dump_to="SCHOOL_BUS_UNIT", allow_none=True) # This is another 0/1 boolean.
-    # Oddly, the schema makes this one a string but all the ones in CrashSchema are integers.
-    # [ ] Eventually the whole dataset should be overhauled and they can all be made proper booleans.
+def archive_member(target, member=None):
+    """Return the name of the CSV file inside a zip archive that should be
+    read (the given member, or else the only CSV file in the archive)."""
+    with zipfile.ZipFile(target) as archive:
+        names = archive.namelist()
+    if member is not None:
+        if member not in names:
+            raise ValueError("{} has no member named {}.".format(target, member))
+        return member
+    csv_names = [name for name in names if name.lower().endswith('.csv')]
+    if len(csv_names) != 1:
+        raise ValueError("Specify which file in {} to use (with --member=<name>); its CSV files are {}.".format(target, csv_names))
+    return csv_names[0]
+
+def data_file_name(target, member=None):
+    """Return the name of the file that the data is actually in (which is
+    what the year gets inferred from), e.g., 2018-crashes.csv for
+    2018-crashes.csv, 2018-crashes.csv.gz or bundle.zip (containing
+    2018-crashes.csv)."""
+    if target.lower().endswith('.zip'):
+        return os.path.basename(archive_member(target, member))
+    name = os.path.basename(target)
+    for extension in ['.gz', '.bz2']:
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+class CrashFile(object):
+    """A crash-data CSV file, opened once (with a large buffer) and with its
+    header already parsed (by the csv module, so quoted field names are
+    fine) to pick the schema (which only gets imported when the schema
+    property is first used). rows() then carries on reading from the same
+    stream, and rewound() hands the stream to pl.Pipeline (through
+    OpenFileConnector), so the file never has to be opened again.
+
+    Gzipped (.gz), bzip2ed (.bz2) and zipped (.zip) CSV files are
+    decompressed as they are read, without writing anything to disk. For a
+    zip archive with several CSV files in it, member picks the one to use."""
+    def __init__(self, target, encoding='utf-8-sig', buffering=1024*1024, member=None):
+        self.target = target
+        self.encoding = encoding
+        self.buffering = buffering
+        self.member = archive_member(target, member) if target.lower().endswith('.zip') else None
+        self.name = data_file_name(target, self.member)
+        self.stream = self._open()
+        self.reader = csv.reader(self.stream)
+        self.header = [name.strip() for name in next(self.reader)]
+        self.fieldnames = [name.lower() for name in self.header]
+        self.schema_name = schema_name_for_header(self.header)
 
-    @pre_load
-    def fix_one_more_type(self, data):
-        unconverted_boolean_fields = ['school_bus_unit']
-        yes_no_to_0_1_character = {'Yes': '1', 'No': '0'} # This lookup is different than the one above.
-        for field in unconverted_boolean_fields:
-            if field in data and data[field] not in ['0', '1', '', None]:
-                data[field] = yes_no_to_0_1_character[data[field]]
+    @property
+    def schema(self):
+        return schema_for_header(self.header)
 
+    def _open(self):
+        lowercase_target = self.target.lower()
+        if lowercase_target.endswith('.gz'):
+            binary_stream = gzip.open(self.target, 'rb')
+        elif lowercase_target.endswith('.bz2'):
+            binary_stream = bz2.open(self.target, 'rb')
+        elif lowercase_target.endswith('.zip'):
+            archive = zipfile.ZipFile(self.target)
+            binary_stream = archive.open(self.member)
+            archive.close() # The member stays readable until it's closed.
+        else:
+            return open(self.target, 'r', encoding=self.encoding, newline='', buffering=self.buffering)
+        return io.TextIOWrapper(io.BufferedReader(binary_stream, buffer_size=self.buffering), encoding=self.encoding, newline='')
+
+    def rows(self):
+        """Yield the rows after the header as dicts (see extracted_rows)."""
+        return extracted_rows(self.reader, self.fieldnames)
+
+    def restart(self):
+        """Go back to the first row after the header, so that rows() starts over."""
+        self.reader = csv.reader(self.rewound())
+        next(self.reader)
+
+    def rewound(self):
+        """Return the stream, positioned back at the start of the file."""
+        if self.stream.closed or self.member is not None or self.target.lower().endswith(('.gz', '.bz2')):
+            # pl.Pipeline may have closed the stream, and starting over is
+            # the only cheap way to rewind a decompressing one.
+            if not self.stream.closed:
+                self.stream.close()
+            self.stream = self._open()
+        else:
+            self.stream.seek(0)
+        return self.stream
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def extracted_rows(records, fieldnames):
+    """Turn CSV records (lists of values) into dicts, in the form that
+    pl.CSVExtractor (by way of csv.DictReader) hands them to the schema:
+    with lowercased field names and None for empty values. Like
+    csv.DictReader, this skips blank lines and gives None for the fields
+    that a short record lacks."""
+    field_count = len(fieldnames)
+    for values in records:
+        if len(values) == 0:
+            continue
+        row = {name: (value if value != '' else None) for name, value in zip(fieldnames, values)}
+        if len(values) < field_count:
+            row.update((name, None) for name in fieldnames[len(values):])
+        yield row
+
+def schema_name_for_header(header):
+    # Pick schema based on the presence or absence of certain fields (that showed up in the 2017 data).
+    if 'TOT_INJ_COUNT' in header or 'SCHOOL_BUS_UNIT' in header:
+        return 'ExtendedCrashSchema'
+    return 'CrashSchema'
+
+def schema_for_header(header):
+    import_pipeline_modules()
+    return ExtendedCrashSchema if schema_name_for_header(header) == 'ExtendedCrashSchema' else CrashSchema
+
+def chunks_of(rows, chunk_size):
+    """Group an iterable of rows into lists of (at most) chunk_size rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def rechunk(blocks, chunk_size):
+    """Regroup an iterable of blocks of rows (RowBlocks or lists of rows)
+    of any size into blocks of (at most) chunk_size rows, keeping them
+    compact where possible."""
+    chunk = []
+    for block in blocks:
+        start = 0
+        while start < len(block):
+            piece = block[start:start + chunk_size - len(chunk)]
+            start += len(piece)
+            chunk = chunk.extended(piece) if isinstance(chunk, RowBlock) else (piece if len(chunk) == 0 else chunk + list(piece))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def record_ranges(path, parts, block_size=1024*1024):
+    """Split a plain (uncompressed) CSV file into at most parts byte ranges
+    that each start at the beginning of a record, leaving out the header.
+
+    A newline only ends a record if it's outside of any quoted field, which
+    is the case when the number of quote characters before it is even
+    (escaped quotes come in pairs), so the file is scanned block by block,
+    counting quotes, to find the first such newline after each split point."""
+    file_size = os.path.getsize(path)
+    wanted = [0] + [file_size*k//parts for k in range(1, parts)]
+    boundaries = []
+    quote_count = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        while len(wanted) > 0:
+            block = f.read(block_size)
+            if len(block) == 0:
+                break
+            position = 0
+            while len(wanted) > 0:
+                position = max(position, wanted[0] - offset)
+                newline = block.find(b'\n', position)
+                if newline < 0:
+                    break
+                if (quote_count + block.count(b'"', 0, newline)) % 2 == 0:
+                    boundaries.append(offset + newline + 1)
+                    wanted = [w for w in wanted[1:] if w > boundaries[-1]]
+                position = newline + 1
+            quote_count += block.count(b'"')
+            offset += len(block)
+    starts = sorted(set(boundaries))
+    return [(start, end) for start, end in zip(starts, starts[1:] + [file_size]) if end > start]
+
+def transform_byte_range(path, start, end, encoding, fieldnames, schema, engine):
+    """Parse and transform the records in one byte range of a CSV file
+    (one that record_ranges() found). This is what the worker processes
+    run when a file is parsed in parallel."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+    rows = list(extracted_rows(csv.reader(io.StringIO(text, newline='')), fieldnames))
+    schema_instance = schema(context={'types_fixed': engine == 'compiled'})
+    return transform_chunk(rows, schema_instance, engine)
+
+def parallel_transformed_blocks(crash_file, schema, engine='compiled', workers=None, range_size=8*1024*1024, ranges_per_worker=2):
+    """Yield the transformed rows of a plain CSV file (in blocks, one for
+    each byte range) in their original order, having worker processes
+    parse and transform byte ranges of the
+    file (about range_size bytes each) in parallel. Only ranges_per_worker
+    ranges per worker are in flight at a time, to keep the memory use
+    bounded. (Like backfill(), this relies on the fork start method.)"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count()
+    parts = max(workers, os.path.getsize(crash_file.target) // range_size)
+    ranges = iter(record_ranges(crash_file.target, parts))
+    encoding = 'utf-8' if crash_file.encoding == 'utf-8-sig' else crash_file.encoding # Any BOM is in the header.
+    fieldnames = tuple(crash_file.fieldnames)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        def submit(byte_range):
+            return pool.submit(transform_byte_range, crash_file.target, byte_range[0], byte_range[1], encoding, fieldnames, schema, engine)
+        in_flight = collections.deque(submit(byte_range) for byte_range in itertools.islice(ranges, ranges_per_worker*workers))
+        while len(in_flight) > 0:
+            block = in_flight.popleft().result()
+            byte_range = next(ranges, None)
+            if byte_range is not None:
+                in_flight.append(submit(byte_range))
+            yield block
+
+@functools.lru_cache(maxsize=None)
+def compile_row_converter(schema, fieldnames):
+    """Generate a function that does what loading and then dumping a row
+    with the given schema class does (the type fixes, the type checking and
+    conversion for every declared field, renaming to the dump_to names),
+    but as one straight-line block of code, without marshmallow's generic
+    machinery.
+
+    Since every row of a file has the same fields, the converter is
+    compiled for the file's fieldnames (a tuple of the extracted row keys),
+    and schema fields that the file lacks are left out, just as marshmallow
+    leaves out missing fields. This returns (keys, convert), where
+    convert(row) returns a tuple of the typed values for those CKAN keys.
+
+    The pre_load fixes (see CrashSchema.fix_types) are made to each value
+    as it's read, so the rows must not have been through
+    fix_types_columnar already. convert doesn't modify the row, and it
+    raises ValueError, TypeError or KeyError on any value that marshmallow
+    (or the fixes) would reject."""
+    keys = []
+    lines = ['def convert(data):']
+    # The per-row fixes raise a KeyError if the file lacks one of these.
+    for name in ['est_hrs_closed', 'cons_zone_spd_lim'] + UNCONVERTED_BOOLEAN_FIELDS + list(LENGTH_BY_FIELD.keys()):
+        if name not in fieldnames:
+            lines.append("    raise KeyError({!r})".format(name))
+            break
+    for name, field in schema().fields.items():
+        if name not in fieldnames:
+            continue
+        i = len(keys)
+        lines.append("    c{} = data[{!r}]".format(i, name))
+        if name in ['est_hrs_closed', 'cons_zone_spd_lim']:
+            lines.append("    if c{0} is not None: c{0} = int(float(c{0}))".format(i))
+        elif name in UNCONVERTED_BOOLEAN_FIELDS:
+            lines.append("    if c{0} not in unchanged: c{0} = yes_no_to_0_1[c{0}]".format(i))
+        elif name in EXTENDED_UNCONVERTED_BOOLEAN_FIELDS:
+            lines.append("    if c{0} not in unchanged: c{0} = yes_no_to_0_1_character[c{0}]".format(i))
+        elif name in LENGTH_BY_FIELD:
+            lines.append("    if c{0}: c{0} = zfill(c{0}, {1})".format(i, LENGTH_BY_FIELD[name])) # (This leaves longer values alone.)
+        if not field.allow_none:
+            lines.append("    if c{} is None: raise ValueError('Field may not be null.')".format(i))
+        if isinstance(field, fields.String):
+            lines.append("    if c{0} is not None and not isinstance(c{0}, str): raise TypeError('Not a valid string.')".format(i))
+        elif isinstance(field, fields.Integer):
+            lines.append("    if c{0} is not None: c{0} = int(c{0})".format(i))
+        elif isinstance(field, fields.Float):
+            lines.append("    if c{0} is not None: c{0} = float(c{0})".format(i))
+        else:
+            raise ValueError("The compiled converter doesn't support {} fields (like {}).".format(type(field).__name__, name))
+        keys.append(field.dump_to or name)
+    lines.append("    return ({})".format(''.join('c{}, '.format(i) for i in range(len(keys)))))
+    namespace = {'unchanged': frozenset(['0', '1', '', None]), 'yes_no_to_0_1': {'Yes': 1, 'No': 0},
+            'yes_no_to_0_1_character': {'Yes': '1', 'No': '0'}, 'zfill': str.zfill}
+    exec(compile('\n'.join(lines), '<compiled {} converter>'.format(schema.__name__), 'exec'), namespace)
+    return tuple(keys), namespace['convert']
+
+def transform_row(row, schema_instance):
+    """Load and dump one row with the schema, as pl.Pipeline does."""
+    loaded = schema_instance.load(row)
+    if loaded.errors:
+        raise RuntimeError("There were errors in the input data: {} (passed data: {})".format(loaded.errors, row))
+    return schema_instance.dump(loaded.data).data
+
+def transform_chunk(rows, schema_instance, engine='marshmallow'):
+    """Run a chunk of extracted rows through the schema, the way
+    pl.Pipeline does for each row, returning the rows ready for upserting.
+
+    engine='compiled' (with a schema_instance created with
+    context={'types_fixed': True}) converts the rows, type fixes and
+    all, with compile_row_converter instead of marshmallow, returning them
+    as a RowBlock (which takes a fraction of the memory of a list of dicts,
+    and which the loaders can upsert without making the dicts)."""
+    if engine not in ['marshmallow', 'compiled']:
+        raise ValueError("Unknown transform engine '{}'.".format(engine))
+    if engine != 'compiled' or len(rows) == 0:
+        return [transform_row(row, schema_instance) for row in rows]
+
+    keys, convert = compile_row_converter(type(schema_instance), tuple(rows[0].keys()))
+    values = []
+    for row in rows:
+        try:
+            values.append(convert(row))
+        except (ValueError, TypeError, KeyError):
+            # Let marshmallow handle (and describe) anything out of the
+            # ordinary, once the fixes that convert makes have been made.
+            fix_types_columnar([row])
+            transformed_row = transform_row(row, schema_instance)
+            if tuple(transformed_row.keys()) != keys: # This doesn't fit in a RowBlock.
+                rest = fix_types_columnar(rows[len(values)+1:])
+                return [dict(zip(keys, v)) for v in values] + [transformed_row] + [transform_row(r, schema_instance) for r in rest]
+            values.append(tuple(transformed_row.values()))
+    return RowBlock(keys, values)
+
+def repeated_crn_collapser(crash_file):
+    """Read through the CRASH_CRN column of a CrashFile (which is then
+    restarted) and return a util.repeated_keys.RepeatedKeyCollapser that
+    knows where the last version of each repeated CRN is."""
+    collapser = RepeatedKeyCollapser('CRASH_CRN')
+    k = crash_file.fieldnames.index('crash_crn')
+    collapser.note_keys((values[k] or None) if len(values) > k else None for values in crash_file.reader if len(values) > 0) # (rows() skips blank lines.)
+    collapser.finish_noting()
+    crash_file.restart()
+    return collapser
+
+def run_chunked_pipeline(crash_file, schema, loader, chunk_size=2000, engine='compiled', start_from_chunk=0, metrics=None, metrics_label='crash_data_pipeline', parse_workers=None, budget=None, collapser=None, notifier=None):
+    """Extract, transform, and load a CrashFile chunk by chunk,
+    without going through pl.Pipeline. This is what makes transform
+    engines that work on whole chunks (like the compiled one) possible.
+    The first start_from_chunk chunks are skipped (without being
+    transformed). If a util.metrics.PipelineMetrics is given, the time
+    spent on each stage of each chunk is recorded to it. Returns the
+    number of rows loaded.
+
+    With parse_workers, a plain CSV file is parsed and transformed by that
+    many worker processes (see parallel_transformed_blocks), and the chunks
+    are then formed from the transformed rows, so they are numbered just
+    as they would be otherwise. (In that case, the time spent waiting on
+    the workers is counted as extract time, and skipped chunks still get
+    transformed.)
+
+    With a util.memory_budget.ChunkBudget, each chunk has to be admitted by
+    the budget before it's extracted, and it's released once the loader has
+    loaded it (so the loader has to take an on_success callback, as
+    CrashDatastoreLoader does). That caps the number of chunks in memory,
+    making extraction wait whenever the CKAN writes fall behind. (When the
+    file is parsed in parallel, each worker also holds a byte range of
+    about a chunk's size.)
+
+    With a util.repeated_keys.RepeatedKeyCollapser (see
+    repeated_crn_collapser), rows whose CRASH_CRN values show up again
+    later in the file are dropped from the transformed chunks.
+
+    If a util.notify.BatchedNotifier is given, the progress is reported to
+    it after every chunk (under the key 'progress', so each digest only
+    has the latest count)."""
+    schema_instance = schema(context={'types_fixed': engine == 'compiled'})
+    row_count = 0
+    parallel = parse_workers is not None and crash_file.member is None and not crash_file.target.lower().endswith(('.gz', '.bz2'))
+    if parallel:
+        parallel_options = {} if budget is None else {'range_size': 1024*1024, 'ranges_per_worker': 1}
+        chunks = rechunk(parallel_transformed_blocks(crash_file, schema, engine, workers=parse_workers, **parallel_options), chunk_size)
+    else:
+        chunks = chunks_of(crash_file.rows(), chunk_size)
+    chunk_index = 0
+    while True:
+        wait_started_at = time.time()
+        if budget is not None:
+            budget.acquire(on_wait=getattr(loader, 'send_pending', None))
+        extract_started_at = time.time()
+        rows = next(chunks, None)
+        if rows is None or chunk_index < start_from_chunk:
+            if budget is not None:
+                budget.release()
+            if rows is None:
+                break
+        else:
+            transform_started_at = time.time()
+            transformed_rows = rows if parallel else transform_chunk(rows, schema_instance, engine)
+            if collapser is not None:
+                transformed_rows = collapser.collapse(transformed_rows, chunk_index*chunk_size)
+            load_started_at = time.time()
+            if budget is None:
+                loader.load(transformed_rows)
+            else:
+                loader.load(transformed_rows, budget.release)
+            row_count += len(rows)
+            if notifier is not None:
+                notifier.notify("{} rows of {} handed off to the loaders (through chunk {}).".format(row_count, crash_file.name, chunk_index), key='progress')
+            if metrics is not None:
+                metrics.record_chunk(metrics_label, chunk_index, len(rows),
+                        extract_seconds=transform_started_at - extract_started_at,
+                        transform_seconds=load_started_at - transform_started_at,
+                        load_wait_seconds=time.time() - load_started_at + extract_started_at - wait_started_at)
+        chunk_index += 1
+    if hasattr(loader, 'flush'):
+        loader.flush() # Wait for any upserts still in flight.
+    return row_count
+
+def check_engine_parity(crash_file, schema, chunk_size=2000):
+    """Transform a CrashFile with the compiled engine (and no CKAN writes)
+    and compare the results with what the marshmallow engine produces, key
+    order included. Returns a dict mapping the engine to the number of
+    rows that differed (or the exception it raised)."""
+    engines = ['compiled']
+    mismatches = {engine: 0 for engine in engines}
+    reference_schema = schema()
+    fast_schema = schema(context={'types_fixed': True})
+    for rows in chunks_of(crash_file.rows(), chunk_size):
+        expected = [list(r.items()) for r in transform_chunk([dict(row) for row in rows], reference_schema, 'marshmallow')]
+        for engine in engines:
+            if not isinstance(mismatches[engine], int):
+                continue
+            try:
+                got = transform_chunk([dict(row) for row in rows], fast_schema, engine)
+            except Exception as e:
+                mismatches[engine] = e
+                continue
+            mismatches[engine] += sum(1 for a, b in zip(expected, got) if a != list(b.items()))
+    return mismatches
+
+def validate_crash_file(crash_file, schema, chunk_size=2000):
+    """Run a CrashFile through the schema's checks and type conversions
+    (with no CKAN writes), chunk by chunk, and return a
+    util.data_quality.DataQualityReport of what would go wrong (or get
+    changed) in a load: null and repeated CRASH_CRN values, unexpected
+    values in the Yes/No boolean fields, values that get zero-padded,
+    columns missing relative to the schema and rows that fail to convert."""
+    schema_instance = schema(context={'types_fixed': True})
+    report = DataQualityReport(list(schema_instance.fields.keys()), crash_file.fieldnames, key_field='crash_crn',
+            boolean_fields=UNCONVERTED_BOOLEAN_FIELDS + EXTENDED_UNCONVERTED_BOOLEAN_FIELDS,
+            length_by_field=LENGTH_BY_FIELD,
+            required_fields=['est_hrs_closed', 'cons_zone_spd_lim'] + UNCONVERTED_BOOLEAN_FIELDS + list(LENGTH_BY_FIELD.keys()))
+    convert = None
+    for rows in chunks_of(crash_file.rows(), chunk_size):
+        report.add_chunk(rows) # This also blanks out the unexpected boolean values.
+        if len(report.missing_required_columns) > 0:
+            continue # The type fixes would fail on every row the same way.
+        numeric_errors = {} # Values that the type fixes would choke on, by row
+        for field in ['est_hrs_closed', 'cons_zone_spd_lim']:
+            for k, row in enumerate(rows):
+                if row[field] is not None:
+                    try:
+                        float(row[field])
+                    except ValueError:
+                        numeric_errors.setdefault(k, {})[field] = ['Not a valid number.']
+                        row[field] = None
+        if convert is None and len(rows) > 0:
+            _, convert = compile_row_converter(schema, tuple(rows[0].keys())) # This makes the type fixes too.
+        for k, row in enumerate(rows):
+            errors = dict(numeric_errors.get(k, {}))
+            try:
+                convert(row)
+            except (ValueError, TypeError, KeyError):
+                fix_types_columnar([row])
+                errors.update(schema_instance.load(row).errors)
+            if errors:
+                report.add_conversion_errors(row, errors)
+    return report
 
 def get_package_parameter(site,package_id,parameter,API_key=None):
     # Some package parameters you can fetch from the WPRDC with
@@ -359,13 +680,13 @@ def get_package_parameter(site,package_id,parameter,API_key=None):
     # 'name', 'isopen', 'url', 'notes', 'license_title',
     # 'temporal_coverage', 'related_documents', 'license_url',
     # 'organization', 'revision_id'
+    # The metadata comes from package_metadata, which caches it for a few minutes.
     try:
-        ckan = ckanapi.RemoteCKAN(site, apikey=API_key)
-        metadata = ckan.action.package_show(id=package_id)
+        metadata = package_metadata.package_show(site, package_id, API_key)
         desired_string = metadata[parameter]
         #print("The parameter {} for this package is {}".format(parameter,metadata[parameter]))
-    except:
-        raise RuntimeError("Unable to obtain package parameter '{}' for package with ID {}".format(parameter,package_id))
+    except (ckanapi.errors.CKANAPIError, requests.exceptions.RequestException, KeyError) as e:
+        raise RuntimeError("Unable to obtain package parameter '{}' for package with ID {}: {}".format(parameter,package_id,e))
     #
     return desired_string
 
@@ -375,37 +696,258 @@ def find_resource_id(site,package_id,resource_name,API_key=None):
     for r in resources:
         if r['name'] == resource_name:
             return r['id']
+    # The resource might have been created since the metadata was cached,
+    # so check again with fresh metadata before giving up.
+    package_metadata.invalidate(site, package_id)
+    for r in get_package_parameter(site,package_id,'resources',API_key):
+        if r['name'] == resource_name:
+            return r['id']
     return None
 
+def staging_resource_name(resource_name):
+    return "{} (staging)".format(resource_name)
+
+def find_resource(site, package_id, resource_id, API_key=None):
+    """Get the metadata for the resource with the given ID (which must be
+    in the given package)."""
+    resources = get_package_parameter(site,package_id,'resources',API_key)
+    for r in resources:
+        if r['id'] == resource_id:
+            return r
+    raise RuntimeError("Unable to find resource {} in package {}.".format(resource_id, package_id))
+
+def swap_in_staging_resource(site, package_id, resource_id, API_key=None):
+    """Put the staging resource for the resource with the given ID in that
+    resource's place (giving it the same name, description and position in
+    the package) and then delete the old resource. Since the staging
+    resource is already completely loaded, the public data is never missing
+    or half-loaded. Note that the resource ID changes (this script finds
+    the yearly resources by name, but anything that stored the old ID has
+    to be given the new one). Returns the new resource ID."""
+    package_metadata.invalidate(site, package_id)
+    resources = get_package_parameter(site,package_id,'resources',API_key)
+    old_resource = find_resource(site, package_id, resource_id, API_key)
+    staging_id = find_resource_id(site,package_id,staging_resource_name(old_resource['name']),API_key)
+    if staging_id is None:
+        raise RuntimeError("Unable to find the staging resource for {}.".format(old_resource['name']))
+    ckan = package_metadata.remote(site, API_key)
+    try:
+        ckan.action.resource_patch(id=staging_id, name=old_resource['name'], description=old_resource.get('description', ''))
+        order = [staging_id if r['id'] == resource_id else r['id'] for r in resources if r['id'] != staging_id]
+        ckan.action.package_resource_reorder(id=package_id, order=order)
+        ckan.action.resource_delete(id=resource_id)
+    finally:
+        package_metadata.invalidate(site, package_id)
+    print("Swapped {} in for {} as '{}', whose resource ID is now {}.".format(staging_id, resource_id, old_resource['name'], staging_id))
+    return staging_id
+
+def use_metadata_cache_file(cache_file, ttl=300):
+    """Keep the package metadata cache in cache_file, so that separate runs share it."""
+    global package_metadata
+    package_metadata = PackageMetadataCache(ttl=ttl, cache_file=cache_file)
+
+def report_delta(delta_index, log):
+    message = "Delta mode: upserted {} new or changed rows to the cumulative resource and skipped {} unchanged rows.".format(delta_index.changed_count, delta_index.skipped_count)
+    print(message)
+    log.write(message + "\n")
+    delta_index.close()
+
+def cumulative_mirror(server, kwparams, fields=None):
+    """Return the PublishedDataMirror of the cumulative resource (or None
+    if --mirror wasn't given). mirror can be True (for the default path)
+    or a path."""
+    mirror_path = kwparams.get('mirror', None)
+    if mirror_path in [None, False]:
+        return None
+    if mirror_path is True:
+        dname = os.path.dirname(os.path.abspath(__file__))
+        mirror_path = os.path.join(dname, 'cumulative-crash-mirror-{}.sqlite'.format(server))
+    return PublishedDataMirror(mirror_path, fields, key_field='CRASH_CRN', partition_field='CRASH_YEAR')
+
+def report_mirror(mirror, log):
+    message = "Mirrored {} new and {} changed rows of the cumulative resource to {} ({} rows were unchanged).".format(mirror.new_count, mirror.changed_count, mirror.path, mirror.unchanged_count)
+    print(message)
+    log.write(message + "\n")
+    mirror.close()
+
+def describe_schema(schema):
+    if schema is ExtendedCrashSchema:
+        print("Using the extended schema to accommodate extra fields for 2017 data.")
+        print("Note that though 2018 data dropped three fields (ACCESS_CTRL, ADJ_RDWY_SEQ, and LOCAL_ROAD),")
+        print("we'll just keep using the same extended schema.")
+
+def year_from_filename(fname):
+    try:
+        return int(fname[:4])
+    except ValueError:
+        raise ValueError("The first four characters of the file name have to be integers to allow the year to be extracted from the file name.")
+
+def cumulative_loader_options(server, site, kwparams, mirror=None):
+    """Return the loader class and loader keyword arguments for the
+    cumulative resource (along with the PublishedRowIndex if delta mode
+    is on, or else None). If a PublishedDataMirror is given, the loaded
+    rows are stored in it (and delta mode uses its hashes instead of a
+    PublishedRowIndex)."""
+    cumulative_kwargs = {}
+    if server == 'production':
+        cumulative_kwargs['resource_id'] = CUMULATIVE_RESOURCE_ID
+    else:
+        cumulative_kwargs['resource_name'] = 'Cumulative Crash Data'
+
+    cumulative_loader = CrashDatastoreLoader
+    delta_index = None
+    if kwparams.get('delta', False):
+        # Only upsert the rows that differ from what was last published to the cumulative resource.
+        if mirror is not None:
+            delta_index = MirrorDeltaIndex(mirror) # (This stores the upserted rows in the mirror.)
+        else:
+            dname = os.path.dirname(os.path.abspath(__file__))
+            index_path = kwparams.get('delta_index', os.path.join(dname, 'cumulative-crash-index.sqlite'))
+            delta_index = PublishedRowIndex(index_path, "{} {}".format(site, list(cumulative_kwargs.values())[0]), key_field='CRASH_CRN')
+        cumulative_loader = DeltaLoader
+        cumulative_kwargs['delta_index'] = delta_index
+    elif mirror is not None:
+        cumulative_kwargs['mirror'] = mirror
+    return cumulative_loader, cumulative_kwargs, delta_index
+
+def upsert_options(site, API_key, kwparams):
+    """Return the extra loader keyword arguments for the way upserts should be sent."""
+    upsert_kwargs = {}
+    if kwparams.get('parallel_upserts', False):
+        # Keep several upsert batches in flight, sized to how quickly CKAN responds.
+        max_in_flight = kwparams['parallel_upserts']
+        max_in_flight = 4 if max_in_flight is True else int(max_in_flight)
+        upsert_kwargs['parallel_upserts'] = dict(site=site, API_key=API_key, max_in_flight=max_in_flight)
+    elif kwparams.get('fast_json', False) or kwparams.get('gzip_upserts', False):
+        # Send the upserts one batch at a time, but with the faster payload builder.
+        upsert_kwargs['parallel_upserts'] = dict(site=site, API_key=API_key, max_in_flight=1)
+    if 'parallel_upserts' in upsert_kwargs:
+        upsert_kwargs['parallel_upserts']['encoder'] = kwparams.get('json_encoder', 'auto')
+        upsert_kwargs['parallel_upserts']['compress_requests'] = bool(kwparams.get('gzip_upserts', False))
+    return upsert_kwargs
+
+def must_collapse(kwparams, upsert_kwargs, replace=False):
+    """Return whether repeated CRNs have to be collapsed before loading:
+    inserting the same key twice (as --replace does) would fail, and when
+    several upsert batches are in flight, they can finish in any order (so
+    an earlier version of a row could win)."""
+    return (kwparams.get('collapse_duplicates', False) or replace
+            or upsert_kwargs.get('parallel_upserts', {}).get('max_in_flight', 1) > 1)
+
+def fan_out_loader_kwargs(fields_to_publish, clear_first, replace, cumulative_loader, cumulative_kwargs,
+        upsert_kwargs, checkpoint, start_from_chunk, metrics, **resource_kwargs):
+    """Return the keyword arguments for a FanOutLoader that loads to the
+    yearly resource given by resource_kwargs (resource_id or resource_name)
+    and to the cumulative resource."""
+    return dict(fields=fields_to_publish,
+            key_fields=['CRASH_CRN'],
+            clear_first=clear_first,
+            method='insert' if replace else 'upsert', # A fresh staging table needs no key lookups.
+            also_load_to=[dict(fields=fields_to_publish,
+                               key_fields=['CRASH_CRN'],
+                               clear_first=False, # This is different for the cumulative resource.
+                               method='upsert',
+                               loader_class=cumulative_loader,
+                               metrics=metrics,
+                               metrics_label='cumulative_crash_data_pipeline',
+                               **dict(cumulative_kwargs, **upsert_kwargs))],
+            checkpoint=checkpoint,
+            start_from_chunk=start_from_chunk,
+            metrics=metrics,
+            metrics_label='crash_data_pipeline',
+            **dict(resource_kwargs, **upsert_kwargs))
+
+def pipeline_metrics(description, kwparams):
+    """Return the PipelineMetrics for a run, which logs to the file given by
+    --metrics-log (crash-etl-metrics.jsonl by default) and, with
+    --prometheus-file, also writes a Prometheus textfile."""
+    dname = os.path.dirname(os.path.abspath(__file__))
+    return PipelineMetrics(description,
+            metrics_log=kwparams.get('metrics_log', os.path.join(dname, 'crash-etl-metrics.jsonl')),
+            prometheus_file=kwparams.get('prometheus_file', None))
+
+def report_metrics(metrics, log, notify=False, notifier=None):
+    metrics.close()
+    message = metrics.summary_message()
+    print(message)
+    log.write(message + "\n")
+    if notify and notifier is not None:
+        notifier.notify(message) # It goes out with the last digest.
+    elif notify:
+        try:
+            send_to_slack(message)
+        except Exception as e: # Failing to notify shouldn't make a finished load look like it failed.
+            print("Unable to send the run summary to Slack: {}".format(e))
+
+def progress_notifier(description, kwparams):
+    """Return a BatchedNotifier that posts digests of a load's progress and
+    errors to Slack (at most one every --notify-interval seconds, 60 by
+    default) if --notify-progress was given (or else None)."""
+    if not kwparams.get('notify_progress', False):
+        return None
+    return BatchedNotifier(min_interval=float(kwparams.get('notify_interval', 60)), title=description)
+
+def chunk_budget(kwparams):
+    """Return a ChunkBudget if --max-chunks-in-memory or --max-memory-mb was
+    given (or else None)."""
+    max_chunks = kwparams.get('max_chunks_in_memory', None)
+    max_memory_mb = kwparams.get('max_memory_mb', None)
+    if max_chunks is None and max_memory_mb is None:
+        return None
+    return ChunkBudget(int(max_chunks) if max_chunks is not None else 4,
+            float(max_memory_mb) if max_memory_mb is not None else None)
+
+def resume_point(checkpoint, resume):
+    """Return the index of the chunk that a load should start from (or None
+    if resuming a load that already finished). Without resume, the
+    checkpoint is reset so that this run starts over."""
+    if not resume or checkpoint.last_committed_chunk() < 0:
+        checkpoint.reset()
+        return 0
+    if checkpoint.is_complete():
+        return None
+    start_from_chunk = checkpoint.last_committed_chunk() + 1
+    print("Resuming the load of {} from chunk {}.".format(checkpoint.target, start_from_chunk))
+    return start_from_chunk
+
 def main(*args,**kwparams):
 
     target = kwparams.get('filename',None)
     if target is None:
         raise ValueError("Unable to process data without filename.")
+    import_pipeline_modules()
 
-    pathlist = target.split('/')
-    fname = pathlist[-1]
+    crash_file = CrashFile(target, member=kwparams.get('member', None)) # This is the only time the file gets opened.
+    fname = crash_file.name # For compressed files, this is the name of the CSV file inside.
 
     resource_id = kwparams.get('resource_id',None)
     if resource_id is None:
-        try:
-            year = int(fname[:4])
-        except ValueError:
-            raise ValueError("The first four characters of the file name have to be integers to allow the year to be extracted from the file name.")
+        year = year_from_filename(fname)
 
-    # Pick schema based on the presence or absence of certain fields (that showed up in the 2017 data).
-    with open(target,'r') as f:
-        headers = f.readline().strip()
+    schema = crash_file.schema
+    describe_schema(schema)
 
-    fieldnames = headers.split(',')
+    if kwparams.get('check_parity', False):
+        # Compare the faster transform engines to marshmallow without uploading anything.
+        for engine, mismatch_count in check_engine_parity(crash_file, schema).items():
+            if isinstance(mismatch_count, int):
+                print("The {} engine's output differs from marshmallow's for {} rows.".format(engine, mismatch_count))
+            else:
+                print("The {} engine failed: {}".format(engine, mismatch_count))
+        crash_file.close()
+        return
+
+    if kwparams.get('validate', False):
+        # Check the file (and write the report, if asked to) without touching CKAN.
+        report = validate_crash_file(crash_file, schema)
+        crash_file.close()
+        for line in report.describe(key_name='CRASH_CRN'):
+            print(line)
+        if kwparams.get('report', None) is not None:
+            report.write(kwparams['report'])
+            print("Wrote the data-quality report to {}.".format(kwparams['report']))
+        return report
 
-    if 'TOT_INJ_COUNT' in fieldnames or 'SCHOOL_BUS_UNIT' in fieldnames:
-        schema = ExtendedCrashSchema
-        print("Using the extended schema to accommodate extra fields for 2017 data.")
-        print("Note that though 2018 data dropped three fields (ACCESS_CTRL, ADJ_RDWY_SEQ, and LOCAL_ROAD),")
-        print("we'll just keep using the same extended schema.")
-    else:
-        schema = CrashSchema
     fields0 = schema().serialize_to_ckan_fields()
     # Eliminate fields that we don't want to upload.
     #fields0.pop(fields0.index({'type': 'text', 'id': 'party_type'}))
@@ -429,6 +971,8 @@ def main(*args,**kwparams):
     # Code below stolen from prime_ckan/*/open_a_channel() but really from utility_belt/gadgets
     #with open(os.path.dirname(os.path.abspath(__file__))+'/ckan_settings.json') as f: # The path of this file needs to be specified.
 
+    if kwparams.get('metadata_cache', None) is not None:
+        use_metadata_cache_file(kwparams['metadata_cache'])
     with open(SETTINGS_FILE) as f:
         settings = json.load(f)
     site = settings['loader'][server]['ckan_root_url']
@@ -453,6 +997,100 @@ def main(*args,**kwparams):
     time.sleep(1.0)
 
 
+    ###### Cumulative resource ###########
+    mirror = cumulative_mirror(server, kwparams, fields_to_publish)
+    cumulative_loader, cumulative_kwargs, delta_index = cumulative_loader_options(server, site, kwparams, mirror)
+    upsert_kwargs = upsert_options(site, API_key, kwparams)
+    metrics = pipeline_metrics("Crash ETL run for {}".format(target), kwparams)
+
+    # With --replace, an existing yearly resource is rebuilt by bulk-inserting
+    # the rows into a staging resource, which then takes the old resource's place.
+    replace = kwparams.get('replace', False) and resource_id is not None
+    if replace:
+        if not kwparams.get('fan_out', True):
+            raise ValueError("--replace only works with fan-out loads.")
+        replaced_resource_id = resource_id
+        resource_name = find_resource(site, package_id, resource_id, API_key)['name']
+        kwargs = {'resource_name': staging_resource_name(resource_name)}
+        clear_first = find_resource_id(site,package_id,kwargs['resource_name'],API_key) is not None # Left over from an earlier run
+        print("Loading the rows into {} before swapping it in for {}.".format(kwargs['resource_name'], resource_id))
+
+    if kwparams.get('fan_out', True):
+        # Parse and transform the file once and send each chunk to both the
+        # yearly resource and the cumulative resource. This works because
+        # ExtendedCrashSchema only adds two fields (which it skips when the
+        # file doesn't have them), so rows that went through CrashSchema
+        # are exactly what the cumulative pipeline would have produced.
+        checkpoint = LoadCheckpoint(kwparams.get('checkpoint_dir', os.path.join(dname, 'checkpoints')), target,
+                [site, list(kwargs.values())[0], list(cumulative_kwargs.values())[0]], chunk_size=2000)
+        start_from_chunk = resume_point(checkpoint, kwparams.get('resume', False))
+        if start_from_chunk is None:
+            print("{} was already completely loaded, according to {}.".format(target, checkpoint.path))
+            metrics.close()
+            return
+        if start_from_chunk > 0:
+            clear_first = False # Don't wipe out the chunks that were already loaded.
+        loader_kwargs = fan_out_loader_kwargs(fields_to_publish, clear_first, replace, cumulative_loader, cumulative_kwargs,
+                upsert_kwargs, checkpoint, start_from_chunk, metrics, **kwargs)
+        engine = kwparams.get('engine', DEFAULT_ENGINE)
+        parse_workers = kwparams.get('parse_workers', None)
+        if parse_workers is not None:
+            parse_workers = os.cpu_count() if parse_workers is True else int(parse_workers)
+        budget = chunk_budget(kwparams)
+        collapser = None
+        if must_collapse(kwparams, upsert_kwargs, replace):
+            collapser = repeated_crn_collapser(crash_file)
+        notifier = progress_notifier("Crash ETL run for {}".format(target), kwparams)
+        if engine == 'marshmallow' and len(upsert_kwargs) == 0 and parse_workers is None and budget is None and collapser is None and notifier is None:
+            the_pipeline = pl.Pipeline('crash_data_pipeline',
+                                              'The Long-Awaited Pipeline for the Crash Data (and the Cumulative Crash Data too)',
+                                              log_status=False,
+                                              settings_file=SETTINGS_FILE,
+                                              settings_from_file=True,
+                                              start_from_chunk=start_from_chunk,
+                                              chunk_size=2000
+                                              )
+            pipeline_ok = the_pipeline.connect(OpenFileConnector, crash_file.rewound(), encoding='utf-8') \
+                .extract(pl.CSVExtractor, firstline_headers=True) \
+                .schema(schema) \
+                .load(FanOutLoader, server, record_chunks=True, **loader_kwargs).run()
+        else: # Chunk-at-a-time transform engines, parallel parsing, memory budgets, collapsing, progress notifications and parallel upserts bypass pl.Pipeline.
+            loader = FanOutLoader(settings['loader'][server], **loader_kwargs)
+            try:
+                rows_loaded = run_chunked_pipeline(crash_file, schema, loader, chunk_size=2000, engine=engine, start_from_chunk=start_from_chunk, metrics=metrics, parse_workers=parse_workers, budget=budget, collapser=collapser, notifier=notifier)
+            except Exception as e:
+                if notifier is not None:
+                    notifier.notify("Loading {} failed: {!r}".format(target, e))
+                    notifier.close()
+                raise
+            print("Transformed {} rows using the {} engine.".format(rows_loaded, engine))
+            if budget is not None:
+                print(budget.describe())
+            if collapser is not None:
+                print(collapser.describe())
+        if replace:
+            kwargs = {'resource_id': swap_in_staging_resource(site, package_id, replaced_resource_id, API_key)}
+        checkpoint.finish()
+        crash_file.close()
+        if resource_id is None or 'resource_name' in cumulative_kwargs:
+            package_metadata.invalidate(site, package_id) # Since the load may have created resources
+        log = open('uploaded.log', 'w+')
+        print("Piped data to {} and {}".format(list(kwargs.values())[0],list(cumulative_kwargs.values())[0]))
+        log.write("Finished upserting data to {} and {}\n".format(list(kwargs.values())[0],list(cumulative_kwargs.values())[0]))
+        if collapser is not None:
+            log.write(collapser.describe() + "\n")
+        if delta_index is not None:
+            report_delta(delta_index, log)
+        if mirror is not None:
+            report_mirror(mirror, log)
+        report_metrics(metrics, log, kwparams.get('notify_summary', False), notifier)
+        log.close()
+        if notifier is not None:
+            notifier.close()
+        return
+
+    # The original two-pass approach (fan_out=False) reads and transforms the file
+    # once for each resource.
     the_pipeline = pl.Pipeline('crash_data_pipeline',
                                       'The Long-Awaited Pipeline for the Crash Data',
                                       log_status=False,
@@ -461,10 +1099,10 @@ def main(*args,**kwparams):
                                       start_from_chunk=0,
                                       chunk_size=2000
                                       )
-    pipeline_ok = the_pipeline.connect(pl.FileConnector, target, encoding='utf-8') \
+    pipeline_ok = the_pipeline.connect(OpenFileConnector, crash_file.rewound(), encoding='utf-8') \
         .extract(pl.CSVExtractor, firstline_headers=True) \
         .schema(schema) \
-        .load(pl.CKANDatastoreLoader, server,
+        .load(CrashDatastoreLoader, server,
               fields=fields_to_publish,
               #package_id=package_id,
               #resource_id=resource_id,
@@ -472,6 +1110,9 @@ def main(*args,**kwparams):
               key_fields=['CRASH_CRN'],
               clear_first=clear_first,
               method='upsert',
+              metrics=metrics,
+              metrics_label='crash_data_pipeline',
+              record_chunks=True,
               **kwargs).run()
     log = open('uploaded.log', 'w+')
     if specify_resource_by_name:
@@ -484,14 +1125,8 @@ def main(*args,**kwparams):
 
     ###### Cumulative Pipeline ###########
     schema = ExtendedCrashSchema
-    kwargs = {}
-    if server == 'production':
-        specify_resource_by_name = False
-        cumulative_resource_id = "2c13021f-74a9-4289-a1e5-fe0472c89881"
-        kwargs['resource_id'] = cumulative_resource_id
-    else:
-        specify_resource_by_name = True
-        kwargs['resource_name'] = 'Cumulative Crash Data'
+    kwargs = cumulative_kwargs
+    specify_resource_by_name = ('resource_name' in kwargs)
 
     cumulative_pipeline = pl.Pipeline('cumulative_crash_data_pipeline',
                                       'The Cumulative Pipeline for the Crash Data Which You Thought Would Never Come',
@@ -501,10 +1136,10 @@ def main(*args,**kwparams):
                                       start_from_chunk=0,
                                       chunk_size=2000
                                       )
-    cumulative_pipeline_ok = cumulative_pipeline.connect(pl.FileConnector, target, encoding='utf-8') \
+    cumulative_pipeline_ok = cumulative_pipeline.connect(OpenFileConnector, crash_file.rewound(), encoding='utf-8') \
         .extract(pl.CSVExtractor, firstline_headers=True) \
         .schema(schema) \
-        .load(pl.CKANDatastoreLoader, server,
+        .load(cumulative_loader, server,
               fields=fields_to_publish,
               #package_id=package_id,
               #resource_id=resource_id,
@@ -512,21 +1147,323 @@ def main(*args,**kwparams):
               key_fields=['CRASH_CRN'],
               clear_first=False, # This is different for the cumulative pipeline.
               method='upsert',
+              metrics=metrics,
+              metrics_label='cumulative_crash_data_pipeline',
+              record_chunks=True,
               **kwargs).run()
 
     if specify_resource_by_name:
         print("Piped data to {}".format(kwargs['resource_name']))
     else:
         print("Piped data to {}".format(kwargs['resource_id']))
+    package_metadata.invalidate(site, package_id)
+    with open('uploaded.log', 'a') as log:
+        if delta_index is not None:
+            report_delta(delta_index, log)
+        if mirror is not None:
+            report_mirror(mirror, log)
+        report_metrics(metrics, log, kwparams.get('notify_summary', False))
 
 
-if __name__ == "__main__":
-   # stuff only to run when not called via 'import' here
-    if len(sys.argv) == 2:
-        main(filename = sys.argv[1], server='test') # If no server is specified, the test server will be used by default.
-    elif len(sys.argv) == 3:
-        main(filename = sys.argv[1], server=sys.argv[2])
-    elif len(sys.argv) == 4:
-        main(filename = sys.argv[1], server=sys.argv[2], resource_id=sys.argv[3])
+def transform_file_to_chunk_file(target, chunk_file, engine='compiled', chunk_size=2000):
+    """Transform the target file, writing the transformed rows to chunk_file
+    (as JSON lines, one chunk per line), so that another process can load
+    them. This is the part of a backfill that runs in worker processes.
+    Returns the number of rows transformed, the CKAN fields for them and a
+    RepeatedKeyCollapser for the file's CRASH_CRN values (which hasn't
+    finished noting them, so that backfill() can also drop the CRNs that a
+    later file for the same year repeats)."""
+    row_count = 0
+    collapser = RepeatedKeyCollapser('CRASH_CRN')
+    with CrashFile(target) as crash_file, open(chunk_file, 'w') as f:
+        schema = crash_file.schema
+        schema_instance = schema(context={'types_fixed': engine == 'compiled'})
+        for rows in chunks_of(crash_file.rows(), chunk_size):
+            transformed_rows = transform_chunk(rows, schema_instance, engine)
+            collapser.note_keys(row['crash_crn'] for row in rows)
+            if isinstance(transformed_rows, RowBlock):
+                transformed_rows = transformed_rows.to_json_object() # Which is also much smaller
+            f.write(json.dumps(transformed_rows) + "\n")
+            row_count += len(rows)
+    return row_count, schema().serialize_to_ckan_fields(), collapser
+
+def backfill_order(target):
+    """Return the key that backfill() sorts the files by: the year, then
+    whether it's a supplement (anything but the year's base file, like
+    2010-crashes.csv or 2010-crashes.csv.gz), then the data file's name.
+    (Sorting by name alone would put 2010-a-few-more-crashes.csv ahead of
+    2010-crashes.csv, whose load would then clear it out.)"""
+    name = data_file_name(target)
+    is_supplement = name.lower()[4:] != '-crashes.csv'
+    return (year_from_filename(name), is_supplement, name)
+
+def backfill(file_pattern, server='test', workers=None, **kwparams):
+    """Load a whole set of yearly files (given as a directory or a glob
+    pattern) to their yearly resources and to the cumulative resource.
+
+    The files are transformed in parallel by a pool of worker processes,
+    while the CKAN writes happen one file at a time in this process, year
+    by year (see backfill_order), so that supplements (like
+    2010-a-few-more-crashes.csv) still get upserted after the yearly file
+    that they add to.
+    The settings file and the package's resource list are only read once.
+    (The workers rely on the fork start method, since this script can't be
+    imported by name.)"""
+    if os.path.isdir(file_pattern):
+        targets = []
+        for extension in ['*.csv', '*.csv.gz', '*.csv.bz2', '*.zip']:
+            targets += glob.glob(os.path.join(file_pattern, extension))
+    else:
+        targets = glob.glob(file_pattern)
+    if len(targets) == 0:
+        raise ValueError("No files match {}.".format(file_pattern))
+    import_pipeline_modules()
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    targets.sort(key=backfill_order)
+    years = [year_from_filename(data_file_name(target)) for target in targets]
+    engine = kwparams.get('engine', DEFAULT_ENGINE)
+    workers = int(workers) if workers not in [None, True] else os.cpu_count()
+
+    if kwparams.get('metadata_cache', None) is not None:
+        use_metadata_cache_file(kwparams['metadata_cache'])
+    with open(SETTINGS_FILE) as f:
+        settings = json.load(f)
+    site = settings['loader'][server]['ckan_root_url']
+    package_id = settings['loader'][server]['package_id']
+    API_key = settings['loader'][server]['ckan_api_key']
+    resource_ids = {r['name']: r['id'] for r in get_package_parameter(site,package_id,'resources',API_key)}
+    mirror = cumulative_mirror(server, kwparams)
+    cumulative_loader, cumulative_kwargs, delta_index = cumulative_loader_options(server, site, kwparams, mirror)
+    upsert_kwargs = upsert_options(site, API_key, kwparams)
+    metrics = pipeline_metrics("Crash ETL backfill of {} files matching {}".format(len(targets), file_pattern), kwparams)
+    budget = chunk_budget(kwparams)
+    notifier = progress_notifier("Crash ETL backfill of {} files matching {}".format(len(targets), file_pattern), kwparams)
+
+    loaded_resources = set()
+    checkpoint_dir = kwparams.get('checkpoint_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints'))
+    log = open('uploaded.log', 'w+')
+    chunk_dir = tempfile.mkdtemp(prefix='crash-backfill-')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            chunk_files = [os.path.join(chunk_dir, '{}.jsonl'.format(k)) for k in range(len(targets))]
+            futures = [pool.submit(transform_file_to_chunk_file, target, chunk_file, engine) for target, chunk_file in zip(targets, chunk_files)]
+            for k, (target, year, chunk_file, future) in enumerate(zip(targets, years, chunk_files, futures)):
+                row_count, fields_to_publish, collapser = future.result()
+                if mirror is not None:
+                    mirror.add_fields(fields_to_publish)
+                resource_name = '{} Crash Data'.format(year)
+                # Only clear a yearly resource the first time it's loaded, so that files
+                # like 2010-a-few-more-crashes.csv add to (rather than replace) that year.
+                clear_first = resource_ids.get(resource_name, None) is not None and resource_name not in loaded_resources
+                loaded_resources.add(resource_name)
+                # With --replace, a resource that would have been cleared is rebuilt in a staging resource instead.
+                replace = kwparams.get('replace', False) and clear_first
+                load_to_name = resource_name
+                if replace:
+                    load_to_name = staging_resource_name(resource_name)
+                    clear_first = load_to_name in resource_ids # Left over from an earlier run
+                collapse = must_collapse(kwparams, upsert_kwargs, replace)
+                if collapse:
+                    # Also drop the CRNs that the year's later files (like 2010-a-few-more-crashes.csv)
+                    # repeat, since they get loaded after this one. This waits for those files' keys.
+                    for later_year, later_future in zip(years[k+1:], futures[k+1:]):
+                        if later_year == year:
+                            collapser.drop_keys_of(later_future.result()[2])
+                collapser.finish_noting()
+                checkpoint = LoadCheckpoint(checkpoint_dir, target, [site, load_to_name, list(cumulative_kwargs.values())[0]], chunk_size=2000)
+                start_from_chunk = resume_point(checkpoint, kwparams.get('resume', False))
+                if start_from_chunk is None:
+                    print("Skipping {}, which was already completely loaded.".format(target))
+                    continue
+                if start_from_chunk > 0:
+                    clear_first = False
+                print("Loading {} rows from {} to {} (clear_first = {})".format(row_count, target, load_to_name, clear_first))
+                loader = FanOutLoader(settings['loader'][server],
+                        **fan_out_loader_kwargs(fields_to_publish, clear_first, replace, cumulative_loader, cumulative_kwargs,
+                            upsert_kwargs, checkpoint, start_from_chunk, metrics, resource_name=load_to_name))
+                with open(chunk_file) as f:
+                    for chunk_index, line in enumerate(f):
+                        if chunk_index >= start_from_chunk:
+                            load_started_at = time.time()
+                            if budget is not None:
+                                budget.acquire(on_wait=loader.send_pending)
+                            rows = json.loads(line)
+                            if isinstance(rows, dict):
+                                rows = RowBlock.from_json_object(rows)
+                            row_count = len(rows)
+                            if collapse:
+                                rows = collapser.collapse(rows, chunk_index*2000)
+                            loader.load(rows, budget.release if budget is not None else None)
+                            metrics.record_chunk('crash_data_pipeline', chunk_index, row_count,
+                                    load_wait_seconds=time.time() - load_started_at)
+                            if notifier is not None:
+                                notifier.notify("Loading {} (through chunk {}).".format(target, chunk_index), key='progress')
+                loader.flush()
+                if collapse:
+                    print(collapser.describe())
+                    log.write("{}: {}\n".format(target, collapser.describe()))
+                if replace:
+                    resource_ids[resource_name] = swap_in_staging_resource(site, package_id, resource_ids[resource_name], API_key)
+                checkpoint.finish()
+                os.remove(chunk_file)
+                log.write("Finished upserting data from {} to {} and {}\n".format(target, resource_name, list(cumulative_kwargs.values())[0]))
+                log.flush()
+                if notifier is not None:
+                    notifier.notify("Finished loading {}.".format(target))
+    except Exception as e:
+        if notifier is not None:
+            notifier.notify("The backfill failed: {!r}".format(e))
+            notifier.close()
+        raise
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        package_metadata.invalidate(site, package_id) # Since yearly resources may have been created
+    if delta_index is not None:
+        report_delta(delta_index, log)
+    if mirror is not None:
+        report_mirror(mirror, log)
+    if budget is not None:
+        print(budget.describe())
+        log.write(budget.describe() + "\n")
+    report_metrics(metrics, log, kwparams.get('notify_summary', False), notifier)
+    log.close()
+    if notifier is not None:
+        notifier.close()
+
+def republish_from_mirror(server='test', year=None, **kwparams):
+    """Upsert the rows in the local mirror (all of them, or those for one
+    year) to the cumulative resource, without reading any crash files."""
+    import_pipeline_modules()
+    mirror = cumulative_mirror(server, dict(kwparams, mirror=kwparams.get('mirror', True)))
+    with open(SETTINGS_FILE) as f:
+        settings = json.load(f)
+    site = settings['loader'][server]['ckan_root_url']
+    API_key = settings['loader'][server]['ckan_api_key']
+    _, cumulative_kwargs, _ = cumulative_loader_options(server, site, {})
+    fields_to_publish = [{'id': field_id, 'type': field_type} for field_id, field_type in mirror.fields]
+    loader = CrashDatastoreLoader(settings['loader'][server],
+            fields=fields_to_publish,
+            key_fields=['CRASH_CRN'],
+            clear_first=False,
+            method='upsert',
+            **dict(cumulative_kwargs, **upsert_options(site, API_key, kwparams)))
+    row_count = 0
+    for rows in chunks_of(mirror.rows(int(year) if year is not None else None), 2000):
+        loader.load(rows)
+        row_count += len(rows)
+    loader.flush()
+    print("Republished {} rows from {} to {}.".format(row_count, mirror.path, list(cumulative_kwargs.values())[0]))
+    mirror.close()
+
+def print_mirror_changes(server='test', year=None, since=None, **kwparams):
+    """Print the rows in the local mirror that were added or changed (in the
+    given year, and since the given date, like 2019-01-31)."""
+    mirror = cumulative_mirror(server, dict(kwparams, mirror=kwparams.get('mirror', True)))
+    if since is not None:
+        since = time.mktime(datetime.datetime.strptime(since, '%Y-%m-%d').timetuple())
+    changes = mirror.changes(int(year) if year is not None else None, since)
+    for key, change, changed_at in changes:
+        print("{} {} {}".format(datetime.datetime.fromtimestamp(changed_at).isoformat(' ', 'seconds'), change, key))
+    print("{} new and {} changed rows.".format(sum(1 for c in changes if c[1] == 'new'), sum(1 for c in changes if c[1] == 'changed')))
+    mirror.close()
+
+def dry_run(target, server='test', resource_id=None, member=None, **kwparams):
+    """Print what a load of the target file would do (the file that gets
+    read, the year, the schema and the resources), going only by its name
+    and header, without importing the pipeline modules or contacting CKAN."""
+    with CrashFile(target, member=member) as crash_file:
+        year = year_from_filename(crash_file.name)
+        print("{} would be read from {} (with {} columns).".format(crash_file.name, target, len(crash_file.header)))
+        print("Its rows would go through {}.".format(crash_file.schema_name))
+    with open(SETTINGS_FILE) as f:
+        settings = json.load(f)
+    if server not in settings['loader']:
+        raise ValueError("{} has no settings for the server '{}'.".format(SETTINGS_FILE, server))
+    print("They would be loaded to {} and to the cumulative resource on {}.".format(
+        resource_id or kwparams.get('resource_name', '{} Crash Data'.format(year)), settings['loader'][server]['ckan_root_url']))
+
+def argument_parser():
+    parser = argparse.ArgumentParser(prog='crash-etl.py', allow_abbrev=False,
+            description="Load a yearly crash-data file to its yearly resource and to the cumulative Crash Data resource. (See the top of crash-etl.py for more on the options.)")
+    parser.add_argument('args', nargs='*', metavar='argument',
+            help="<file> [server] [resource ID] (the server defaults to test); with --backfill, <directory or quoted glob> [server]; with --republish-from-mirror or --mirror-changes, [server]")
+    flag = dict(action='store_const', const=True, default=argparse.SUPPRESS)
+    option = dict(default=argparse.SUPPRESS)
+
+    modes = parser.add_argument_group("alternatives to loading a single file")
+    modes.add_argument('--backfill', help="load every yearly file in a directory (or matching a glob)", **flag)
+    modes.add_argument('--republish-from-mirror', help="upsert the local mirror's rows to the cumulative resource", **flag)
+    modes.add_argument('--mirror-changes', help="list the rows in the local mirror that were added or changed", **flag)
+    modes.add_argument('--check-parity', help="compare the transform engines' output for the file", **flag)
+    modes.add_argument('--validate', help="report on the file's data quality, without loading it", **flag)
+    modes.add_argument('--dry-run', help="check the file's name and header and say where it would be loaded", **flag)
+
+    loading = parser.add_argument_group("loading")
+    loading.add_argument('--member', metavar='NAME', help="the CSV file to use from a zip archive", **option)
+    loading.add_argument('--resource-name', metavar='NAME', help="the yearly resource's name", **option)
+    loading.add_argument('--engine', choices=['marshmallow', 'compiled'], help="the transform engine", **option)
+    loading.add_argument('--parse-workers', nargs='?', const=True, type=int, metavar='N', help="parse and transform the file in N processes", **option)
+    loading.add_argument('--workers', nargs='?', const=True, type=int, metavar='N', help="the number of worker processes for --backfill", **option)
+    loading.add_argument('--parallel-upserts', nargs='?', const=True, type=int, metavar='N', help="keep N upsert batches in flight", **option)
+    loading.add_argument('--json-encoder', choices=['auto', 'orjson', 'json'], help="how upsert payloads get encoded", **option)
+    loading.add_argument('--fast-json', help="encode serial upserts with util.payloads", **flag)
+    loading.add_argument('--gzip-upserts', help="gzip the upsert requests", **flag)
+    loading.add_argument('--max-chunks-in-memory', type=int, metavar='N', help="cap the chunks between extraction and CKAN", **option)
+    loading.add_argument('--max-memory-mb', type=float, metavar='M', help="let only one chunk through above this much memory use", **option)
+    loading.add_argument('--replace', help="rebuild an existing yearly resource in a staging resource and swap it in (which changes its resource ID)", **flag)
+    loading.add_argument('--collapse-duplicates', help="only load the last version of each repeated CRASH_CRN", **flag)
+    loading.add_argument('--resume', help="pick up an interrupted load after its last checkpointed chunk", **flag)
+    loading.add_argument('--checkpoint-dir', metavar='PATH', **option)
+    loading.add_argument('--metadata-cache', metavar='PATH', help="share the package metadata cache between runs", **option)
+    loading.add_argument('--delta', help="only upsert new or changed rows to the cumulative resource", **flag)
+    loading.add_argument('--delta-index', metavar='PATH', **option)
+
+    mirror = parser.add_argument_group("the local mirror of the cumulative resource")
+    mirror.add_argument('--mirror', nargs='?', const=True, metavar='PATH', help="keep a local mirror of what gets published to the cumulative resource (at PATH)", **option)
+    mirror.add_argument('--year', type=int, help="limit --republish-from-mirror or --mirror-changes to one year", **option)
+    mirror.add_argument('--since', metavar='YYYY-MM-DD', help="limit --mirror-changes to changes since this date", **option)
+
+    reporting = parser.add_argument_group("reporting")
+    reporting.add_argument('--report', metavar='PATH', help="where --validate writes its report as JSON", **option)
+    reporting.add_argument('--metrics-log', metavar='PATH', **option)
+    reporting.add_argument('--prometheus-file', metavar='PATH', **option)
+    reporting.add_argument('--notify-summary', help="post the run summary to Slack", **flag)
+    reporting.add_argument('--notify-progress', help="post digests of the progress (and any errors) to Slack", **flag)
+    reporting.add_argument('--notify-interval', type=float, metavar='SECONDS', **option)
+    return parser
+
+def cli(argv=None):
+    """Run the script with the given command-line arguments (by default,
+    sys.argv's). Options are passed on as keyword arguments (so
+    --engine=compiled becomes engine='compiled'), and only the options that
+    were given are passed, so the functions' defaults still apply."""
+    parser = argument_parser()
+    options = vars(parser.parse_args(argv))
+    args = options.pop('args')
+    def check_argument_count(mode, counts):
+        if len(args) not in counts:
+            parser.error("{} takes {} to {} arguments (not {}).".format(mode, min(counts), max(counts), len(args)))
+    if options.pop('republish_from_mirror', False):
+        # python crash-etl.py --republish-from-mirror [server] [--year=2016]
+        check_argument_count('--republish-from-mirror', [0, 1])
+        republish_from_mirror(server=args[0] if len(args) == 1 else 'test', **options)
+    elif options.pop('mirror_changes', False):
+        # python crash-etl.py --mirror-changes [server] [--year=2016] [--since=2019-01-31]
+        check_argument_count('--mirror-changes', [0, 1])
+        print_mirror_changes(server=args[0] if len(args) == 1 else 'test', **options)
+    elif options.pop('backfill', False):
+        # python crash-etl.py --backfill <directory or quoted glob> [server] [--workers=N]
+        check_argument_count('--backfill', [1, 2])
+        backfill(args[0], server=args[1] if len(args) == 2 else 'test', **options)
     else:
-        print("There are either too many or too few command-line arguments.")
+        check_argument_count('Loading a file', [1, 2, 3])
+        # If no server is specified, the test server will be used by default.
+        kwargs = dict(zip(['filename', 'server', 'resource_id'], args + ['test'] if len(args) == 1 else args))
+        if options.pop('dry_run', False):
+            dry_run(kwargs['filename'], kwargs['server'], kwargs.get('resource_id', None), **options)
+        else:
+            main(**dict(kwargs, **options))
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,189 @@
+"""The loaders that crash-etl.py hands transformed rows to (see
+CrashDatastoreLoader), kept apart from the script so that pipeline and
+requests only get imported once a load actually starts."""
+import time, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline as pl
+
+from util.datastore import DatastoreUpserter
+from util.request_sizes import SentRequestSizes
+from util.row_block import RowBlock
+
+class OpenFileConnector(pl.FileConnector):
+    """A FileConnector for a file that is already open (like the stream
+    from CrashFile.rewound()), so that the pipeline doesn't open it again.
+    (FileConnector.close(), which pl.Pipeline calls once the load is done,
+    closes the stream.)"""
+    def connect(self, target):
+        self._file = target
+        return self._file
+
+class CrashDatastoreLoader(pl.CKANDatastoreLoader):
+    """A CKANDatastoreLoader that can keep several upsert batches in flight.
+
+    Passing a parallel_upserts keyword argument (a dict of keyword arguments
+    for util.datastore.DatastoreUpserter, which must include site and
+    API_key) makes load() queue the data with a DatastoreUpserter instead of
+    upserting it before returning. In that case, flush() has to be called
+    at the end to wait for the last batches (and for any errors).
+
+    If a util.metrics.PipelineMetrics is passed as the metrics keyword
+    argument, every upsert is recorded to it under the name given by
+    metrics_label. With record_chunks=True, every chunk is recorded too
+    (which is how chunks get timed when pl.Pipeline is doing the extracting
+    and transforming; since it hands over each chunk already transformed,
+    the time between one load() and the next is counted as transform time).
+
+    If a util.local_mirror.PublishedDataMirror is passed as the mirror
+    keyword argument, the rows are stored in it once they've been upserted.
+    Subclasses change what gets loaded by overriding load_chunk()."""
+    def __init__(self, *args, **kwargs):
+        parallel_upserts = kwargs.pop('parallel_upserts', None)
+        self.metrics = kwargs.pop('metrics', None)
+        self.metrics_label = kwargs.pop('metrics_label', None)
+        self.record_chunks = kwargs.pop('record_chunks', False) and self.metrics is not None
+        self.mirror = kwargs.pop('mirror', None)
+        super(CrashDatastoreLoader, self).__init__(*args, **kwargs)
+        self.upserter = None
+        if parallel_upserts is not None:
+            parallel_upserts = dict({'method': kwargs.get('method', 'upsert')}, **parallel_upserts)
+            self.upserter = DatastoreUpserter(resource_id=self.resource_id,
+                    metrics=self.metrics, metrics_label=self.metrics_label, **parallel_upserts)
+        self.chunks_seen = 0
+        self.last_load_finished_at = time.time()
+
+    def load(self, data, on_success=None):
+        """Upsert the data, calling on_success() (if given) once it has all
+        been upserted."""
+        started_at = time.time()
+        self.load_chunk(data, on_success)
+        if self.record_chunks:
+            self.metrics.record_chunk(self.metrics_label, self.chunks_seen, len(data),
+                    transform_seconds=started_at - self.last_load_finished_at,
+                    load_wait_seconds=time.time() - started_at)
+        self.chunks_seen += 1
+        self.last_load_finished_at = time.time()
+
+    def load_chunk(self, data, on_success=None):
+        if len(data) == 0: # E.g., when every row of the chunk shows up again later in the file
+            if on_success is not None:
+                on_success()
+            return
+        if self.mirror is not None:
+            on_success = self.mirror_when_loaded(data, on_success)
+        if self.upserter is None:
+            if isinstance(data, RowBlock):
+                data = data.records() # pl.CKANDatastoreLoader needs the dicts.
+            started_at = time.time()
+            with SentRequestSizes() as sent:
+                super(CrashDatastoreLoader, self).load(data)
+            latency = time.time() - started_at
+            if self.metrics is not None:
+                # pl.CKANDatastoreLoader builds and sends the payload itself,
+                # so the size is that of the request it sent, and whether it
+                # retried isn't known.
+                self.metrics.record_upsert(self.metrics_label, len(data), sent.total(), latency, retries=None)
+            if on_success is not None:
+                on_success()
+        else:
+            self.upserter.submit(data, on_success)
+
+    def mirror_when_loaded(self, data, on_success):
+        def mirror_rows():
+            self.mirror.update(data)
+            if on_success is not None:
+                on_success()
+        return mirror_rows
+
+    def send_pending(self):
+        """Send any rows that are waiting to fill up a batch (and raise any
+        errors from the batches in flight)."""
+        if self.upserter is not None:
+            self.upserter.send_pending()
+
+    def flush(self):
+        if self.upserter is not None:
+            self.upserter.flush()
+
+class FanOutLoader(CrashDatastoreLoader):
+    """A CrashDatastoreLoader that also loads every chunk into the additional
+    resources described by the also_load_to keyword argument (a list of
+    dicts of loader keyword arguments, like those passed to
+    CrashDatastoreLoader).
+
+    This lets one pass of extraction and schema processing feed several
+    resources. The uploads of a chunk run concurrently, but (unless the
+    loaders are doing parallel upserts) load() does not return until all
+    of them have finished, so errors are still raised in the pipeline.
+
+    If a util.checkpoints.LoadCheckpoint is passed as the checkpoint keyword
+    argument, each chunk is committed to it once every resource has it.
+    Chunks are numbered from start_from_chunk (the number of chunks that
+    were skipped when resuming a load)."""
+    def __init__(self, *args, **kwargs):
+        also_load_to = kwargs.pop('also_load_to', [])
+        self.checkpoint = kwargs.pop('checkpoint', None)
+        self.chunk_index = kwargs.pop('start_from_chunk', 0)
+        super(FanOutLoader, self).__init__(*args, **kwargs)
+        self.chunks_seen = self.chunk_index
+        # Only the config is shared with the other loaders, so that
+        # things like clear_first can differ from resource to resource.
+        # An entry in also_load_to can pick a different loader class with
+        # the 'loader_class' key.
+        self.other_loaders = []
+        for other_kwargs in also_load_to:
+            other_kwargs = dict(other_kwargs)
+            loader_class = other_kwargs.pop('loader_class', CrashDatastoreLoader)
+            self.other_loaders.append(loader_class(*args, **other_kwargs))
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.other_loaders),1))
+
+    def load_chunk(self, data, on_success=None):
+        chunk_index = self.chunk_index
+        self.chunk_index += 1
+        remaining = {'loaders': 1 + len(self.other_loaders)}
+        lock = threading.Lock()
+        def loaded_by_one_loader():
+            with lock:
+                remaining['loaders'] -= 1
+                done = (remaining['loaders'] == 0)
+            if done:
+                if self.checkpoint is not None:
+                    self.checkpoint.commit(chunk_index)
+                if on_success is not None:
+                    on_success()
+
+        futures = [self.executor.submit(loader.load, data, loaded_by_one_loader) for loader in self.other_loaders]
+        super(FanOutLoader, self).load_chunk(data, loaded_by_one_loader)
+        for future in futures:
+            future.result() # This re-raises any exception from the other uploads.
+
+    def send_pending(self):
+        super(FanOutLoader, self).send_pending()
+        for loader in self.other_loaders:
+            loader.send_pending()
+
+    def flush(self):
+        super(FanOutLoader, self).flush()
+        for loader in self.other_loaders:
+            loader.flush()
+
+class DeltaLoader(CrashDatastoreLoader):
+    """A CrashDatastoreLoader that only upserts the rows that are new or that
+    have changed since they were last published, according to the
+    PublishedRowIndex passed as the delta_index keyword argument. The
+    index keeps the counts of skipped and upserted rows."""
+    def __init__(self, *args, **kwargs):
+        self.delta_index = kwargs.pop('delta_index')
+        super(DeltaLoader, self).__init__(*args, **kwargs)
+
+    def load_chunk(self, data, on_success=None):
+        changed = self.delta_index.changed_rows(data)
+        def record_changes():
+            self.delta_index.record(changed)
+            if on_success is not None:
+                on_success()
+        if len(changed) > 0:
+            super(DeltaLoader, self).load_chunk([row for row, _ in changed], record_changes)
+        elif on_success is not None:
+            on_success()
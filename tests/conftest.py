@@ -0,0 +1,27 @@
+"""Shared fixtures. The tests load crash-etl.py the way the benchmarks do,
+so they need wprdc-etl's pipeline package (and the local parameters
+module) to be importable; without them, the tests are skipped."""
+import os, sys
+
+import pytest
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIRECTORY not in sys.path:
+    sys.path.insert(0, REPO_DIRECTORY)
+
+@pytest.fixture(scope='session')
+def crash_etl():
+    pytest.importorskip('pipeline')
+    pytest.importorskip('parameters.local_parameters')
+    from benchmarks import load_crash_etl
+    crash_etl = load_crash_etl()
+    crash_etl.import_pipeline_modules()
+    return crash_etl
+
+@pytest.fixture(scope='session')
+def synthetic_files(crash_etl, tmp_path_factory):
+    """A small synthetic yearly file in each format (see benchmarks.synthetic_data)."""
+    from benchmarks.synthetic_data import write_synthetic_crash_file
+    directory = tmp_path_factory.mktemp('synthetic')
+    return {data_format: write_synthetic_crash_file(crash_etl, str(directory / '{}-crashes.csv'.format(data_format)), 50, data_format)
+            for data_format in ['2016', '2018']}
@@ -0,0 +1,12 @@
+"""Tests of the order in which --backfill loads files."""
+
+def test_base_yearly_file_comes_before_its_supplements(crash_etl):
+    targets = ['data/2016-a-few-more-crashes.csv', 'data/2016-crashes.csv', 'data/2015-crashes.csv.gz',
+            'data/2010-a-few-more-crashes.csv', 'data/2010-crashes.csv.bz2', 'data/2010-b-even-more-crashes.csv']
+    assert sorted(targets, key=crash_etl.backfill_order) == ['data/2010-crashes.csv.bz2',
+            'data/2010-a-few-more-crashes.csv', 'data/2010-b-even-more-crashes.csv', 'data/2015-crashes.csv.gz',
+            'data/2016-crashes.csv', 'data/2016-a-few-more-crashes.csv']
+
+def test_files_are_ordered_by_year_whatever_their_names(crash_etl):
+    targets = ['2012-more.csv', '2011-zzz.csv', '2010-crashes.csv']
+    assert sorted(targets, key=crash_etl.backfill_order) == ['2010-crashes.csv', '2011-zzz.csv', '2012-more.csv']
@@ -0,0 +1,33 @@
+"""Tests of util.checkpoints."""
+import os
+
+from util.checkpoints import LoadCheckpoint
+
+def make_file(path, text='CRASH_CRN\n1\n2\n'):
+    with open(path, 'w') as f:
+        f.write(text)
+    return str(path)
+
+def test_progress_carries_over_to_a_later_run(tmp_path):
+    target = make_file(tmp_path / '2016-crashes.csv')
+    checkpoint = LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'resource'], chunk_size=2000)
+    checkpoint.reset()
+    for chunk_index in [1, 0, 2]:
+        checkpoint.commit(chunk_index)
+    resumed = LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'resource'], chunk_size=2000)
+    assert resumed.last_committed_chunk() == 2
+    assert not resumed.is_complete()
+
+def test_progress_is_ignored_once_the_file_changes(tmp_path):
+    target = make_file(tmp_path / '2016-crashes.csv')
+    checkpoint = LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'resource'], chunk_size=2000)
+    checkpoint.commit(0)
+    make_file(target, 'CRASH_CRN\n3\n4\n') # The same name and size
+    stat = os.stat(target)
+    os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'resource'], chunk_size=2000).last_committed_chunk() == -1
+
+def test_progress_is_kept_per_set_of_resources(tmp_path):
+    target = make_file(tmp_path / '2016-crashes.csv')
+    LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'resource'], chunk_size=2000).commit(0)
+    assert LoadCheckpoint(str(tmp_path / 'checkpoints'), target, ['site', 'other resource'], chunk_size=2000).last_committed_chunk() == -1
@@ -0,0 +1,66 @@
+"""Tests of how crash files get turned into rows (by CrashFile and by the
+parallel parser), especially records that csv.DictReader would treat
+specially: blank lines (which it skips) and short records (whose missing
+fields it fills in with None)."""
+import pytest
+
+SHORT_RECORD = '2016999999,11\n' # Just a CRASH_CRN and a DISTRICT
+
+def copy_with_lines(source, path, insert_at, inserted_lines, trailing_lines=()):
+    with open(source) as f:
+        lines = f.readlines()
+    with open(path, 'w') as f:
+        f.writelines(lines[:insert_at] + list(inserted_lines) + lines[insert_at:] + list(trailing_lines))
+    return path
+
+@pytest.fixture(params=['2016', '2018'])
+def ragged_file(request, synthetic_files, tmp_path):
+    """A synthetic file with a short record after the ninth row and a blank line at the end."""
+    return copy_with_lines(synthetic_files[request.param], str(tmp_path / '{}-ragged-crashes.csv'.format(request.param)),
+            10, [SHORT_RECORD], ['\n'])
+
+def test_rows_skip_blank_lines_and_pad_short_records(crash_etl, ragged_file):
+    with crash_etl.CrashFile(ragged_file) as crash_file:
+        rows = list(crash_file.rows())
+        fieldnames = crash_file.fieldnames
+    assert len(rows) == 51
+    assert all(list(row.keys()) == fieldnames for row in rows)
+    short_row = rows[9]
+    assert short_row['crash_crn'] == '2016999999'
+    assert short_row['district'] == '11'
+    assert all(short_row[name] is None for name in fieldnames[2:])
+
+def test_engines_match_marshmallow_on_blank_lines_and_short_records(crash_etl, ragged_file):
+    with crash_etl.CrashFile(ragged_file) as crash_file:
+        assert crash_etl.check_engine_parity(crash_file, crash_file.schema) == {'compiled': 0}
+
+def test_parallel_parsing_matches_serial_parsing(crash_etl, ragged_file):
+    with crash_etl.CrashFile(ragged_file) as crash_file:
+        schema = crash_file.schema
+        fieldnames = tuple(crash_file.fieldnames)
+        expected = list(crash_etl.transform_chunk(list(crash_file.rows()), schema(context={'types_fixed': True}), 'compiled'))
+    ranges = crash_etl.record_ranges(ragged_file, 4)
+    assert len(ranges) > 1
+    got = []
+    for start, end in ranges:
+        got += list(crash_etl.transform_byte_range(ragged_file, start, end, 'utf-8', fieldnames, schema, 'compiled'))
+    assert got == expected
+
+def test_validation_counts_every_nonblank_record(crash_etl, ragged_file):
+    with crash_etl.CrashFile(ragged_file) as crash_file:
+        report = crash_etl.validate_crash_file(crash_file, crash_file.schema)
+    assert report.row_count == 51
+    assert report.problem_count() == 0
+
+def test_collapser_positions_skip_blank_lines(crash_etl, synthetic_files, tmp_path):
+    with open(synthetic_files['2016']) as f:
+        first_record = f.readlines()[1]
+    # A blank line and then a second version of the first row.
+    path = copy_with_lines(synthetic_files['2016'], str(tmp_path / '2016-repeated-crashes.csv'), 11, ['\n', first_record])
+    with crash_etl.CrashFile(path) as crash_file:
+        collapser = crash_etl.repeated_crn_collapser(crash_file)
+        rows = crash_etl.transform_chunk(list(crash_file.rows()), crash_file.schema(context={'types_fixed': True}), 'compiled')
+    assert len(rows) == 51
+    kept = collapser.collapse(rows, 0)
+    assert len(kept) == 50
+    assert kept[9] == rows[10] # The later version is the one that's kept.
@@ -0,0 +1,26 @@
+"""Tests of the --validate data-quality report."""
+import csv
+
+from util.data_quality import DataQualityReport
+
+def test_keys_that_differ_only_in_leading_zeros_are_not_repeats():
+    report = DataQualityReport(['crash_crn'], ['crash_crn'], key_field='crash_crn')
+    report.add_chunk([{'crash_crn': '12'}, {'crash_crn': '012'}, {'crash_crn': 'A12'}])
+    assert report.duplicate_key_count == 0
+    report.add_chunk([{'crash_crn': '12'}, {'crash_crn': '012'}])
+    assert report.duplicate_key_count == 2
+    assert report.problem_count() == 2
+
+def test_a_null_key_is_one_problem(crash_etl, synthetic_files, tmp_path):
+    path = str(tmp_path / '2016-crashes.csv')
+    with open(synthetic_files['2016'], newline='') as f:
+        records = list(csv.reader(f))
+    key_column = records[0].index('CRASH_CRN')
+    records[3][key_column] = ''
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(records)
+    with crash_etl.CrashFile(path) as crash_file:
+        report = crash_etl.validate_crash_file(crash_file, crash_file.schema)
+    assert report.null_key_count == 1
+    assert report.conversion_error_count == 0
+    assert report.problem_count() == 1
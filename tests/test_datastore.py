@@ -0,0 +1,72 @@
+"""Tests of util.datastore.DatastoreUpserter's retries and batch sizes,
+against benchmarks.standin_ckan (with failures injected)."""
+import pytest
+
+from benchmarks.standin_ckan import StandInCKAN
+from util.datastore import DatastoreUpserter
+from util.metrics import PipelineMetrics
+
+def records(count):
+    return [{'CRASH_CRN': str(k), 'DAY_OF_WEEK': k % 7} for k in range(count)]
+
+@pytest.fixture
+def standin_ckan():
+    with StandInCKAN(keep_records=True) as ckan:
+        yield ckan
+
+def upserter(ckan, **options):
+    options = dict(dict(max_in_flight=1, backoff=0.0), **options)
+    return DatastoreUpserter(ckan.url, 'test-key', 'resource-id', **options)
+
+@pytest.mark.parametrize('status_code', [409, 500, 502, 503, 504])
+def test_failed_upserts_are_retried(standin_ckan, status_code):
+    standin_ckan.fail_next('datastore_upsert', status_code, count=2)
+    metrics = PipelineMetrics("Test run")
+    datastore = upserter(standin_ckan, metrics=metrics, metrics_label='test')
+    datastore.submit(records(10))
+    datastore.flush()
+    assert standin_ckan.stats['failures'] == 2
+    assert len(standin_ckan.records['resource-id']) == 10
+    assert datastore.retry_count == 2
+    assert metrics.summary()['pipelines']['test']['retries'] == 2
+
+def test_upserts_that_keep_failing_raise(standin_ckan):
+    standin_ckan.fail_next('datastore_upsert', 503, count=3)
+    datastore = upserter(standin_ckan, max_retries=2)
+    datastore.submit(records(10))
+    with pytest.raises(RuntimeError, match="still failing after 2 retries"):
+        datastore.flush()
+    assert 'resource-id' not in standin_ckan.records
+
+def test_other_errors_are_not_retried(standin_ckan):
+    standin_ckan.fail_next('datastore_upsert', 403)
+    datastore = upserter(standin_ckan)
+    datastore.submit(records(10))
+    with pytest.raises(RuntimeError, match="status code 403"):
+        datastore.flush()
+    assert datastore.retry_count == 0
+
+def test_retries_halve_the_batch_size(standin_ckan):
+    standin_ckan.fail_next('datastore_upsert', 503)
+    datastore = upserter(standin_ckan, batch_size=400, min_batch_size=100, max_batch_size=1000)
+    datastore.submit(records(400))
+    datastore.flush()
+    # It was halved to 200 by the retry and then (since the upsert was
+    # quick) doubled again, which is as far as it goes in one step.
+    assert datastore.batch_size == 400
+    assert len(standin_ckan.records['resource-id']) == 400
+
+def test_quick_upserts_grow_the_batch_size_up_to_the_maximum(standin_ckan):
+    datastore = upserter(standin_ckan, batch_size=100, min_batch_size=50, max_batch_size=300)
+    datastore.submit(records(100))
+    datastore.flush()
+    assert datastore.batch_size == 200
+    datastore.submit(records(200))
+    datastore.flush()
+    assert datastore.batch_size == 300
+
+def test_big_payloads_shrink_the_batch_size(standin_ckan):
+    datastore = upserter(standin_ckan, batch_size=100, min_batch_size=10, max_payload_bytes=1000)
+    datastore.submit(records(100))
+    datastore.flush()
+    assert 10 <= datastore.batch_size < 50 # (Each record takes more than 20 bytes.)
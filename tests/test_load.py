@@ -0,0 +1,126 @@
+"""End-to-end loads through main(), against benchmarks.standin_ckan (a
+local stand-in for CKAN)."""
+import csv, glob, json, os
+
+import pytest
+
+from benchmarks.standin_ckan import StandInCKAN
+
+@pytest.fixture
+def standin_ckan(crash_etl, tmp_path, monkeypatch):
+    with StandInCKAN(keep_records=True) as ckan:
+        settings_file = tmp_path / 'settings.json'
+        settings_file.write_text(json.dumps({'loader': {'test': {'ckan_root_url': ckan.url,
+            'package_id': ckan.package_id, 'ckan_api_key': 'test-key'}}}))
+        monkeypatch.setattr(crash_etl, 'SETTINGS_FILE', str(settings_file))
+        monkeypatch.chdir(tmp_path) # main() writes uploaded.log to the current directory.
+        yield ckan
+
+def load_options(tmp_path):
+    return dict(server='test', checkpoint_dir=str(tmp_path / 'checkpoints'),
+            metrics_log=str(tmp_path / 'metrics.jsonl'), mirror=str(tmp_path / 'mirror.sqlite'))
+
+def saved_checkpoints(tmp_path):
+    checkpoints = []
+    for path in glob.glob(os.path.join(str(tmp_path / 'checkpoints'), '*.json')):
+        with open(path) as f:
+            checkpoints.append(json.load(f))
+    return checkpoints
+
+def test_default_load_goes_through_pl_pipeline_to_the_end(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    crash_etl.main(filename=synthetic_files['2016'], **load_options(tmp_path)) # The marshmallow engine, through pl.Pipeline
+    assert standin_ckan.stats['records_upserted'] == 2*50 # To the yearly and the cumulative resources
+    assert [checkpoint['complete'] for checkpoint in saved_checkpoints(tmp_path)] == [True]
+    with open(str(tmp_path / 'uploaded.log')) as f:
+        assert f.read().startswith("Finished upserting data to 2016 Crash Data and Cumulative Crash Data")
+    with open(str(tmp_path / 'metrics.jsonl')) as f:
+        upserts = [event for event in map(json.loads, f) if event['event'] == 'upsert']
+    assert len(upserts) == 2
+    assert all(event['payload_bytes'] > 50*1000 and event['retries'] is None for event in upserts)
+    assert sum(event['payload_bytes'] for event in upserts) <= standin_ckan.stats['bytes_received']
+
+def test_compiled_load_matches_default_load(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    crash_etl.main(filename=synthetic_files['2018'], engine='compiled', **load_options(tmp_path))
+    assert standin_ckan.stats['records_upserted'] == 2*50
+    assert [checkpoint['complete'] for checkpoint in saved_checkpoints(tmp_path)] == [True]
+
+def test_two_pass_load_reopens_the_file_that_pl_pipeline_closed(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    crash_etl.main(filename=synthetic_files['2016'], fan_out=False, **load_options(tmp_path))
+    assert standin_ckan.stats['records_upserted'] == 2*50
+
+def test_replace_swaps_in_a_completely_loaded_resource(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    crash_etl.main(filename=synthetic_files['2016'], **load_options(tmp_path))
+    old_resources = [dict(r) for r in standin_ckan.resources]
+    old_id = old_resources[0]['id']
+    crash_etl.main(filename=synthetic_files['2016'], resource_id=old_id,
+            replace=True, engine='compiled', **load_options(tmp_path))
+    # The staging resource took the yearly resource's name and place (but not its ID).
+    assert [r['name'] for r in standin_ckan.resources] == ['2016 Crash Data', 'Cumulative Crash Data']
+    new_id = standin_ckan.resources[0]['id']
+    assert new_id != old_id
+    assert standin_ckan.resources[1] == old_resources[1]
+    assert old_id not in standin_ckan.records
+    rows = standin_ckan.records[new_id]
+    assert len(rows) == 50
+    assert len(set(row['CRASH_CRN'] for row in rows)) == 50
+    with open(str(tmp_path / 'uploaded.log')) as f:
+        assert f.read().startswith("Finished upserting data to {}".format(new_id))
+
+def test_replace_of_a_missing_resource_says_so(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    with pytest.raises(RuntimeError, match="Unable to find resource no-such-resource"):
+        crash_etl.main(filename=synthetic_files['2016'], resource_id='no-such-resource', replace=True, **load_options(tmp_path))
+
+def test_parallel_upserts_keep_the_last_version_of_a_repeated_crn(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    path = str(tmp_path / '2016-crashes.csv')
+    with open(synthetic_files['2016'], newline='') as f:
+        records = list(csv.reader(f))
+    crn_column, street_column = records[0].index('CRASH_CRN'), records[0].index('STREET_NAME')
+    later_version = list(records[3])
+    later_version[street_column] = 'LATER VERSION'
+    records.insert(40, later_version)
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(records)
+    crash_etl.main(filename=path, engine='compiled', parallel_upserts=4, **load_options(tmp_path))
+    assert standin_ckan.stats['records_upserted'] == 2*50 # The earlier version was dropped.
+    resource_ids = {r['name']: r['id'] for r in standin_ckan.resources}
+    rows = {row['CRASH_CRN']: row for row in standin_ckan.records[resource_ids['2016 Crash Data']]}
+    assert rows[records[3][crn_column]]['STREET_NAME'] == 'LATER VERSION'
+
+def test_the_mirror_is_only_kept_when_asked_for(crash_etl, synthetic_files, standin_ckan, tmp_path, monkeypatch):
+    options = load_options(tmp_path)
+    del options['mirror']
+    opened = []
+    monkeypatch.setattr(crash_etl, 'PublishedDataMirror', lambda *args, **kwargs: opened.append(args))
+    crash_etl.main(filename=synthetic_files['2016'], engine='compiled', **options)
+    assert opened == []
+
+def test_delta_loads_use_the_mirror_when_it_is_on(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    options = dict(load_options(tmp_path), delta=True, delta_index=str(tmp_path / 'delta-index.sqlite'), engine='compiled')
+    crash_etl.main(filename=synthetic_files['2016'], **options)
+    assert standin_ckan.stats['records_upserted'] == 2*50
+    crash_etl.main(filename=synthetic_files['2016'], **options)
+    assert standin_ckan.stats['records_upserted'] == 3*50 # Nothing new for the cumulative resource
+    assert not os.path.exists(options['delta_index'])
+    with open(str(tmp_path / 'uploaded.log')) as f:
+        assert "skipped 50 unchanged rows" in f.read()
+
+def test_backfill_only_loads_a_crn_from_the_last_file_for_its_year(crash_etl, synthetic_files, standin_ckan, tmp_path):
+    directory = tmp_path / 'yearly'
+    directory.mkdir()
+    with open(synthetic_files['2016'], newline='') as f:
+        records = list(csv.reader(f))
+    crn_column, street_column = records[0].index('CRASH_CRN'), records[0].index('STREET_NAME')
+    later_version = list(records[3])
+    later_version[street_column] = 'LATER VERSION'
+    with open(str(directory / '2016-crashes.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows(records)
+    with open(str(directory / '2016-a-few-more-crashes.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows([records[0], later_version])
+    crash_etl.backfill(str(directory), workers=1, collapse_duplicates=True, **load_options(tmp_path))
+    assert standin_ckan.stats['records_upserted'] == 2*50 # 49 rows from the yearly file and 1 from its supplement
+    resource_ids = {r['name']: r['id'] for r in standin_ckan.resources}
+    rows = {row['CRASH_CRN']: row for row in standin_ckan.records[resource_ids['2016 Crash Data']]}
+    assert len(rows) == 50
+    assert rows[records[3][crn_column]]['STREET_NAME'] == 'LATER VERSION'
+    with open(str(tmp_path / 'uploaded.log')) as f:
+        assert "(1 of them again in a later file)" in f.read()
@@ -0,0 +1,38 @@
+"""Tests of util.local_mirror and util.published_index, which share the
+row hashes and the batched key lookups."""
+from util.local_mirror import PublishedDataMirror, MirrorDeltaIndex
+from util.published_index import PublishedRowIndex, hash_row
+
+FIELDS = [{'id': 'CRASH_CRN', 'type': 'text'}, {'id': 'CRASH_YEAR', 'type': 'int'}, {'id': 'STREET_NAME', 'type': 'text'}]
+
+def rows(count, street='FORBES AVE'):
+    return [{'CRASH_CRN': str(2016000000 + k), 'CRASH_YEAR': 2016, 'STREET_NAME': street} for k in range(count)]
+
+def test_hashes_do_not_depend_on_key_order():
+    row = rows(1)[0]
+    assert hash_row(row) == hash_row(dict(reversed(list(row.items()))))
+
+def test_the_mirror_and_the_index_agree_on_what_changed(tmp_path):
+    mirror = PublishedDataMirror(str(tmp_path / 'mirror.sqlite'), FIELDS)
+    index = PublishedRowIndex(str(tmp_path / 'index.sqlite'), 'resource')
+    published = rows(1200) # More keys than one lookup takes
+    mirror.update(published)
+    index.record(index.changed_rows(published))
+    republished = rows(1200)
+    republished[700]['STREET_NAME'] = 'FIFTH AVE'
+    republished.append({'CRASH_CRN': '2016999999', 'CRASH_YEAR': 2016, 'STREET_NAME': 'PENN AVE'})
+    expected = [republished[700], republished[-1]]
+    assert [row for row, _ in mirror.changed_rows(republished)] == expected
+    assert [row for row, _ in index.changed_rows(republished)] == expected
+    assert mirror.changed_rows(republished) == index.changed_rows(republished)
+
+def test_delta_loads_can_use_the_mirror_as_their_index(tmp_path):
+    mirror = PublishedDataMirror(str(tmp_path / 'mirror.sqlite'), FIELDS)
+    delta_index = MirrorDeltaIndex(mirror)
+    delta_index.record(delta_index.changed_rows(rows(10)))
+    assert (mirror.new_count, delta_index.changed_count, delta_index.skipped_count) == (10, 10, 0)
+    changed = delta_index.changed_rows(rows(5) + rows(10, 'FIFTH AVE')[5:])
+    assert len(changed) == 5
+    delta_index.record(changed)
+    assert (mirror.changed_count, delta_index.changed_count, delta_index.skipped_count) == (5, 15, 5)
+    assert [row['STREET_NAME'] for row in mirror.rows(2016)] == ['FORBES AVE']*5 + ['FIFTH AVE']*5
@@ -0,0 +1,32 @@
+"""Tests of util.metrics."""
+import json
+
+from util.metrics import PipelineMetrics
+
+def test_upserts_of_unknown_size_are_counted_but_not_sized(tmp_path):
+    metrics = PipelineMetrics("Test run", metrics_log=str(tmp_path / 'metrics.jsonl'))
+    metrics.record_upsert('serial', 2000, None, 0.5)
+    metrics.record_upsert('parallel', 2000, 4000000, 0.25)
+    metrics.record_upsert('parallel', 1000, None, 0.25)
+    metrics.close()
+    totals = metrics.summary()['pipelines']
+    assert (totals['serial']['upserts'], totals['serial']['payload_bytes'], totals['serial']['unmeasured_upserts']) == (1, 0, 1)
+    assert (totals['parallel']['upserts'], totals['parallel']['payload_bytes'], totals['parallel']['unmeasured_upserts']) == (2, 4000000, 1)
+    message = metrics.summary_message()
+    assert "serial: 2000 rows upserted in 1 requests (size not measured," in message
+    assert "parallel: 3000 rows upserted in 2 requests (4.0 MB, not counting 1 requests of unmeasured size," in message
+    with open(str(tmp_path / 'metrics.jsonl')) as f:
+        events = [json.loads(line) for line in f]
+    assert [event['payload_bytes'] for event in events if event['event'] == 'upsert'] == [None, 4000000, None]
+
+def test_upserts_with_unknown_retries_are_not_counted_as_retry_free():
+    metrics = PipelineMetrics("Test run")
+    metrics.record_upsert('serial', 2000, 1000, 0.5, retries=None)
+    metrics.record_upsert('parallel', 2000, 1000, 0.5, retries=2)
+    metrics.record_upsert('parallel', 2000, 1000, 0.5, retries=None)
+    totals = metrics.summary()['pipelines']
+    assert (totals['serial']['retries'], totals['serial']['uncounted_retry_upserts']) == (0, 1)
+    assert (totals['parallel']['retries'], totals['parallel']['uncounted_retry_upserts']) == (2, 1)
+    message = metrics.summary_message()
+    assert "serial: 2000 rows upserted in 1 requests (0.0 MB, mean latency 0.50 s, max 0.50 s, retries not counted)" in message
+    assert "max 0.50 s, 2 retries, not counting those of 1 requests)" in message
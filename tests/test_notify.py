@@ -0,0 +1,113 @@
+"""Tests of util.notify.BatchedNotifier (with transports that just record
+what they're given, and a local HTTP stand-in for a Slack webhook)."""
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from util.notify import BatchedNotifier, SlackWebhookTransport
+
+class RecordingTransport(object):
+    def __init__(self):
+        self.digests = []
+        self.sent_at = []
+
+    def __call__(self, message):
+        self.sent_at.append(time.time())
+        self.digests.append(message)
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.time() + timeout
+        while len(self.digests) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return len(self.digests) >= count
+
+def failing_transport(message):
+    raise ConnectionError("The network is down.")
+
+@pytest.fixture
+def webhook():
+    """A local stand-in for a Slack webhook that answers with whatever
+    status code is set on it (200 by default)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            server.bodies.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(server.status_code)
+            self.end_headers()
+            self.wfile.write(b'invalid_payload')
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    server.bodies, server.status_code = [], 200
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_repeated_messages_are_sent_once_with_a_count():
+    transport = RecordingTransport()
+    notifier = BatchedNotifier(transport, min_interval=60)
+    notifier.notify("Starting.")
+    assert transport.wait_for(1) # The first digest goes out right away.
+    for k in range(3):
+        notifier.notify("Chunk failed.")
+    notifier.notify("Something else.")
+    notifier.close()
+    assert transport.digests == ["Starting.", "Chunk failed. (x3)\nSomething else."]
+
+def test_a_keyed_message_replaces_the_earlier_one_with_its_key():
+    transport = RecordingTransport()
+    notifier = BatchedNotifier(transport, min_interval=60, title="A load")
+    notifier.notify("Starting.")
+    assert transport.wait_for(1)
+    notifier.notify("Through chunk 1.", key='progress')
+    notifier.notify("Something else.")
+    notifier.notify("Through chunk 2.", key='progress')
+    notifier.close()
+    assert transport.digests == ["A load\nStarting.", "A load\nSomething else.\nThrough chunk 2."]
+
+def test_digests_are_at_least_min_interval_apart():
+    transport = RecordingTransport()
+    notifier = BatchedNotifier(transport, min_interval=0.5)
+    notifier.notify("First.")
+    assert transport.wait_for(1)
+    notifier.notify("Second.")
+    assert transport.wait_for(2) # Without waiting for close()
+    notifier.close()
+    assert transport.digests == ["First.", "Second."]
+    assert transport.sent_at[1] - transport.sent_at[0] >= 0.45
+
+def test_transport_errors_never_reach_notify_or_close(capsys):
+    notifier = BatchedNotifier(failing_transport, min_interval=0)
+    notifier.notify("First.")
+    notifier.close()
+    assert (notifier.sent_count, notifier.failed_count) == (0, 1)
+    assert "Unable to send a notification digest: The network is down." in capsys.readouterr().out
+
+def test_error_responses_never_reach_notify_or_close(webhook):
+    webhook.status_code = 500
+    notifier = BatchedNotifier(SlackWebhookTransport(webhook.url, timeout=5), min_interval=0)
+    notifier.notify("First.")
+    notifier.close()
+    assert (notifier.sent_count, notifier.failed_count) == (0, 1)
+    assert webhook.bodies[0]['text'].startswith("First.")
+
+def test_an_unreachable_webhook_never_reaches_notify_or_close(webhook):
+    url = webhook.url
+    webhook.shutdown()
+    webhook.server_close() # Nothing listens at the URL any more.
+    notifier = BatchedNotifier(SlackWebhookTransport(url, timeout=5), min_interval=0)
+    notifier.notify("First.")
+    notifier.close()
+    assert (notifier.sent_count, notifier.failed_count) == (0, 1)
+
+def test_digests_that_get_a_200_response_are_counted_as_sent(webhook):
+    notifier = BatchedNotifier(SlackWebhookTransport(webhook.url, timeout=5), min_interval=0, title="A load")
+    notifier.notify("First.")
+    notifier.close()
+    assert (notifier.sent_count, notifier.failed_count) == (1, 0)
+    assert webhook.bodies[0]['text'].startswith("A load\nFirst. (Sent from notify.py")
@@ -0,0 +1,115 @@
+"""Check that the compiled transform engine (and the chunk-at-a-time type
+fixes that it falls back on, fix_types_columnar) give
+exactly what CrashSchema and ExtendedCrashSchema give when rows are loaded
+and dumped one at a time (the way pl.Pipeline does it), key order
+included, and that they fail on the same rows (with the same kind of
+exception) as the schemas do."""
+import pytest
+
+ENGINES = ['compiled', 'fix_types_columnar']
+SCHEMA_FOR_FORMAT = {'2016': 'CrashSchema', '2018': 'ExtendedCrashSchema'}
+
+# Changes to an ordinary row, each of which the schemas either handle or reject.
+EDGE_CASES = {
+    'empty strings': {'street_name': '', 'district': '', 'crash_county': '', 'police_agcy': ''},
+    'empty string in an integer field': {'day_of_week': ''},
+    'empty string in a boolean field': {'interstate': ''},
+    'empty estimated hours closed': {'est_hrs_closed': ''},
+    'Yes and No booleans': {'interstate': 'Yes', 'wet_road': 'No', 'deer_related': 'Yes'},
+    'None booleans': {'interstate': None, 'wet_road': None, 'deer_related': None},
+    '0 and 1 booleans': {'interstate': '1', 'wet_road': '0'},
+    'mixed booleans': {'interstate': 'Yes', 'wet_road': '0', 'icy_road': None, 'fatal': 'No'},
+    'unexpected boolean': {'interstate': 'Maybe'},
+    'non-numeric integer': {'day_of_week': 'Tuesday'},
+    'fractional integer': {'fatal_count': '1.5'},
+    'padded integer': {'day_of_week': '07'},
+    'non-numeric float': {'dec_lat': 'north'},
+    'float-valued estimated hours closed': {'est_hrs_closed': '3.5', 'cons_zone_spd_lim': '45.0'},
+    'non-numeric estimated hours closed': {'est_hrs_closed': 'a few'},
+    'short and long codes': {'crash_county': '2', 'police_agcy': '0001234', 'time_of_day': '130', 'route': '1'},
+    'null key': {'crash_crn': None},
+}
+EXTENDED_EDGE_CASES = {
+    'Yes school bus unit': {'school_bus_unit': 'Yes'},
+    'No school bus unit': {'school_bus_unit': 'No'},
+    'None school bus unit': {'school_bus_unit': None},
+    'empty school bus unit': {'school_bus_unit': ''},
+    'unexpected school bus unit': {'school_bus_unit': 'Y'},
+    'non-numeric injury count': {'tot_inj_count': 'several'},
+}
+
+def schema_output(schema, rows):
+    """Load and dump each row with a fresh instance of the schema."""
+    schema_instance = schema()
+    output = []
+    for row in rows:
+        loaded = schema_instance.load(row)
+        if loaded.errors:
+            raise RuntimeError("There were errors in the input data: {}".format(loaded.errors))
+        output.append(schema_instance.dump(loaded.data).data)
+    return output
+
+def engine_output(crash_etl, schema, rows, engine):
+    if engine == 'fix_types_columnar': # The fixes for the whole chunk and then marshmallow without them
+        return crash_etl.transform_chunk(crash_etl.fix_types_columnar(rows), schema(context={'types_fixed': True}), 'marshmallow')
+    return crash_etl.transform_chunk(rows, schema(context={'types_fixed': True}), engine)
+
+def outcome(function, schema, rows):
+    """Return the rows (as lists of key/value pairs) or the type of the exception raised."""
+    try:
+        return [list(row.items()) for row in function(schema, [dict(row) for row in rows])]
+    except Exception as e:
+        return type(e)
+
+def file_rows(crash_etl, path):
+    with crash_etl.CrashFile(path) as crash_file:
+        return list(crash_file.rows()), crash_file.schema
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('data_format', ['2016', '2018'])
+def test_engines_match_schema_on_synthetic_files(crash_etl, synthetic_files, data_format, engine):
+    rows, schema = file_rows(crash_etl, synthetic_files[data_format])
+    assert schema.__name__ == SCHEMA_FOR_FORMAT[data_format]
+    expected = outcome(schema_output, schema, rows)
+    assert isinstance(expected, list) and len(expected) == len(rows)
+    assert outcome(lambda s, r: engine_output(crash_etl, s, r, engine), schema, rows) == expected
+
+def edge_case_rows(crash_etl, synthetic_files, data_format):
+    rows, schema = file_rows(crash_etl, synthetic_files[data_format])
+    cases = dict(EDGE_CASES, **(EXTENDED_EDGE_CASES if data_format == '2018' else {}))
+    return {name: dict(rows[0], **changes) for name, changes in cases.items()}, rows, schema
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('data_format', ['2016', '2018'])
+def test_engines_match_schema_on_edge_values(crash_etl, synthetic_files, data_format, engine):
+    edge_rows, rows, schema = edge_case_rows(crash_etl, synthetic_files, data_format)
+    run_engine = lambda s, r: engine_output(crash_etl, s, r, engine)
+    for name, row in edge_rows.items():
+        # Each one both alone and in the middle of a chunk of ordinary rows
+        # (which is where the compiled engine has to fall back on marshmallow).
+        for chunk in [[row], rows[:5] + [row] + rows[5:10]]:
+            assert outcome(run_engine, schema, chunk) == outcome(schema_output, schema, chunk), name
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('data_format', ['2016', '2018'])
+def test_engines_match_schema_on_all_accepted_edge_values_at_once(crash_etl, synthetic_files, data_format, engine):
+    edge_rows, rows, schema = edge_case_rows(crash_etl, synthetic_files, data_format)
+    accepted = [row for row in edge_rows.values() if isinstance(outcome(schema_output, schema, [row]), list)]
+    assert len(accepted) >= 8
+    chunk = accepted + rows[:10]
+    assert outcome(lambda s, r: engine_output(crash_etl, s, r, engine), schema, chunk) == outcome(schema_output, schema, chunk)
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('data_format', ['2016', '2018'])
+def test_engines_match_schema_on_blank_lines_and_short_records(crash_etl, synthetic_files, data_format, engine, tmp_path):
+    with open(synthetic_files[data_format]) as f:
+        lines = f.readlines()
+    crn = lines[1].split(',')[0]
+    lines = lines[:3] + ['\n', '{},11\n'.format(crn), '\n', '{}\n'.format(crn)] + lines[3:] + ['\n', '\n']
+    path = tmp_path / '{}-ragged-crashes.csv'.format(data_format)
+    path.write_text(''.join(lines))
+    rows, schema = file_rows(crash_etl, str(path))
+    assert len(rows) == len(lines) - 4 - 1 # The blank lines and the header
+    expected = outcome(schema_output, schema, rows)
+    assert isinstance(expected, list)
+    assert outcome(lambda s, r: engine_output(crash_etl, s, r, engine), schema, rows) == expected
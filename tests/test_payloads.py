@@ -0,0 +1,60 @@
+"""Tests of util.payloads and of DatastoreUpserter's fallback to
+uncompressed requests (against benchmarks.standin_ckan)."""
+import gzip, json
+
+import pytest
+
+from benchmarks.standin_ckan import StandInCKAN
+from util.datastore import DatastoreUpserter
+from util.payloads import build_upsert_payload, orjson
+
+ENCODERS = ['json'] + (['orjson'] if orjson is not None else [])
+
+RECORDS = [{'CRASH_CRN': '2016000001', 'DAY_OF_WEEK': 3, 'DEC_LAT': 40.4406, 'STREET_NAME': 'FORBES "AVE"'},
+        {'CRASH_CRN': '2016000002', 'DAY_OF_WEEK': None, 'DEC_LAT': -0.5, 'STREET_NAME': 'Café \\ 5%'}]
+
+@pytest.mark.parametrize('encoder', ENCODERS)
+@pytest.mark.parametrize('as_tuples', [False, True])
+def test_payloads_decode_to_the_records(encoder, as_tuples):
+    keys = tuple(RECORDS[0].keys())
+    entries = [(keys, tuple(r.values())) if as_tuples else (None, r) for r in RECORDS]
+    payload = build_upsert_payload('resource-id', 'upsert', entries*3, encoder=encoder, rows_per_piece=2)
+    body = b''.join(payload)
+    assert len(payload) == len(body)
+    assert payload.content_encoding is None
+    assert json.loads(body.decode('utf-8')) == {'resource_id': 'resource-id', 'method': 'upsert', 'force': True, 'records': RECORDS*3}
+
+def test_compressed_payloads_decompress_to_the_same_body():
+    entries = [(None, r) for r in RECORDS]
+    payload = build_upsert_payload('resource-id', 'insert', entries, encoder='json', compress=True)
+    assert payload.content_encoding == 'gzip'
+    assert gzip.decompress(b''.join(payload)) == b''.join(build_upsert_payload('resource-id', 'insert', entries, encoder='json'))
+
+def test_unknown_encoders_are_refused():
+    with pytest.raises(ValueError, match="Unknown JSON encoder"):
+        build_upsert_payload('resource-id', 'upsert', [], encoder='yaml')
+
+def records(start, count):
+    return [{'CRASH_CRN': str(k)} for k in range(start, start + count)]
+
+@pytest.mark.parametrize('status_code', [400, 415])
+def test_turned_down_gzipped_requests_are_resent_uncompressed(status_code):
+    with StandInCKAN(accept_gzip=False, gzip_rejection_status=status_code, keep_records=True) as ckan:
+        datastore = DatastoreUpserter(ckan.url, 'test-key', 'resource-id', max_in_flight=1, backoff=0.0, compress_requests=True)
+        datastore.submit(records(0, 10))
+        datastore.flush()
+        assert ckan.stats['gzip_rejections'] == 1
+        assert datastore.compress_requests is False
+        assert datastore.retry_count == 0
+        datastore.submit(records(10, 10)) # Later batches aren't compressed at all.
+        datastore.flush()
+        assert ckan.stats['gzip_rejections'] == 1
+        assert [r['CRASH_CRN'] for r in ckan.records['resource-id']] == [str(k) for k in range(20)]
+
+def test_gzipped_requests_are_kept_when_accepted():
+    with StandInCKAN(keep_records=True) as ckan:
+        datastore = DatastoreUpserter(ckan.url, 'test-key', 'resource-id', max_in_flight=1, compress_requests=True)
+        datastore.submit(records(0, 10))
+        datastore.flush()
+        assert datastore.compress_requests is True
+        assert len(ckan.records['resource-id']) == 10
@@ -0,0 +1,24 @@
+"""Tests of util.request_sizes, against benchmarks.standin_ckan."""
+import threading
+
+import requests
+
+from benchmarks.standin_ckan import StandInCKAN
+from util.request_sizes import SentRequestSizes
+
+def test_sizes_of_requests_sent_by_requests_post_are_recorded():
+    with StandInCKAN() as ckan:
+        with SentRequestSizes() as sent:
+            requests.post(ckan.url + 'api/3/action/datastore_upsert', data=b'{"records": []}')
+            requests.post(ckan.url + 'api/3/action/datastore_upsert', data='{"records": [{}]}')
+        requests.post(ckan.url + 'api/3/action/datastore_upsert', data=b'{}') # Not recorded
+        assert sent.sizes == [15, 17]
+        assert sent.total() == 32 == ckan.stats['bytes_received'] - 2
+
+def test_other_threads_requests_are_not_recorded():
+    with StandInCKAN() as ckan:
+        with SentRequestSizes() as sent:
+            thread = threading.Thread(target=requests.post, args=(ckan.url + 'api/3/action/datastore_upsert',), kwargs={'data': b'{}'})
+            thread.start()
+            thread.join()
+        assert sent.total() is None
@@ -0,0 +1,81 @@
+import os, json, hashlib, threading
+
+def file_signature(path):
+    """Return what a checkpoint recognizes a file by: its name, size and
+    modification time (which, unlike a hash of its contents, doesn't take
+    an extra read of the whole file)."""
+    stat = os.stat(path)
+    return {'name': os.path.basename(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+class LoadCheckpoint(object):
+    """Keeps track of which chunks of a file have been committed to a set of
+    resources, in a small JSON file (named after hashes of the file's name
+    and size and of the resources) in checkpoint_dir, so that an
+    interrupted load can be resumed from the first uncommitted chunk.
+
+    The saved progress only applies if the file's signature (see
+    file_signature) still matches, so a file that has been rewritten (or
+    even just touched) since the checkpoint was saved gets loaded from
+    the start.
+
+    Chunks may be committed out of order (when upserts run in parallel), so
+    the checkpoint only advances past a chunk once every chunk before it
+    has been committed too."""
+    def __init__(self, checkpoint_dir, target, resources, chunk_size):
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        self.target = target
+        self.resources = [str(r) for r in resources]
+        self.chunk_size = chunk_size
+        self.file_signature = file_signature(target)
+        file_key = hashlib.sha1('{name}|{size}'.format(**self.file_signature).encode('utf-8')).hexdigest()
+        resource_hash = hashlib.sha1('|'.join(self.resources).encode('utf-8')).hexdigest()
+        self.path = os.path.join(checkpoint_dir, '{}-{}.json'.format(file_key[:16], resource_hash[:16]))
+        self.lock = threading.Lock()
+        self.committed_out_of_order = set()
+        self.state = {'target': target, 'resources': self.resources, 'chunk_size': chunk_size,
+                'file': self.file_signature, 'last_committed_chunk': -1, 'complete': False}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved.get('chunk_size') == chunk_size and saved.get('file') == self.file_signature:
+                self.state = saved
+            elif saved.get('last_committed_chunk', -1) >= 0:
+                print("Ignoring the checkpoint in {}, which was saved for a different version of {}.".format(self.path, target))
+
+    def last_committed_chunk(self):
+        """Return the index of the last chunk that (along with every chunk before it) was committed, or -1."""
+        return self.state['last_committed_chunk']
+
+    def is_complete(self):
+        return self.state['complete']
+
+    def reset(self):
+        """Start over (for a run that isn't resuming)."""
+        with self.lock:
+            self.committed_out_of_order = set()
+            self.state['last_committed_chunk'] = -1
+            self.state['complete'] = False
+            self._save()
+
+    def commit(self, chunk_index):
+        with self.lock:
+            self.committed_out_of_order.add(chunk_index)
+            last = self.state['last_committed_chunk']
+            while last + 1 in self.committed_out_of_order:
+                last += 1
+                self.committed_out_of_order.remove(last)
+            if last != self.state['last_committed_chunk']:
+                self.state['last_committed_chunk'] = last
+                self._save()
+
+    def finish(self):
+        with self.lock:
+            self.state['complete'] = True
+            self._save()
+
+    def _save(self):
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temporary_path, self.path) # So a crash can't leave a half-written checkpoint
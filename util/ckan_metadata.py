@@ -0,0 +1,61 @@
+import os, json, time, threading
+
+class PackageMetadataCache(object):
+    """Caches the results of package_show calls for ttl seconds, so that
+    things like looking up resource IDs by name don't cost a round-trip
+    to CKAN every time.
+
+    RemoteCKAN instances (one per site and API key) are kept around too,
+    so that their HTTP sessions (and connections) get reused.
+
+    If cache_file is given, the cached metadata is also saved there, so
+    that a series of runs (e.g., a batch of cron jobs) can share it.
+    Anything that changes a package (like creating a resource) should be
+    followed by a call to invalidate()."""
+    def __init__(self, ttl=300, cache_file=None):
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.remotes = {}
+        self.entries = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.entries = json.load(f)
+            except ValueError: # Just start over if the file is corrupted.
+                self.entries = {}
+
+    def remote(self, site, API_key=None):
+        import ckanapi, requests # (Only when needed, since they're slow to import.)
+        with self.lock:
+            if (site, API_key) not in self.remotes:
+                self.remotes[(site, API_key)] = ckanapi.RemoteCKAN(site, apikey=API_key, session=requests.Session())
+            return self.remotes[(site, API_key)]
+
+    def package_show(self, site, package_id, API_key=None):
+        key = '{} {}'.format(site, package_id)
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and time.time() - entry['fetched_at'] < self.ttl:
+                return entry['metadata']
+        metadata = self.remote(site, API_key).action.package_show(id=package_id)
+        with self.lock:
+            self.entries[key] = {'fetched_at': time.time(), 'metadata': metadata}
+            self._save()
+        return metadata
+
+    def invalidate(self, site=None, package_id=None):
+        """Forget the cached metadata for the given package (or for everything)."""
+        with self.lock:
+            if site is None or package_id is None:
+                self.entries = {}
+            else:
+                self.entries.pop('{} {}'.format(site, package_id), None)
+            self._save()
+
+    def _save(self):
+        if self.cache_file is not None:
+            temporary_path = self.cache_file + '.tmp'
+            with open(temporary_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(temporary_path, self.cache_file)
@@ -0,0 +1,154 @@
+import json, collections
+
+from util.repeated_keys import compact_key
+
+class DataQualityReport(object):
+    """Counts the problems in a file's rows that would otherwise only show
+    up partway through a load (or not at all), working through each chunk
+    a column at a time, so that a whole year can be checked in seconds.
+
+    The rows are expected in extracted form (lowercased field names, None
+    for empty values). add_chunk() checks:
+        * the key field for null and repeated values,
+        * the boolean fields for values other than 0/1/Yes/No (the
+          values that make the type fixes raise a KeyError),
+        * the fields in length_by_field for values that would get
+          zero-padded (or that are already too long).
+    The columns of the file are also compared to the schema's fields
+    (only the ones in required_fields, which the processing can't do
+    without, count as problems).
+    Rows that still fail to convert can be noted with
+    add_conversion_errors().
+
+    Only counts and a few examples of each problem are kept, except for
+    the key values seen so far (needed to spot repeats), which are stored
+    as integers where that loses nothing (a few MB for a year of crash
+    data)."""
+    EXPECTED_BOOLEAN_VALUES = {'0', '1', 'Yes', 'No', '', None}
+    EXAMPLE_COUNT = 5
+
+    def __init__(self, schema_fields, fieldnames, key_field, boolean_fields=(), length_by_field=None, required_fields=()):
+        self.key_field = key_field
+        self.fieldnames = list(fieldnames)
+        self.missing_columns = [f for f in schema_fields if f not in self.fieldnames]
+        self.missing_required_columns = [f for f in [key_field] + list(required_fields) if f not in self.fieldnames]
+        self.extra_columns = [f for f in self.fieldnames if f not in schema_fields]
+        self.boolean_fields = [f for f in boolean_fields if f in self.fieldnames]
+        self.length_by_field = {f: length for f, length in (length_by_field or {}).items() if f in self.fieldnames}
+        self.row_count = 0
+        self.null_key_count = 0
+        self.duplicate_key_count = 0
+        self.duplicate_key_examples = []
+        self.seen_keys = set()
+        self.unexpected_values = collections.defaultdict(collections.Counter)
+        self.padded_counts = collections.Counter()
+        self.too_long_counts = collections.Counter()
+        self.conversion_error_count = 0
+        self.null_key_conversion_error_count = 0 # Rows that are also counted as null keys
+        self.conversion_errors_by_field = collections.Counter()
+        self.conversion_error_examples = []
+
+    def add_chunk(self, rows):
+        """Check a chunk of rows. Unexpected boolean values are replaced
+        with None (after being counted), so that the rest of each row can
+        still be run through the type fixes and converted."""
+        self.row_count += len(rows)
+        if self.key_field in self.fieldnames:
+            for value in [row[self.key_field] for row in rows]:
+                if value is None:
+                    self.null_key_count += 1
+                    continue
+                key = compact_key(value)
+                if key in self.seen_keys:
+                    self.duplicate_key_count += 1
+                    if len(self.duplicate_key_examples) < self.EXAMPLE_COUNT:
+                        self.duplicate_key_examples.append(value)
+                else:
+                    self.seen_keys.add(key)
+
+        expected = self.EXPECTED_BOOLEAN_VALUES
+        for field in self.boolean_fields:
+            column = [row[field] for row in rows]
+            if expected.issuperset(column):
+                continue
+            for row, value in zip(rows, column):
+                if value not in expected:
+                    self.unexpected_values[field][value] += 1
+                    row[field] = None
+
+        for field, length in self.length_by_field.items():
+            lengths = collections.Counter(len(row[field]) for row in rows if row[field] is not None)
+            for value_length, count in lengths.items():
+                if 0 < value_length < length:
+                    self.padded_counts[field] += count
+                elif value_length > length:
+                    self.too_long_counts[field] += count
+
+    def add_conversion_errors(self, row, errors):
+        """Note a row that the schema rejected, with errors mapping field names to messages.
+        An error for a null key is left out, since add_chunk() already counted it."""
+        if row.get(self.key_field) is None:
+            errors = {field: messages for field, messages in errors.items() if field != self.key_field}
+            if len(errors) == 0:
+                return
+            self.null_key_conversion_error_count += 1
+        self.conversion_error_count += 1
+        self.conversion_errors_by_field.update(errors.keys())
+        if len(self.conversion_error_examples) < self.EXAMPLE_COUNT:
+            self.conversion_error_examples.append({'key': row.get(self.key_field), 'errors': errors})
+
+    def problem_count(self):
+        """Return the number of problems that would make a load fail or publish bad keys
+        (counting a row with a null key and other conversion errors only once)."""
+        return (len(self.missing_required_columns) + self.null_key_count + self.duplicate_key_count
+                + sum(sum(counter.values()) for counter in self.unexpected_values.values())
+                + self.conversion_error_count - self.null_key_conversion_error_count)
+
+    def to_json_object(self):
+        return {'row_count': self.row_count,
+                'missing_columns': self.missing_columns,
+                'missing_required_columns': self.missing_required_columns,
+                'extra_columns': self.extra_columns,
+                'null_keys': self.null_key_count,
+                'duplicate_keys': self.duplicate_key_count,
+                'duplicate_key_examples': self.duplicate_key_examples,
+                'unexpected_boolean_values': {field: dict(counter.most_common(self.EXAMPLE_COUNT))
+                    for field, counter in sorted(self.unexpected_values.items())},
+                'unexpected_boolean_value_counts': {field: sum(counter.values())
+                    for field, counter in sorted(self.unexpected_values.items())},
+                'padded_values': dict(sorted(self.padded_counts.items())),
+                'too_long_values': dict(sorted(self.too_long_counts.items())),
+                'conversion_errors': self.conversion_error_count,
+                'conversion_errors_by_field': dict(sorted(self.conversion_errors_by_field.items())),
+                'conversion_error_examples': self.conversion_error_examples,
+                'problems': self.problem_count()}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json_object(), f, indent=4, default=str)
+
+    def describe(self, key_name=None):
+        """Return the report as lines of text."""
+        key_name = key_name or self.key_field
+        lines = ["Checked {} rows.".format(self.row_count)]
+        if len(self.missing_columns) > 0:
+            lines.append("Columns missing from the file (relative to the schema): {}".format(', '.join(self.missing_columns)))
+        if len(self.missing_required_columns) > 0:
+            lines.append("Columns that the processing needs but the file lacks: {}".format(', '.join(self.missing_required_columns)))
+        if len(self.extra_columns) > 0:
+            lines.append("Columns that the schema will drop: {}".format(', '.join(self.extra_columns)))
+        lines.append("{} rows have no {} value.".format(self.null_key_count, key_name))
+        lines.append("{} rows repeat an earlier {} value{}.".format(self.duplicate_key_count, key_name,
+            " (e.g., {})".format(', '.join(self.duplicate_key_examples)) if self.duplicate_key_count > 0 else ""))
+        for field, counter in sorted(self.unexpected_values.items()):
+            lines.append("{} has {} unexpected values: {}".format(field, sum(counter.values()),
+                ', '.join('{!r} ({})'.format(value, count) for value, count in counter.most_common(self.EXAMPLE_COUNT))))
+        for field, count in sorted(self.padded_counts.items()):
+            lines.append("{} values of {} will be zero-padded to {} characters.".format(count, field, self.length_by_field[field]))
+        for field, count in sorted(self.too_long_counts.items()):
+            lines.append("{} values of {} are longer than {} characters.".format(count, field, self.length_by_field[field]))
+        if self.conversion_error_count > 0:
+            lines.append("{} rows fail to convert (by field: {}).".format(self.conversion_error_count,
+                ', '.join('{} ({})'.format(field, count) for field, count in sorted(self.conversion_errors_by_field.items()))))
+        lines.append("{} problems found.".format(self.problem_count()) if self.problem_count() > 0 else "No problems found.")
+        return lines
@@ -0,0 +1,181 @@
+import time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from util.row_block import RowBlock
+from util.payloads import build_upsert_payload
+
+RETRYABLE_STATUS_CODES = [409, 500, 502, 503, 504]
+
+class DatastoreUpserter(object):
+    """Upserts records to a CKAN datastore resource with several batches
+    in flight at once (rather than waiting for each HTTP round-trip before
+    sending the next batch).
+
+    Records passed to submit() are regrouped into batches whose size adapts
+    to how long the requests take: batches grow while the server answers
+    quickly and shrink when requests get slow, get too big (see
+    max_payload_bytes) or fail. Failed requests with the status codes in
+    RETRYABLE_STATUS_CODES (or connection errors) are retried with
+    exponential back-off.
+
+    The records can be given as a list of dicts or as a RowBlock, in which
+    case they are kept as value tuples until their batch gets encoded.
+
+    Note that batches in flight at the same time can finish in any order,
+    so if the same key appears in two different batches, which version
+    ends up in the datastore is not determined. (crash-etl.py collapses
+    repeated keys first whenever max_in_flight is more than 1.)
+
+    Request bodies are built by util.payloads.build_upsert_payload, with
+    the given encoder ('auto', 'orjson' or 'json'). With
+    compress_requests=True, they're gzipped; if the server turns a gzipped
+    request down (with a 400 or 415 response), that batch and every later
+    one are sent uncompressed instead.
+
+    If a util.metrics.PipelineMetrics is passed as metrics, every upserted
+    batch is recorded to it under the name metrics_label (with the number
+    of bytes actually sent)."""
+    def __init__(self, site, API_key, resource_id, method='upsert',
+            max_in_flight=4, batch_size=2000, min_batch_size=250,
+            max_batch_size=10000, target_latency=5.0,
+            max_payload_bytes=8*1024*1024, max_retries=5, backoff=2.0,
+            metrics=None, metrics_label=None, encoder='auto', compress_requests=False):
+        self.url = site.rstrip('/') + '/api/3/action/datastore_upsert'
+        self.API_key = API_key
+        self.resource_id = resource_id
+        self.method = method
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self.metrics_label = metrics_label
+        self.encoder = encoder
+        self.compress_requests = compress_requests
+
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.pending = [] # Records waiting to be put into a batch
+        self.futures = []
+        self.retry_count = 0
+
+    def submit(self, records, on_success=None):
+        """Queue the records for upserting. This only blocks if max_in_flight
+        batches are already being sent. on_success (if given) is called
+        (with no arguments) once all of the records have been upserted."""
+        self.raise_any_errors()
+        tracker = None
+        if on_success is not None and len(records) > 0:
+            # The records may get split across batches, so wait for all of them.
+            tracker = {'remaining': len(records), 'on_success': on_success}
+        if isinstance(records, RowBlock):
+            keys = records.keys
+            self.pending += [(keys, values, tracker) for values in records.values]
+        else:
+            self.pending += [(None, record, tracker) for record in records]
+        while len(self.pending) >= self.batch_size:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self._send(batch)
+
+    def flush(self):
+        """Send any remaining records and wait for everything in flight,
+        raising the first error encountered."""
+        if len(self.pending) > 0:
+            batch, self.pending = self.pending, []
+            self._send(batch)
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def send_pending(self):
+        """Send the records that haven't made up a whole batch yet, without
+        waiting for them to be upserted."""
+        self.raise_any_errors()
+        if len(self.pending) > 0:
+            batch, self.pending = self.pending, []
+            self._send(batch)
+
+    def raise_any_errors(self):
+        for future in self.futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self.futures = [f for f in self.futures if not f.done()]
+
+    def _send(self, batch):
+        self.slots.acquire()
+        future = self.executor.submit(self._upsert_batch, batch)
+        future.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(future)
+
+    def _payload_and_headers(self, batch):
+        payload = build_upsert_payload(self.resource_id, self.method,
+                [(keys, record) for keys, record, _ in batch],
+                encoder=self.encoder, compress=self.compress_requests)
+        headers = {'Content-Type': 'application/json', 'Authorization': self.API_key}
+        if payload.content_encoding is not None:
+            headers['Content-Encoding'] = payload.content_encoding
+        return payload, headers
+
+    def _upsert_batch(self, batch):
+        payload, headers = self._payload_and_headers(batch)
+        for attempt in range(self.max_retries + 1):
+            start = time.time()
+            try:
+                response = self.session.post(self.url, data=payload, headers=headers)
+                status_code = response.status_code
+                if status_code in [400, 415] and payload.content_encoding is not None:
+                    # The server doesn't take compressed requests, so stop compressing them.
+                    with self.lock:
+                        if self.compress_requests:
+                            print("{} turned down a gzipped datastore_upsert request, so requests will be sent uncompressed.".format(self.url))
+                        self.compress_requests = False
+                    payload, headers = self._payload_and_headers(batch)
+                    response = self.session.post(self.url, data=payload, headers=headers)
+                    status_code = response.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status_code, response = None, e
+            latency = time.time() - start
+            if status_code == 200:
+                if self.metrics is not None:
+                    self.metrics.record_upsert(self.metrics_label, len(batch), len(payload), latency, retries=attempt)
+                self._adapt_batch_size(len(batch), len(payload), latency)
+                self._report_success(batch)
+                return len(batch)
+            if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+                raise RuntimeError("datastore_upsert to {} failed with status code {}: {}".format(self.resource_id, status_code, response.text))
+            with self.lock:
+                self.retry_count += 1
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * 2**attempt * (1 + random.random()))
+        raise RuntimeError("datastore_upsert to {} still failing after {} retries (last result: {})".format(self.resource_id, self.max_retries, status_code or response))
+
+    def _adapt_batch_size(self, record_count, payload_bytes, latency):
+        with self.lock:
+            if latency > 0:
+                size = int(record_count * self.target_latency / latency)
+            else:
+                size = self.max_batch_size
+            size = min(size, 2*self.batch_size) # Don't change things too abruptly.
+            size = max(size, self.batch_size // 2)
+            bytes_per_record = payload_bytes / max(record_count, 1)
+            size = min(size, int(self.max_payload_bytes / bytes_per_record))
+            self.batch_size = max(self.min_batch_size, min(self.max_batch_size, size))
+
+    def _report_success(self, batch):
+        callbacks = []
+        with self.lock:
+            for _, _, tracker in batch:
+                if tracker is not None:
+                    tracker['remaining'] -= 1
+                    if tracker['remaining'] == 0:
+                        callbacks.append(tracker['on_success'])
+        for on_success in callbacks:
+            on_success()
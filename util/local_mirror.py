@@ -0,0 +1,175 @@
+import sqlite3, threading, time
+
+from util.published_index import hash_row, stored_hashes
+
+SQLITE_TYPES = {'int': 'INTEGER', 'float': 'REAL', 'numeric': 'REAL', 'bool': 'INTEGER', 'text': 'TEXT'}
+
+class PublishedDataMirror(object):
+    """A local SQLite copy of everything that has been published to a CKAN
+    resource (like the cumulative crash data), with a column for each field,
+    keyed by key_field (CRASH_CRN) and indexed by partition_field
+    (CRASH_YEAR), so that questions like "what changed in 2016?" can be
+    answered (and the resource rebuilt) without paging it back out of the
+    datastore.
+
+    Every row passed to update() is stored with a content hash and the time
+    it last changed, and each new or changed row is also noted in the
+    changes table. Fields that show up later (like the ones added to the
+    2017 data) are added as new columns.
+
+        mirror = PublishedDataMirror('cumulative-crash-mirror.sqlite', fields)
+        mirror.update(rows)
+        for change in mirror.changes(2016): ..."""
+    def __init__(self, path, fields=None, key_field='CRASH_CRN', partition_field='CRASH_YEAR'):
+        self.path = path
+        self.key_field = key_field
+        self.partition_field = partition_field
+        self.new_count = 0
+        self.changed_count = 0
+        self.unchanged_count = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS mirror_fields (position INTEGER, id TEXT PRIMARY KEY, type TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS changes (key TEXT, partition_value, changed_at REAL, change TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS changes_by_partition ON changes (partition_value, changed_at)")
+        self.fields = self.connection.execute("SELECT id, type FROM mirror_fields ORDER BY position").fetchall()
+        if len(self.fields) == 0 and fields is None:
+            fields = [{'id': key_field, 'type': 'text'}, {'id': partition_field, 'type': 'int'}]
+        if fields is not None:
+            self.add_fields(fields)
+
+    def add_fields(self, fields):
+        """Make sure that there's a column for each of the given CKAN fields
+        (dicts with 'id' and 'type' keys)."""
+        with self.lock:
+            known = set(field_id for field_id, _ in self.fields)
+            creating_table = (len(known) == 0)
+            if creating_table:
+                columns = ', '.join('"{}" {}'.format(f['id'], SQLITE_TYPES.get(f['type'], 'TEXT')) for f in fields)
+                self.connection.execute('CREATE TABLE IF NOT EXISTS rows ({}, _row_hash TEXT, _changed_at REAL, PRIMARY KEY ("{}"))'.format(columns, self.key_field))
+                self.connection.execute('CREATE INDEX IF NOT EXISTS rows_by_partition ON rows ("{}")'.format(self.partition_field))
+            for f in fields:
+                if f['id'] in known:
+                    continue
+                if not creating_table:
+                    self.connection.execute('ALTER TABLE rows ADD COLUMN "{}" {}'.format(f['id'], SQLITE_TYPES.get(f['type'], 'TEXT')))
+                self.connection.execute("INSERT INTO mirror_fields (position, id, type) VALUES (?, ?, ?)", (len(self.fields), f['id'], f['type']))
+                self.fields.append((f['id'], f['type']))
+                known.add(f['id'])
+            self.connection.commit()
+
+    def stored_hashes(self, keys):
+        return stored_hashes(self.connection, 'SELECT "{0}", _row_hash FROM rows WHERE "{0}" IN ({{}})'.format(self.key_field), keys)
+
+    def changed_rows(self, rows):
+        """Return the rows that are new or that differ from the stored
+        versions, along with their hashes (which can be passed on to
+        update())."""
+        hashes = [hash_row(row) for row in rows]
+        with self.lock:
+            stored = self.stored_hashes([str(row[self.key_field]) for row in rows])
+        return [(row, h) for row, h in zip(rows, hashes) if stored.get(str(row[self.key_field])) != h]
+
+    def update(self, rows, hashes=None):
+        """Store the rows (dicts keyed by field ID), replacing any earlier
+        versions, and note which ones are new or changed. (hashes, if
+        given, are the rows' hashes, as changed_rows() returns them.)"""
+        if len(rows) == 0:
+            return
+        if hashes is None:
+            hashes = [hash_row(row) for row in rows]
+        unknown = [field_id for field_id in rows[0].keys() if field_id not in dict(self.fields)]
+        if len(unknown) > 0:
+            self.add_fields([{'id': field_id, 'type': 'text'} for field_id in unknown])
+        changed_at = time.time()
+        with self.lock:
+            field_ids = [field_id for field_id, _ in self.fields]
+            keys = [str(row[self.key_field]) for row in rows]
+            stored = self.stored_hashes(keys)
+            values, changes = [], []
+            for row, key, row_hash in zip(rows, keys, hashes):
+                if stored.get(key) == row_hash:
+                    self.unchanged_count += 1
+                    continue
+                change = 'changed' if key in stored else 'new'
+                if change == 'new':
+                    self.new_count += 1
+                else:
+                    self.changed_count += 1
+                stored[key] = row_hash # In case the key shows up again in these rows
+                values.append([row.get(field_id) for field_id in field_ids] + [row_hash, changed_at])
+                changes.append((key, row.get(self.partition_field), changed_at, change))
+            columns = ', '.join('"{}"'.format(field_id) for field_id in field_ids)
+            self.connection.executemany('INSERT OR REPLACE INTO rows ({}, _row_hash, _changed_at) VALUES ({})'.format(columns, ','.join('?'*(len(field_ids) + 2))), values)
+            self.connection.executemany("INSERT INTO changes (key, partition_value, changed_at, change) VALUES (?, ?, ?, ?)", changes)
+            self.connection.commit()
+
+    def _records(self, cursor):
+        field_ids = [field_id for field_id, _ in self.fields]
+        boolean_columns = [k for k, (_, field_type) in enumerate(self.fields) if field_type == 'bool']
+        for values in cursor:
+            values = list(values)
+            for k in boolean_columns:
+                if values[k] is not None:
+                    values[k] = bool(values[k])
+            yield dict(zip(field_ids, values))
+
+    def rows(self, partition_value=None):
+        """Yield the stored rows (for one partition, like a year, or for all
+        of them), in key order, with the fields in their original order."""
+        columns = ', '.join('"{}"'.format(field_id) for field_id, _ in self.fields)
+        query = 'SELECT {} FROM rows'.format(columns)
+        parameters = []
+        if partition_value is not None:
+            query += ' WHERE "{}" = ?'.format(self.partition_field)
+            parameters.append(partition_value)
+        query += ' ORDER BY "{}"'.format(self.key_field)
+        return self._records(self.connection.execute(query, parameters))
+
+    def changes(self, partition_value=None, since=None):
+        """Return (key, change, changed_at) tuples for the rows that were
+        added or changed (in the given partition and since the given time)."""
+        query = "SELECT key, change, changed_at FROM changes WHERE 1 = 1"
+        parameters = []
+        if partition_value is not None:
+            query += " AND partition_value = ?"
+            parameters.append(partition_value)
+        if since is not None:
+            query += " AND changed_at >= ?"
+            parameters.append(since)
+        return self.connection.execute(query + " ORDER BY changed_at, key", parameters).fetchall()
+
+    def partition_counts(self):
+        """Return a dict mapping each partition value (e.g., year) to its number of rows."""
+        query = 'SELECT "{}", COUNT(*) FROM rows GROUP BY "{}"'.format(self.partition_field, self.partition_field)
+        return dict(self.connection.execute(query).fetchall())
+
+    def close(self):
+        self.connection.close()
+
+class MirrorDeltaIndex(object):
+    """Lets a PublishedDataMirror stand in for a
+    util.published_index.PublishedRowIndex (as the delta_index of a
+    DeltaLoader), so that delta loads with the mirror on compare the rows
+    to the mirror's hashes instead of keeping a second copy of them. Rows
+    recorded as published are stored in the mirror."""
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.path = mirror.path
+        self.skipped_count = 0
+        self.changed_count = 0
+        self.lock = threading.Lock() # Loaders may call this from worker threads.
+
+    def changed_rows(self, rows):
+        changed = self.mirror.changed_rows(rows)
+        with self.lock:
+            self.skipped_count += len(rows) - len(changed)
+        return changed
+
+    def record(self, rows_and_hashes):
+        self.mirror.update([row for row, _ in rows_and_hashes], [h for _, h in rows_and_hashes])
+        with self.lock:
+            self.changed_count += len(rows_and_hashes)
+
+    def close(self):
+        pass # The mirror is closed on its own.
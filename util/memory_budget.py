@@ -0,0 +1,79 @@
+import os, sys, gc, threading, resource
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB (or, where /proc
+    isn't available, the peak resident set size so far)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024*1024)
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024*1024) if sys.platform == 'darwin' else peak / 1024
+
+class ChunkBudget(object):
+    """Limits how many chunks can be somewhere between extraction and CKAN
+    at once. acquire() is called before extracting each chunk, and blocks
+    while max_chunks chunks are still outstanding; release() is called
+    (typically as a loader's on_success callback) once a chunk has been
+    loaded everywhere it's going. So if the loads fall behind, extraction
+    waits for them.
+
+    If the process's memory use goes over max_memory_mb, acquire() also
+    waits until every outstanding chunk has been loaded (so that only one
+    chunk at a time is in memory until the memory use drops again).
+
+    Before waiting (and then every second), acquire() calls on_wait (if
+    given), which should send off anything that the loaders are holding
+    back and raise any errors from loads running in other threads (which
+    would otherwise never release their chunks)."""
+    def __init__(self, max_chunks, max_memory_mb=None):
+        if max_chunks < 1:
+            raise ValueError("A ChunkBudget needs room for at least one chunk.")
+        self.max_chunks = max_chunks
+        self.max_memory_mb = max_memory_mb
+        self.condition = threading.Condition()
+        self.outstanding = 0
+        self.peak_outstanding = 0
+        self.peak_rss_mb = current_rss_mb()
+        self.throttled_count = 0
+        self.warned = False
+
+    def over_memory_ceiling(self):
+        rss = current_rss_mb()
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        return self.max_memory_mb is not None and rss > self.max_memory_mb
+
+    def acquire(self, on_wait=None):
+        throttled = False
+        while True:
+            with self.condition:
+                limit = self.max_chunks
+                if self.over_memory_ceiling():
+                    limit = 1
+                    if not throttled:
+                        throttled = True
+                        self.throttled_count += 1
+                    if self.outstanding == 0:
+                        gc.collect()
+                        if self.over_memory_ceiling() and not self.warned:
+                            print("Memory use ({:.0f} MB) is over the ceiling of {} MB even with no chunks outstanding.".format(current_rss_mb(), self.max_memory_mb))
+                            self.warned = True
+                if self.outstanding < limit:
+                    self.outstanding += 1
+                    self.peak_outstanding = max(self.peak_outstanding, self.outstanding)
+                    return
+            if on_wait is not None:
+                on_wait() # This is called without holding the lock, since it may wait on the loads.
+            with self.condition:
+                if self.outstanding >= limit:
+                    self.condition.wait(1.0)
+
+    def release(self):
+        with self.condition:
+            self.outstanding -= 1
+            self.condition.notify_all()
+
+    def describe(self):
+        return "At most {} of the allowed {} chunks were in memory at once; peak memory use was {:.0f} MB{}.".format(
+                self.peak_outstanding, self.max_chunks, self.peak_rss_mb,
+                " (extraction was held back {} times to stay under {} MB)".format(self.throttled_count, self.max_memory_mb) if self.throttled_count > 0 else "")
@@ -0,0 +1,145 @@
+import os, json, time, uuid, threading
+
+class PipelineMetrics(object):
+    """Collects per-chunk and per-upsert measurements for a run (for any
+    number of pipelines, which are told apart by name), appending each one
+    as a JSON line to metrics_log, and keeps running totals for the run
+    summary and for the (optional) Prometheus textfile.
+
+    Chunk events record how many rows were parsed and how long extracting,
+    transforming and waiting on the loader took. Upsert events record the
+    number of rows, the size of the request payload (or None, if the
+    loader that sent it doesn't know), the request latency and the number
+    of retries (or None, if that isn't known)."""
+    def __init__(self, description, metrics_log=None, prometheus_file=None):
+        self.description = description
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.metrics_log = metrics_log
+        self.prometheus_file = prometheus_file
+        self.lock = threading.Lock()
+        self.log_file = open(metrics_log, 'a') if metrics_log is not None else None
+        self.totals = {} # Keyed by pipeline name
+
+    def _totals_for(self, pipeline):
+        if pipeline not in self.totals:
+            self.totals[pipeline] = {'chunks': 0, 'rows_parsed': 0, 'extract_seconds': 0.0,
+                    'transform_seconds': 0.0, 'load_wait_seconds': 0.0,
+                    'upserts': 0, 'rows_upserted': 0, 'payload_bytes': 0, 'unmeasured_upserts': 0,
+                    'upsert_seconds': 0.0, 'max_upsert_seconds': 0.0, 'retries': 0, 'uncounted_retry_upserts': 0}
+        return self.totals[pipeline]
+
+    def _write(self, event):
+        event = dict(event, run_id=self.run_id, time=time.time())
+        if self.log_file is not None:
+            self.log_file.write(json.dumps(event) + "\n")
+            self.log_file.flush()
+
+    def record_chunk(self, pipeline, chunk_index, rows, extract_seconds=0.0, transform_seconds=0.0, load_wait_seconds=0.0):
+        with self.lock:
+            totals = self._totals_for(pipeline)
+            totals['chunks'] += 1
+            totals['rows_parsed'] += rows
+            totals['extract_seconds'] += extract_seconds
+            totals['transform_seconds'] += transform_seconds
+            totals['load_wait_seconds'] += load_wait_seconds
+            self._write({'event': 'chunk', 'pipeline': pipeline, 'chunk': chunk_index, 'rows': rows,
+                'extract_seconds': extract_seconds, 'transform_seconds': transform_seconds,
+                'load_wait_seconds': load_wait_seconds})
+
+    def record_upsert(self, pipeline, rows, payload_bytes, latency_seconds, retries=0):
+        with self.lock:
+            totals = self._totals_for(pipeline)
+            totals['upserts'] += 1
+            totals['rows_upserted'] += rows
+            if payload_bytes is None:
+                totals['unmeasured_upserts'] += 1
+            else:
+                totals['payload_bytes'] += payload_bytes
+            totals['upsert_seconds'] += latency_seconds
+            totals['max_upsert_seconds'] = max(totals['max_upsert_seconds'], latency_seconds)
+            if retries is None:
+                totals['uncounted_retry_upserts'] += 1
+            else:
+                totals['retries'] += retries
+            self._write({'event': 'upsert', 'pipeline': pipeline, 'rows': rows, 'payload_bytes': payload_bytes,
+                'latency_seconds': latency_seconds, 'retries': retries})
+
+    def summary(self):
+        with self.lock:
+            return {'run_id': self.run_id, 'description': self.description,
+                'duration_seconds': time.time() - self.started_at,
+                'pipelines': json.loads(json.dumps(self.totals))}
+
+    def summary_message(self):
+        """Describe the run in a few lines (suitable for util.notify.send_to_slack)."""
+        summary = self.summary()
+        lines = ["{} (run {}) took {:.1f} seconds.".format(self.description, self.run_id, summary['duration_seconds'])]
+        for pipeline, totals in sorted(summary['pipelines'].items()):
+            parts = []
+            if totals['chunks'] > 0:
+                parts.append("{} rows parsed in {} chunks (extract {:.1f} s, transform {:.1f} s, waiting on loads {:.1f} s)".format(
+                    totals['rows_parsed'], totals['chunks'], totals['extract_seconds'], totals['transform_seconds'], totals['load_wait_seconds']))
+            if totals['upserts'] > 0:
+                if totals['unmeasured_upserts'] == 0:
+                    size = "{:.1f} MB".format(totals['payload_bytes']/1e6)
+                elif totals['unmeasured_upserts'] == totals['upserts']:
+                    size = "size not measured"
+                else:
+                    size = "{:.1f} MB, not counting {} requests of unmeasured size".format(totals['payload_bytes']/1e6, totals['unmeasured_upserts'])
+                if totals['uncounted_retry_upserts'] == 0:
+                    retries = "{} retries".format(totals['retries'])
+                elif totals['uncounted_retry_upserts'] == totals['upserts']:
+                    retries = "retries not counted"
+                else:
+                    retries = "{} retries, not counting those of {} requests".format(totals['retries'], totals['uncounted_retry_upserts'])
+                parts.append("{} rows upserted in {} requests ({}, mean latency {:.2f} s, max {:.2f} s, {})".format(
+                    totals['rows_upserted'], totals['upserts'], size,
+                    totals['upsert_seconds']/totals['upserts'], totals['max_upsert_seconds'], retries))
+            lines.append("{}: {}".format(pipeline, '; '.join(parts)))
+        return "\n".join(lines)
+
+    def write_prometheus(self):
+        """Write the totals in the Prometheus text format (for node_exporter's textfile collector)."""
+        if self.prometheus_file is None:
+            return
+        summary = self.summary()
+        lines = []
+        def metric(name, help_text, metric_type, values):
+            lines.append("# HELP crash_etl_{} {}".format(name, help_text))
+            lines.append("# TYPE crash_etl_{} {}".format(name, metric_type))
+            for labels, value in values:
+                label_string = ','.join('{}="{}"'.format(k, v) for k, v in sorted(labels.items()))
+                lines.append("crash_etl_{}{{{}}} {}".format(name, label_string, value))
+        pipelines = sorted(summary['pipelines'].items())
+        metric('rows_parsed', 'Rows extracted and transformed in the last run.', 'gauge',
+                [({'pipeline': p}, t['rows_parsed']) for p, t in pipelines])
+        metric('stage_seconds', 'Seconds spent in each pipeline stage in the last run.', 'gauge',
+                [({'pipeline': p, 'stage': stage}, t['{}_seconds'.format(stage)]) for p, t in pipelines for stage in ['extract', 'transform', 'load_wait']])
+        metric('rows_upserted', 'Rows upserted in the last run.', 'gauge',
+                [({'pipeline': p}, t['rows_upserted']) for p, t in pipelines])
+        metric('upsert_requests', 'datastore_upsert requests in the last run.', 'gauge',
+                [({'pipeline': p}, t['upserts']) for p, t in pipelines])
+        metric('upsert_payload_bytes', 'Bytes of upsert payloads sent in the last run (where the size was measured).', 'gauge',
+                [({'pipeline': p}, t['payload_bytes']) for p, t in pipelines])
+        metric('upsert_latency_seconds', 'Total seconds spent waiting on upsert requests in the last run.', 'gauge',
+                [({'pipeline': p}, t['upsert_seconds']) for p, t in pipelines])
+        metric('upsert_retries', 'Upsert requests that had to be retried in the last run (where the retries were counted).', 'gauge',
+                [({'pipeline': p}, t['retries']) for p, t in pipelines])
+        metric('run_duration_seconds', 'How long the last run took.', 'gauge', [({}, summary['duration_seconds'])])
+        metric('last_run_timestamp_seconds', 'When the last run finished.', 'gauge', [({}, time.time())])
+        temporary_path = self.prometheus_file + '.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.prometheus_file)
+
+    def close(self):
+        """Log the run summary, write the Prometheus textfile and return the summary."""
+        summary = self.summary()
+        with self.lock:
+            self._write(dict(summary, event='summary'))
+        self.write_prometheus()
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+        return summary
@@ -1,27 +1,37 @@
-def send_to_slack(message):
-    """This script sends the given message to the #notifications channel on the WPRDC Slack thing.
-    Note that this shouldn't be heavily used (e.g., for reporting every error a script encounters)
-    as API limits are a consideration. This script IS suitable for running when a script-terminating
-    exception is caught, so that you can report the irregular termination of an ETL script."""
+import os, time, json, socket, threading, functools, collections
 
-    import os, json, requests
-    import socket
-    from parameters.remote_parameters import webhook_url
+@functools.lru_cache(maxsize=1)
+def host_address():
+    """Look up this computer's IP address (just once per process)."""
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return 'an unknown address'
 
-    IP_address = socket.gethostbyname(socket.gethostname())
+def slack_data_for(message):
     name_of_current_script = os.path.basename(__file__)
-
-    caboose = "(Sent from {} running on a computer at {}.)".format(name_of_current_script, IP_address)
-    # Set the webhook_url to the one provided by Slack when you create the webhook at https://my.slack.com/services/new/incoming-webhook/
-    #webhook_url = 'https://hooks.slack.com/services/SOMESTRING/OTHERSTRING' # Webhook to send messages to.
+    caboose = "(Sent from {} running on a computer at {}.)".format(name_of_current_script, host_address())
     slack_data = {'text': message + " " + caboose}
     slack_data['username'] = 'TACHYON'
     #To send this as a direct message instead, us the following line.
     #slack_data['channel"] = '@username'
     slack_data['icon_emoji'] = ':coffin:' #':tophat:' # ':satellite_antenna:'
+    return slack_data
+
+def send_to_slack(message):
+    """This script sends the given message to the #notifications channel on the WPRDC Slack thing.
+    Note that this shouldn't be heavily used (e.g., for reporting every error a script encounters)
+    as API limits are a consideration. This script IS suitable for running when a script-terminating
+    exception is caught, so that you can report the irregular termination of an ETL script.
+    (For messages sent from inside a running pipeline, use a BatchedNotifier.)"""
+
+    import requests
+    from parameters.remote_parameters import webhook_url
 
+    # Set the webhook_url to the one provided by Slack when you create the webhook at https://my.slack.com/services/new/incoming-webhook/
+    #webhook_url = 'https://hooks.slack.com/services/SOMESTRING/OTHERSTRING' # Webhook to send messages to.
     response = requests.post(
-        webhook_url, data=json.dumps(slack_data),
+        webhook_url, data=json.dumps(slack_data_for(message)),
         headers={'Content-Type': 'application/json'}
     )
     if response.status_code != 200:
@@ -30,6 +40,127 @@ def send_to_slack(message):
             % (response.status_code, response.text)
         )
 
-if __name__ == "__main__":
-    msg = "Time to make the donuts, fool!"
-    send_to_slack(msg)
+class SlackWebhookTransport(object):
+    """Sends a message to a Slack incoming webhook (by default, the one in
+    parameters.remote_parameters), the way send_to_slack does, but reusing
+    one connection and with a timeout. The webhook_url can point anywhere
+    that accepts the same JSON (like a local HTTP stand-in, for testing).
+    Raises a ValueError if the request doesn't get a 200 response."""
+    def __init__(self, webhook_url=None, timeout=10.0):
+        import requests
+        self.webhook_url = webhook_url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def __call__(self, message):
+        if self.webhook_url is None:
+            from parameters.remote_parameters import webhook_url
+            self.webhook_url = webhook_url
+        response = self.session.post(self.webhook_url, data=json.dumps(slack_data_for(message)),
+                headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ValueError('Request to Slack returned an error {}, the response is:\n{}'.format(response.status_code, response.text))
+
+class BatchedNotifier(object):
+    """Collects notifications and sends them from a background thread,
+    combined into digests, with at least min_interval seconds between
+    digests (the first one goes out right away). So notify() can be called
+    from inside a pipeline's loop (say, once per chunk) without waiting on
+    the network or running into API limits.
+
+    Messages are combined as they come in: repeated messages are shown
+    once (with a count), and a message given a key replaces any earlier
+    message with the same key (so a progress report keyed by 'progress'
+    only shows the latest progress). Up to max_pending distinct messages
+    are held for the next digest (any more are dropped and counted), and
+    at most max_messages_per_digest lines are sent per digest.
+
+    transport is any callable that sends a message (a string), like a
+    SlackWebhookTransport (the default) or a function that just prints.
+    Neither notify() nor close() ever raises: if the transport fails, the
+    digest is dropped and the error is printed (and counted).
+
+        notifier = BatchedNotifier(min_interval=60)
+        notifier.notify("Loaded chunk 12.", key='progress')
+        notifier.close() # Sends whatever is left."""
+    def __init__(self, transport=None, min_interval=60.0, max_messages_per_digest=20,
+            max_pending=1000, title=None):
+        self.transport = transport if transport is not None else SlackWebhookTransport()
+        self.min_interval = min_interval
+        self.max_messages_per_digest = max_messages_per_digest
+        self.max_pending = max_pending
+        self.title = title
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict() # (key or message) -> [message, count]
+        self.last_sent_at = None
+        self.sent_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+        self.wake_up = threading.Event()
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='BatchedNotifier', daemon=True)
+        self.thread.start()
+
+    def notify(self, message, key=None):
+        """Add a message to the next digest (without waiting)."""
+        try:
+            message = str(message)
+            entry_key = ('key', key) if key is not None else ('message', message)
+            with self.lock:
+                if entry_key in self.pending and key is None:
+                    self.pending[entry_key][1] += 1
+                elif entry_key in self.pending or len(self.pending) < self.max_pending:
+                    self.pending.pop(entry_key, None) # A keyed message moves to the end.
+                    self.pending[entry_key] = [message, 1]
+                else:
+                    self.dropped_count += 1
+            self.wake_up.set()
+        except Exception:
+            pass
+
+    def close(self, timeout=10.0):
+        """Send any remaining messages (ignoring min_interval) and stop the
+        background thread, waiting at most timeout seconds for it."""
+        self.closing.set()
+        self.wake_up.set()
+        self.thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _digest(self):
+        lines = [message if count == 1 else "{} (x{})".format(message, count) for message, count in self.pending.values()]
+        if len(lines) > self.max_messages_per_digest:
+            extra = len(lines) - self.max_messages_per_digest + 1
+            lines = lines[:self.max_messages_per_digest - 1] + ["... and {} more messages.".format(extra)]
+        if self.dropped_count > 0:
+            lines.append("({} more messages were dropped.)".format(self.dropped_count))
+            self.dropped_count = 0
+        if self.title is not None:
+            lines.insert(0, self.title)
+        return "\n".join(lines)
+
+    def _run(self):
+        while True:
+            self.wake_up.wait(0.25)
+            self.wake_up.clear()
+            closing = self.closing.is_set()
+            digest = None
+            with self.lock:
+                due = self.last_sent_at is None or time.time() >= self.last_sent_at + self.min_interval
+                if len(self.pending) > 0 and (due or closing):
+                    digest = self._digest()
+                    self.pending = collections.OrderedDict()
+                    self.last_sent_at = time.time()
+            if digest is not None:
+                try:
+                    self.transport(digest)
+                    self.sent_count += 1
+                except Exception as e:
+                    self.failed_count += 1
+                    print("Unable to send a notification digest: {}".format(e))
+            if closing:
+                return
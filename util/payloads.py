@@ -0,0 +1,91 @@
+import json, math, gzip, functools
+from json.encoder import encode_basestring
+
+try:
+    import orjson # Optional, but several times faster than the json module
+except ImportError:
+    orjson = None
+
+ENCODERS = ['auto', 'orjson', 'json']
+
+encode_compactly = json.JSONEncoder(separators=(',', ':'), check_circular=False).encode
+
+class UpsertPayload(object):
+    """The body of a datastore_upsert request, as a list of byte strings.
+    Since it has a length, requests streams the pieces (with a
+    Content-Length header) instead of joining them into one big string,
+    and since it can be iterated over more than once, it can be resent."""
+    def __init__(self, pieces, content_encoding=None):
+        self.pieces = pieces
+        self.content_encoding = content_encoding
+        self.length = sum(len(piece) for piece in pieces)
+
+    def __iter__(self):
+        return iter(self.pieces)
+
+    def __len__(self):
+        return self.length
+
+def encode_float(value):
+    return float.__repr__(value) if math.isfinite(value) else json.dumps(value)
+
+# The encoding function for each type of value that transformed rows contain
+VALUE_ENCODERS = {type(None): lambda value: 'null', bool: lambda value: 'true' if value else 'false',
+        int: int.__repr__, float: encode_float, str: encode_basestring}
+
+def encode_value(value):
+    try:
+        return VALUE_ENCODERS[type(value)](value)
+    except KeyError: # Anything unusual (like a subclass of int) gets the json module's treatment.
+        return json.dumps(value)
+
+@functools.lru_cache(maxsize=32)
+def record_template(keys):
+    """Return a %-format string for a JSON object with the given keys (with
+    the keys already encoded), to be filled in with the encoded values."""
+    parts = []
+    for k, key in enumerate(keys):
+        parts.append(('{' if k == 0 else ',') + json.dumps(key).replace('%', '%%') + ':%s')
+    return ''.join(parts) + '}' if len(keys) > 0 else '{}'
+
+def encode_records(entries, encoder):
+    """Encode (keys, record) pairs (where keys is None if the record is a
+    dict, or else a tuple of keys for the record's tuple of values) as the
+    comma-separated JSON objects that go in the records list."""
+    if encoder == 'orjson':
+        return orjson.dumps([record if keys is None else dict(zip(keys, record)) for keys, record in entries])[1:-1]
+    encoded = []
+    for keys, record in entries:
+        if keys is None:
+            encoded.append(encode_compactly(record))
+        else:
+            encoded.append(record_template(keys) % tuple(map(encode_value, record)))
+    return ','.join(encoded).encode('utf-8')
+
+def build_upsert_payload(resource_id, method, entries, encoder='auto', compress=False, rows_per_piece=250):
+    """Build the JSON body of a datastore_upsert request for the (keys,
+    record) pairs in entries (see encode_records), a few hundred records
+    at a time, so that only that many record dicts (at most) exist at
+    once.
+
+    encoder can be 'orjson' (if it's installed), 'json' (the standard
+    library, with the keys of RowBlock records encoded just once per
+    batch) or 'auto' (orjson if available). With compress=True, the body
+    is gzipped (and the payload's content_encoding is 'gzip')."""
+    if encoder not in ENCODERS:
+        raise ValueError("Unknown JSON encoder '{}' (use one of {}).".format(encoder, ', '.join(ENCODERS)))
+    if encoder == 'auto':
+        encoder = 'orjson' if orjson is not None else 'json'
+    elif encoder == 'orjson' and orjson is None:
+        raise ValueError("The orjson encoder was requested, but orjson isn't installed.")
+    head = encode_compactly({'resource_id': resource_id, 'method': method, 'force': True})[:-1] + ',"records":['
+    pieces = [head.encode('utf-8')]
+    for start in range(0, len(entries), rows_per_piece):
+        piece = encode_records(entries[start:start+rows_per_piece], encoder)
+        pieces.append(piece if start == 0 else b',' + piece)
+    pieces.append(b']}')
+    if compress:
+        # Level 1 gets most of the size reduction (the keys repeat in every
+        # record) for a fraction of the time of the default level.
+        return UpsertPayload([gzip.compress(b''.join(pieces), compresslevel=1)], content_encoding='gzip')
+    return UpsertPayload(pieces)
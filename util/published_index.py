@@ -0,0 +1,72 @@
+import sqlite3, hashlib, json, threading
+
+def hash_row(row):
+    """Return a hash of the contents of a row (a dict), which doesn't
+    depend on the order of its keys."""
+    encoded = json.dumps(row, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def stored_hashes(connection, query, keys, parameters=()):
+    """Look up the stored hashes of the given keys with a query that selects
+    (key, hash) pairs and has an "IN ({})" clause for the keys, returning a
+    dict mapping keys to hashes. The keys are looked up 500 at a time, to
+    stay under SQLite's limit on query parameters; any other parameters of
+    the query (which come before the keys) are given as parameters."""
+    hashes = {}
+    for k in range(0, len(keys), 500):
+        batch = keys[k:k+500]
+        hashes.update(connection.execute(query.format(','.join('?'*len(batch))), list(parameters) + batch).fetchall())
+    return hashes
+
+class PublishedRowIndex(object):
+    """A local SQLite index of content hashes of the rows that have been
+    published to a CKAN resource, keyed by the value of the key field
+    (e.g., CRASH_CRN).
+
+    This lets a load skip rows that are identical to what was last
+    published, so that re-running a whole year of data only upserts the
+    new or changed rows. The index only knows about what went through it,
+    so if the resource gets changed some other way, delete the index file
+    (or call forget()) to start over.
+
+    One index file can hold entries for several resources; the resource
+    argument (something like a resource ID) keeps them apart."""
+    def __init__(self, path, resource, key_field='CRASH_CRN'):
+        self.path = path
+        self.resource = resource
+        self.key_field = key_field
+        self.skipped_count = 0
+        self.changed_count = 0
+        self.lock = threading.Lock() # Loaders may call this from worker threads.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS published_rows (resource TEXT, key TEXT, hash TEXT, PRIMARY KEY (resource, key))")
+        self.connection.commit()
+
+    def changed_rows(self, rows):
+        """Return the rows whose keys are new or whose contents differ from
+        what was last recorded, along with their hashes (to be passed to
+        record() once the rows have been published)."""
+        hashes = [hash_row(row) for row in rows]
+        keys = [str(row[self.key_field]) for row in rows]
+        with self.lock:
+            published = stored_hashes(self.connection, "SELECT key, hash FROM published_rows WHERE resource = ? AND key IN ({})", keys, [self.resource])
+            changed = [(row, h) for row, key, h in zip(rows, keys, hashes) if published.get(key) != h]
+            self.skipped_count += len(rows) - len(changed)
+        return changed
+
+    def record(self, rows_and_hashes):
+        """Note that these rows (as returned by changed_rows) have been published."""
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO published_rows (resource, key, hash) VALUES (?, ?, ?)",
+                    [(self.resource, str(row[self.key_field]), h) for row, h in rows_and_hashes])
+            self.connection.commit()
+            self.changed_count += len(rows_and_hashes)
+
+    def forget(self):
+        """Drop everything recorded for this resource."""
+        with self.lock:
+            self.connection.execute("DELETE FROM published_rows WHERE resource = ?", (self.resource,))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
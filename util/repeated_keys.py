@@ -0,0 +1,104 @@
+from util.row_block import RowBlock
+
+def compact_key(key):
+    """Return the key as an integer if that loses nothing (to save memory
+    when storing lots of keys) and unchanged otherwise."""
+    try:
+        compact = int(key)
+    except (ValueError, TypeError):
+        return key
+    return compact if str(compact) == key else key # Keep keys like '012' distinct from '12'.
+
+class RepeatedKeyCollapser(object):
+    """Drops all but the last occurrence of each key in a stream of rows, so
+    that a key (like a CRASH_CRN) that shows up several times in a file is
+    only written once, with its final version (which is the version that
+    would have won anyway, had every occurrence been upserted in order).
+
+    This takes two passes. First, note_keys() is given every key in the
+    stream, in order (possibly a chunk at a time), to find the repeated
+    keys and the position of the last occurrence of each. Then collapse()
+    filters each chunk of rows, given the position of the chunk's first
+    row. Only the repeated keys are kept after the first pass, and keys
+    are stored as integers where that loses nothing, so even the first pass over a
+    year of crash data only takes a few MB. Null keys are never collapsed.
+
+        collapser = RepeatedKeyCollapser('CRASH_CRN')
+        collapser.note_keys(keys)
+        collapser.finish_noting()
+        rows = collapser.collapse(rows, first_position)
+
+    When the stream is followed by others that get loaded after it (like
+    2010-crashes.csv, followed by 2010-a-few-more-crashes.csv), calling
+    drop_keys_of(later_collapser) between note_keys() and finish_noting()
+    also drops the rows whose keys the later stream repeats, since its
+    versions would win anyway."""
+    EXAMPLE_COUNT = 5
+
+    def __init__(self, key_field):
+        self.key_field = key_field
+        self.seen_keys = set()
+        self.last_positions = {} # Repeated keys and the positions of their last occurrences
+        self.occurrence_count = 0 # The number of occurrences of the repeated keys
+        self.superseded_count = 0 # The number of keys that a later stream repeats
+        self.position = 0
+        self.collapsed_count = 0
+
+    compact_key = staticmethod(compact_key)
+
+    def note_keys(self, keys):
+        for key in keys:
+            if key is not None:
+                key = self.compact_key(key)
+                if key in self.seen_keys:
+                    if key not in self.last_positions:
+                        self.occurrence_count += 1 # for the first occurrence
+                    self.occurrence_count += 1
+                    self.last_positions[key] = self.position
+                else:
+                    self.seen_keys.add(key)
+            self.position += 1
+
+    def drop_keys_of(self, later_collapser):
+        """Drop every occurrence of the keys that later_collapser (which
+        must not have finished noting) has seen, by giving them a last
+        position that no row has."""
+        for key in self.seen_keys & later_collapser.seen_keys:
+            if key not in self.last_positions:
+                self.occurrence_count += 1 # for its only occurrence in this stream
+            elif self.last_positions[key] < 0:
+                continue # (A key that an even later stream repeats as well)
+            self.superseded_count += 1
+            self.last_positions[key] = -1
+
+    def finish_noting(self):
+        """Let go of the keys that only occurred once."""
+        self.seen_keys = set()
+
+    def collapse(self, rows, first_position):
+        """Return the rows (a list of dicts or a RowBlock, starting at the
+        given position in the stream) without the ones whose keys show up
+        again later on."""
+        if len(self.last_positions) == 0:
+            return rows
+        last_positions, compact_key = self.last_positions, self.compact_key
+        if isinstance(rows, RowBlock):
+            k = rows.keys.index(self.key_field)
+            kept = [values for position, values in enumerate(rows.values, first_position)
+                    if values[k] is None or last_positions.get(compact_key(values[k]), position) == position]
+            collapsed_rows = RowBlock(rows.keys, kept)
+        else:
+            collapsed_rows = [row for position, row in enumerate(rows, first_position)
+                    if row[self.key_field] is None or last_positions.get(compact_key(row[self.key_field]), position) == position]
+        self.collapsed_count += len(rows) - len(collapsed_rows)
+        return collapsed_rows
+
+    def describe(self):
+        if len(self.last_positions) == 0:
+            return "No {} value occurs more than once.".format(self.key_field)
+        examples = [str(key) for key in list(self.last_positions.keys())[:self.EXAMPLE_COUNT]]
+        superseded = ""
+        if self.superseded_count > 0:
+            superseded = " ({} of them again in a later file)".format(self.superseded_count)
+        return "{} {} values occur more than once{} ({} rows in all, e.g., {}); {} earlier versions were dropped so that only the last version of each gets loaded.".format(
+                len(self.last_positions), self.key_field, superseded, self.occurrence_count, ', '.join(examples), self.collapsed_count)
@@ -0,0 +1,68 @@
+import threading
+
+import requests
+
+_recording = threading.local()
+_install_lock = threading.Lock()
+_original_send = None
+
+def body_size(request):
+    """Return the size in bytes of a requests.PreparedRequest's body (from
+    its Content-Length header, if it has one), or None if it isn't known
+    (as for a body streamed from a generator)."""
+    if 'Content-Length' in request.headers:
+        return int(request.headers['Content-Length'])
+    if request.body is None:
+        return 0
+    if isinstance(request.body, bytes):
+        return len(request.body)
+    if isinstance(request.body, str):
+        return len(request.body.encode('utf-8'))
+    return None
+
+def _send(session, request, **kwargs):
+    sizes = getattr(_recording, 'sizes', None)
+    if sizes is not None:
+        sizes.append(body_size(request))
+    return _original_send(session, request, **kwargs)
+
+def install():
+    """Wrap requests.Session.send (once) so that it notes the size of each
+    request sent by a thread that has a SentRequestSizes active. (A hook on
+    a session of our own wouldn't do, since requests.post makes a new
+    Session for every call.)"""
+    global _original_send
+    with _install_lock:
+        if _original_send is None:
+            _original_send = requests.Session.send
+            requests.Session.send = _send
+
+class SentRequestSizes(object):
+    """Records the body sizes of the requests that the current thread sends
+    through requests (from any Session, including the ones that
+    requests.post makes) while it's active. This is how the size of the
+    upserts that pl.CKANDatastoreLoader builds and sends itself gets
+    measured:
+
+        with SentRequestSizes() as sent:
+            loader.load(data)
+        payload_bytes = sent.total()
+
+    Other threads' requests aren't recorded, so loaders running in
+    parallel each get their own sizes."""
+    def __enter__(self):
+        install()
+        self.sizes = []
+        self.outer_sizes = getattr(_recording, 'sizes', None)
+        _recording.sizes = self.sizes
+        return self
+
+    def __exit__(self, *exc_info):
+        _recording.sizes = self.outer_sizes
+
+    def total(self):
+        """Return the total size of the requests sent, or None if there
+        weren't any or the size of any of them isn't known."""
+        if len(self.sizes) == 0 or None in self.sizes:
+            return None
+        return sum(self.sizes)
@@ -0,0 +1,52 @@
+class RowBlock(object):
+    """A chunk of rows that all have the same keys (like the transformed
+    rows of a crash file), stored as one tuple of keys and a list of value
+    tuples, rather than as a dict per row (which, with ~190 fields, costs
+    several times as much memory).
+
+    A RowBlock can be used wherever a list of row dicts is expected:
+    len(), indexing and iteration give dicts (made on the fly), and slicing
+    gives another RowBlock. Code that knows about RowBlocks (like
+    DatastoreUpserter) can use keys and values directly, to avoid making
+    the dicts at all."""
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys, values):
+        self.keys = tuple(keys)
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RowBlock(self.keys, self.values[index])
+        return dict(zip(self.keys, self.values[index]))
+
+    def __iter__(self):
+        keys = self.keys
+        for values in self.values:
+            yield dict(zip(keys, values))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def records(self):
+        """Return the rows as a list of dicts."""
+        return list(self)
+
+    def extended(self, other):
+        """Return a block with the rows of this block followed by those of
+        other (which can be a RowBlock or a list of row dicts)."""
+        if isinstance(other, RowBlock) and other.keys == self.keys:
+            return RowBlock(self.keys, self.values + other.values)
+        return self.records() + list(other)
+
+    def to_json_object(self):
+        """Return something that json.dumps can encode (and from_json_object
+        can turn back into a RowBlock)."""
+        return {'keys': list(self.keys), 'values': self.values}
+
+    @classmethod
+    def from_json_object(cls, obj):
+        return cls(obj['keys'], obj['values'])